@@ -0,0 +1,84 @@
+"""Compare the search engines on the same corpus, checking that they find the same results.
+
+Usage: python benchmarks/bench_engines.py [--folder DIR | --files N] [--term T ...] [--repeat N]
+
+Without --folder a synthetic corpus of --files C files is generated in a temporary git
+repository, so the git grep engine has something to search too.
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from fastfind_core.engines import PythonSearchEngine, make_search_engines, run_search
+from fastfind_core.index import FastFindIndexRegistry
+from fastfind_core.settings import FastFindSettings
+from synthetic import make_corpus
+
+
+#------------------------------------------------------------------------------
+def time_engine(engine, folder: str, term: str, settings: FastFindSettings, repeat: int) -> tuple:
+	best = None
+	for _ in range(repeat):
+		start = time.time()
+		results, returncode = run_search(engine, [folder], term, True, settings)
+		elapsed = time.time() - start
+		best = elapsed if best is None else min(best, elapsed)
+	rows = sorted((os.path.normpath(result.filename), result.line_number, result.start_char_index, result.match_length)
+		for result in results)
+	return best, rows, returncode
+
+
+#------------------------------------------------------------------------------
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--folder")
+	parser.add_argument("--files", type=int, default=4000)
+	parser.add_argument("--term", action="append", default=[])
+	parser.add_argument("--type", action="append", default=[], help="rg file type to search")
+	parser.add_argument("--repeat", type=int, default=3)
+	args = parser.parse_args()
+
+	terms = args.term or ["rare_symbol_xyz", "handler_7", "render_1[0-9] alpha", "zzzqqq"]
+	with tempfile.TemporaryDirectory() as temp_dir:
+		folder = args.folder
+		file_types = args.type
+		if folder is None:
+			folder = os.path.join(temp_dir, "corpus")
+			make_corpus(folder, args.files)
+			file_types = file_types or ["c"]
+		folder = os.path.realpath(folder)
+		settings = FastFindSettings({"file_type_pattern": file_types, "max_search_processes": 0})
+
+		engines = make_search_engines(FastFindIndexRegistry(os.path.join(temp_dir, "indexes")))
+		# compare scanning on processes with the threads the plugin has to use
+		engines["python_threads"] = PythonSearchEngine(use_processes=False)
+		# build the index up front, its search times shouldn't include that
+		start = time.time()
+		run_search(engines["index"], [folder], "warmup", True, settings)
+		print("index built in {0:.2f}s".format(time.time() - start))
+
+		for term in terms:
+			print("{0!r}:".format(term))
+			reference = None
+			for name, engine in engines.items():
+				try:
+					elapsed, rows, returncode = time_engine(engine, folder, term, settings, args.repeat)
+				except (OSError, ValueError) as e:
+					print("  {0:<15} failed: {1}".format(name, e))
+					continue
+				if reference is None:
+					reference = rows
+				agrees = "same results" if rows == reference else "DIFFERENT RESULTS"
+				print("  {0:<15} {1:8.3f}s {2:8d} results  exit {3}  {4}".format(name, elapsed, len(rows), returncode, agrees))
+
+		for engine in engines.values():
+			if isinstance(engine, PythonSearchEngine):
+				engine.shutdown()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,84 @@
+"""Compare searching through the trigram index with plain rg on a directory tree.
+
+Usage: python benchmarks/bench_index.py FOLDER TERM [TERM ...] [--type c] [--repeat N] [--rg rg]
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from fastfind_core.index import FastFindTrigramIndex
+from fastfind_core.shards import make_file_shards
+
+
+#------------------------------------------------------------------------------
+def run_rg(argv: list) -> int:
+	"""Run an rg search and return the number of output lines, like the plugin reads them."""
+	proc = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+	output, _ = proc.communicate()
+	return output.count(b"\n")
+
+
+def time_search(search, repeat: int) -> tuple:
+	best = None
+	for _ in range(repeat):
+		start = time.time()
+		result = search()
+		elapsed = time.time() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best, result
+
+
+#------------------------------------------------------------------------------
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("folder")
+	parser.add_argument("terms", nargs="+")
+	parser.add_argument("--type", action="append", default=[], help="rg file type to index and search")
+	parser.add_argument("--repeat", type=int, default=3)
+	parser.add_argument("--rg", default="rg")
+	args = parser.parse_args()
+
+	type_args = ["-t" + file_type for file_type in args.type]
+	search_argv = [args.rg, "--json", "--column"] + type_args
+	folder = os.path.realpath(args.folder)
+
+	with tempfile.TemporaryDirectory() as index_dir:
+		index = FastFindTrigramIndex(folder, os.path.join(index_dir, "bench.trigrams"), [args.rg, "--files"] + type_args)
+		index.build()
+		stats = index.stats()
+		print("built index of {0} files in {1:.2f}s: {2} trigrams, {3} postings, {4:.1f} MB on disk".format(
+			stats["files"], stats["build_time"], stats["trigrams"], stats["postings"], stats["bytes"] / (1024.0 * 1024.0)))
+
+		start = time.time()
+		index.load()
+		print("loaded index in {0:.3f}s".format(time.time() - start))
+
+		start = time.time()
+		changed = index.rescan()
+		print("rescanned tree in {0:.3f}s, {1} files changed".format(time.time() - start, changed))
+
+		for term in args.terms:
+			rg_time, rg_lines = time_search(lambda: run_rg(search_argv + ["-e", term, "--", folder]), args.repeat)
+			lookup_time, candidates = time_search(lambda: index.candidates(term, True), args.repeat)
+			if candidates is None:
+				print("{0!r}: index can't narrow the search, rg {1:.3f}s".format(term, rg_time))
+				continue
+
+			def search_candidates():
+				lines = 0
+				for shard in make_file_shards(folder, candidates):
+					lines += run_rg(search_argv + ["-e", term, "--"] + shard.files)
+				return lines
+			verify_time, _ = time_search(search_candidates, args.repeat)
+			print("{0!r}: rg {1:.3f}s, index {2:.4f}s lookup + {3:.3f}s rg on {4} of {5} files = {6:.2f}x".format(
+				term, rg_time, lookup_time, verify_time, len(candidates), stats["files"],
+				rg_time / max(lookup_time + verify_time, 1e-6)))
+
+
+if __name__ == "__main__":
+	main()
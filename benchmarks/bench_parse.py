@@ -0,0 +1,70 @@
+"""Compare the rg --json parsers on synthetic search output.
+
+Usage: python benchmarks/bench_parse.py [--files N] [--matches N] [--context N] [--repeat N]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from fastfind_core.results import FastFindResult, parse_search_results_from_json
+from synthetic import make_rg_output
+
+
+#------------------------------------------------------------------------------
+def legacy_parse_search_results_from_json(content: bytes) -> list:
+	"""The parser FastFind used before the fast path: decode everything, keep submatches[0]."""
+	content = str(content, encoding="utf8")
+	results = []
+	for line in content.split("\n"):
+		line = line.strip()
+		if line == "":
+			continue
+		json_result = json.loads(line)
+		if json_result['type'] == 'match':
+			results.append(FastFindResult.from_json(json_result['data']))
+	return results
+
+
+#------------------------------------------------------------------------------
+def time_parser(parser, content: bytes, repeat: int) -> tuple:
+	best = None
+	results = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		results = parser(content)
+		elapsed = time.perf_counter() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best, len(results)
+
+
+#------------------------------------------------------------------------------
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--files", type=int, default=2000)
+	parser.add_argument("--matches", type=int, default=25)
+	parser.add_argument("--context", type=int, default=2)
+	parser.add_argument("--repeat", type=int, default=5)
+	args = parser.parse_args()
+
+	content = make_rg_output(args.files, args.matches, args.context)
+	num_records = content.count(b"\n")
+	print("{0} records, {1:.1f} MB of rg output".format(num_records, len(content) / (1024.0 * 1024.0)))
+
+	legacy_time, legacy_count = time_parser(legacy_parse_search_results_from_json, content, args.repeat)
+	fast_time, fast_count = time_parser(parse_search_results_from_json, content, args.repeat)
+	print("legacy:    {0:8.3f}s {1:12.0f} records/s  {2} results".format(legacy_time, num_records / legacy_time, legacy_count))
+	print("fast path: {0:8.3f}s {1:12.0f} records/s  {2} results (one per submatch)".format(fast_time, num_records / fast_time, fast_count))
+	print("speedup:   {0:.2f}x".format(legacy_time / fast_time))
+
+	# the fast path must also cope with rg's base64 form for paths that aren't valid UTF-8
+	mixed = make_rg_output(100, 5, args.context, non_utf8_every=10)
+	parse_search_results_from_json(mixed)
+
+
+if __name__ == "__main__":
+	main()
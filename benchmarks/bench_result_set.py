@@ -0,0 +1,89 @@
+"""Memory and pickle cost of FastFindResultSet against a list of per-hit result objects.
+
+Usage: python benchmarks/bench_result_set.py [--hits N] [--files N]
+"""
+import os
+import sys
+import time
+import pickle
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from fastfind_core.results import FastFindResultSet
+
+
+#------------------------------------------------------------------------------
+class LegacyFastFindResult:
+	"""FastFindResult as it was before the result set: a plain class with a __dict__."""
+	def __init__(self, filename: str, line_number: int, startpos: int, matchlen: int):
+		self.filename = filename
+		self.line_number = line_number
+		self.start_char_index = startpos
+		self.match_length = matchlen
+
+
+#------------------------------------------------------------------------------
+def make_hits(num_hits: int, num_files: int):
+	for index in range(num_hits):
+		# every parsed record used to carry its own copy of the path string
+		filename = "".join(["/home/user/src/project/module_", str(index % num_files % 97), "/file_", str(index % num_files), ".cpp"])
+		yield filename, index % 5000 + 1, index % 80, 11
+
+
+#------------------------------------------------------------------------------
+def measure(build, num_hits: int, num_files: int) -> dict:
+	tracemalloc.start()
+	start = time.perf_counter()
+	results = build(make_hits(num_hits, num_files))
+	build_time = time.perf_counter() - start
+	memory, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	start = time.perf_counter()
+	data = pickle.dumps(results, pickle.HIGHEST_PROTOCOL)
+	dump_time = time.perf_counter() - start
+	start = time.perf_counter()
+	pickle.loads(data)
+	load_time = time.perf_counter() - start
+	return {"memory": memory, "build": build_time, "pickle_size": len(data), "dump": dump_time, "load": load_time}
+
+
+#------------------------------------------------------------------------------
+def build_list(hits) -> list:
+	return [LegacyFastFindResult(*hit) for hit in hits]
+
+
+#------------------------------------------------------------------------------
+def build_result_set(hits) -> FastFindResultSet:
+	results = FastFindResultSet()
+	for hit in hits:
+		results.append(*hit)
+	return results
+
+
+#------------------------------------------------------------------------------
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--hits", type=int, default=200000)
+	parser.add_argument("--files", type=int, default=5000)
+	args = parser.parse_args()
+
+	print("{0} hits in {1} files".format(args.hits, args.files))
+	print("{0:<22}{1:>12}{2:>14}{3:>10}{4:>10}{5:>10}".format("", "memory MB", "pickle MB", "build s", "dump s", "load s"))
+	baseline = None
+	for name, build in (("list of results", build_list), ("FastFindResultSet", build_result_set)):
+		stats = measure(build, args.hits, args.files)
+		print("{0:<22}{1:>12.2f}{2:>14.2f}{3:>10.3f}{4:>10.3f}{5:>10.3f}".format(name,
+			stats["memory"] / (1024.0 * 1024.0),
+			stats["pickle_size"] / (1024.0 * 1024.0),
+			stats["build"], stats["dump"], stats["load"]))
+		if baseline is None:
+			baseline = stats
+	print("memory: {0:.1f}x smaller, pickle: {1:.1f}x smaller".format(
+		baseline["memory"] / float(stats["memory"]), baseline["pickle_size"] / float(stats["pickle_size"])))
+
+
+if __name__ == "__main__":
+	main()
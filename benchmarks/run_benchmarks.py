@@ -0,0 +1,203 @@
+"""Headless benchmark suite for FastFind, writing machine-readable results to compare commits.
+
+Usage: python benchmarks/run_benchmarks.py [--files N] [--matches N] [--context N] [--repeat N]
+	[--only NAME ...] [--output FILE] [--compare BASELINE] [--threshold FRACTION]
+
+Runs outside Sublime Text, the sublime and sublime_plugin modules come from benchmarks/stubs.
+The input is synthetic rg --json output with context lines, two submatches per match and
+some non-UTF-8 paths. Each benchmark reports its best time over --repeat runs. The results
+go to --output as JSON; --compare reads an earlier output file and exits with 1 when a
+benchmark got slower by more than --threshold.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib
+import importlib.util
+import subprocess
+import contextlib
+
+BENCHMARKS_DIR = os.path.dirname(os.path.realpath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "stubs"))
+
+from synthetic import make_rg_output
+
+
+#------------------------------------------------------------------------------
+def import_plugin() -> tuple:
+	"""Import fastfind.py the way Sublime does, as a module of the package "FastFind", and its results module."""
+	spec = importlib.util.spec_from_file_location("FastFind", os.path.join(PACKAGE_DIR, "__init__.py"),
+		submodule_search_locations=[PACKAGE_DIR])
+	package = importlib.util.module_from_spec(spec)
+	sys.modules["FastFind"] = package
+	spec.loader.exec_module(package)
+	return importlib.import_module("FastFind.fastfind"), importlib.import_module("FastFind.fastfind_core.results")
+
+
+def git_commit() -> str:
+	try:
+		output = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PACKAGE_DIR, stderr=subprocess.DEVNULL)
+	except (OSError, subprocess.CalledProcessError):
+		return None
+	return output.decode("ascii").strip()
+
+
+#------------------------------------------------------------------------------
+class Benchmarks:
+	"""Every benchmark is a method bench_<name> doing one timed run, returning (seconds, items).
+
+	items is what the run went through (records, results, searches), for a per-second rate.
+	"""
+	def __init__(self, plugin, results_module, content: bytes, searches: int):
+		self.plugin = plugin
+		self.results_module = results_module
+		self.content = content
+		self.searches = searches
+		self.results = results_module.parse_search_results_from_json(content)
+		self.match_data = [json.loads(line)["data"] for line in content.split(b"\n")
+			if line.startswith(b'{"type":"match"')]
+
+	def bench_parse(self) -> tuple:
+		start = time.perf_counter()
+		self.results_module.parse_search_results_from_json(self.content)
+		return time.perf_counter() - start, self.content.count(b"\n")
+
+	def bench_from_json(self) -> tuple:
+		from_json = self.results_module.FastFindResult.from_json
+		start = time.perf_counter()
+		for match_data in self.match_data:
+			from_json(match_data)
+		return time.perf_counter() - start, len(self.match_data)
+
+	def bench_history_save(self) -> tuple:
+		filename = self.plugin.get_history_save_location()
+		if os.path.exists(filename):
+			os.remove(filename)
+		start = time.perf_counter()
+		history = self.plugin.load_history_from_file()
+		for index in range(self.searches):
+			history["term_{0}".format(index)] = self.results
+		return time.perf_counter() - start, self.searches
+
+	def bench_history_load(self) -> tuple:
+		# reads what the last history_save run wrote
+		start = time.perf_counter()
+		history = self.plugin.load_history_from_file()
+		count = 0
+		for search_term in history.keys():
+			count += len(history[search_term])
+		elapsed = time.perf_counter() - start
+		if count != self.searches * len(self.results):
+			raise AssertionError("history round trip lost results: {0} of {1}".format(count, self.searches * len(self.results)))
+		return elapsed, self.searches
+
+	def bench_panel(self) -> tuple:
+		sublime = sys.modules["sublime"]
+		panel = self.plugin.FastFindResultsPanel(sublime.active_window().active_view())
+		start = time.perf_counter()
+		panel.show("find_symbol", self.results)
+		return time.perf_counter() - start, len(self.results)
+
+	def names(self) -> list:
+		return [name[len("bench_"):] for name in dir(self) if name.startswith("bench_")]
+
+	def run(self, name: str, repeat: int) -> dict:
+		benchmark = getattr(self, "bench_" + name)
+		times = []
+		items = 0
+		for _ in range(repeat):
+			# the plugin logs to stdout as it goes, which would only add noise here
+			with contextlib.redirect_stdout(io.StringIO()):
+				elapsed, items = benchmark()
+			times.append(elapsed)
+		best = min(times)
+		return {
+			"seconds": best,
+			"mean_seconds": sum(times) / len(times),
+			"items": items,
+			"items_per_second": items / best if best > 0 else None,
+		}
+
+
+#------------------------------------------------------------------------------
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+	"""Print how every benchmark changed since baseline, returning False on a regression."""
+	ok = True
+	print("\ncompared with {0}:".format(baseline["meta"].get("commit") or "baseline"))
+	for name, result in current["benchmarks"].items():
+		previous = baseline["benchmarks"].get(name)
+		if previous is None:
+			continue
+		ratio = result["seconds"] / previous["seconds"] if previous["seconds"] > 0 else 1.0
+		regressed = ratio > 1.0 + threshold
+		ok = ok and not regressed
+		print("  {0:<15} {1:9.4f}s -> {2:9.4f}s  {3:6.2f}x{4}".format(name, previous["seconds"], result["seconds"],
+			ratio, "  REGRESSION" if regressed else ""))
+	return ok
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--files", type=int, default=2000, help="files with matches in the rg output")
+	parser.add_argument("--matches", type=int, default=25, help="matching lines per file")
+	parser.add_argument("--context", type=int, default=2, help="context lines around each match")
+	parser.add_argument("--non-utf8-every", type=int, default=50, help="every Nth path is not valid UTF-8")
+	parser.add_argument("--searches", type=int, default=10, help="searches saved to the history")
+	parser.add_argument("--repeat", type=int, default=5)
+	parser.add_argument("--only", action="append", default=[], help="run only this benchmark")
+	parser.add_argument("--output", default="bench_results.json")
+	parser.add_argument("--compare", help="results of an earlier run")
+	parser.add_argument("--threshold", type=float, default=0.1, help="slowdown reported as a regression")
+	args = parser.parse_args()
+
+	plugin, results_module = import_plugin()
+	# the history keeps every saved search, however large the synthetic results are
+	sys.modules["sublime"].load_settings("fastfind.sublime-settings").set("FastFindSublime_history_max_size_mb", 4096)
+	with contextlib.redirect_stdout(io.StringIO()):
+		plugin.plugin_loaded()
+	content = make_rg_output(args.files, args.matches, args.context, args.non_utf8_every)
+	benchmarks = Benchmarks(plugin, results_module, content, args.searches)
+	print("{0} records, {1:.1f} MB of rg output, {2} results".format(content.count(b"\n"),
+		len(content) / (1024.0 * 1024.0), len(benchmarks.results)))
+
+	names = benchmarks.names()
+	# history_load reads what history_save wrote
+	names.sort(key=lambda name: (name == "history_load", name))
+	if len(args.only) > 0:
+		names = [name for name in names if name in args.only]
+
+	report = {
+		"meta": {
+			"commit": git_commit(),
+			"time": time.time(),
+			"python": platform.python_version(),
+			"platform": platform.platform(),
+			"args": vars(args),
+		},
+		"benchmarks": {},
+	}
+	for name in names:
+		result = benchmarks.run(name, args.repeat)
+		report["benchmarks"][name] = result
+		print("  {0:<15} {1:9.4f}s {2:14.0f} items/s".format(name, result["seconds"], result["items_per_second"] or 0))
+
+	with contextlib.redirect_stdout(io.StringIO()):
+		plugin.plugin_unloaded()
+	with open(args.output, "w") as output_file:
+		json.dump(report, output_file, indent=1)
+	print("results written to " + args.output)
+
+	if args.compare is not None:
+		with open(args.compare) as baseline_file:
+			baseline = json.load(baseline_file)
+		if not compare(baseline, report, args.threshold):
+			sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
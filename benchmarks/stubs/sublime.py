@@ -0,0 +1,228 @@
+"""A minimal stand-in for Sublime Text's sublime module, enough to run fastfind.py headless.
+
+Only what the benchmarks exercise is implemented. set_timeout runs its callback straight away,
+windows record the quick panels they are asked to show instead of drawing them and settings
+come from the package's own fastfind.sublime-settings.
+"""
+import os
+import re
+import sys
+import json
+import tempfile
+
+ENCODED_POSITION = 1
+KEEP_OPEN_ON_FOCUS_LOST = 2
+TRANSIENT = 4
+MONOSPACE_FONT = 1
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+_data_dir = tempfile.mkdtemp(prefix="fastfind_stub_")
+
+#------------------------------------------------------------------------------
+def set_timeout(callback, delay: int = 0) -> None:
+	callback()
+
+set_timeout_async = set_timeout
+
+
+def status_message(message: str) -> None:
+	pass
+
+
+def error_message(message: str) -> None:
+	print("[sublime stub] error: " + message)
+
+
+def platform() -> str:
+	return {"win32": "windows", "darwin": "osx"}.get(sys.platform, "linux")
+
+
+def cache_path() -> str:
+	return os.path.join(_data_dir, "Cache")
+
+
+def packages_path() -> str:
+	return os.path.join(_data_dir, "Packages")
+
+
+#------------------------------------------------------------------------------
+class Settings:
+	def __init__(self, values: dict):
+		self._values = dict(values)
+
+	def has(self, key: str) -> bool:
+		return key in self._values
+
+	def get(self, key: str, default=None):
+		return self._values.get(key, default)
+
+	def set(self, key: str, value) -> None:
+		self._values[key] = value
+
+	def erase(self, key: str) -> None:
+		self._values.pop(key, None)
+
+	def add_on_change(self, tag: str, callback) -> None:
+		pass
+
+	def clear_on_change(self, tag: str) -> None:
+		pass
+
+
+_settings = {}
+
+def load_settings(name: str) -> Settings:
+	"""The named settings file from the package folder, without comments or trailing commas."""
+	if name not in _settings:
+		values = {}
+		filename = os.path.join(PACKAGE_DIR, name)
+		if os.path.exists(filename):
+			with open(filename, encoding="utf8") as settings_file:
+				text = settings_file.read()
+			text = re.sub(r"^\s*//.*$", "", text, flags=re.MULTILINE)
+			text = re.sub(r",(\s*[\]}])", r"\1", text)
+			values = json.loads(text)
+		_settings[name] = Settings(values)
+	return _settings[name]
+
+
+#------------------------------------------------------------------------------
+class Region:
+	def __init__(self, a: int, b: int = None):
+		self.a = a
+		self.b = a if b is None else b
+
+
+class Selection(list):
+	def clear(self) -> None:
+		del self[:]
+
+	def add(self, region: Region) -> None:
+		self.append(region)
+
+
+class QuickPanelItem:
+	def __init__(self, trigger: str, details="", annotation: str = "", kind=None):
+		self.trigger = trigger
+		self.details = details
+		self.annotation = annotation
+		self.kind = kind
+
+
+class Html(str):
+	pass
+
+
+#------------------------------------------------------------------------------
+class View:
+	_next_id = 1
+
+	def __init__(self, window=None, filename: str = None):
+		self._id = View._next_id
+		View._next_id += 1
+		self._window = window
+		self._filename = filename
+		self._selection = Selection([Region(0)])
+		self._settings = Settings({})
+		self._status = {}
+		self.name = ""
+		self.text = ""
+
+	def id(self) -> int:
+		return self._id
+
+	def window(self):
+		return self._window
+
+	def file_name(self) -> str:
+		return self._filename
+
+	def is_valid(self) -> bool:
+		return True
+
+	def is_loading(self) -> bool:
+		return False
+
+	def settings(self) -> Settings:
+		return self._settings
+
+	def sel(self) -> Selection:
+		return self._selection
+
+	def viewport_position(self) -> tuple:
+		return (0.0, 0.0)
+
+	def set_viewport_position(self, position: tuple, animate: bool = True) -> None:
+		pass
+
+	def text_point(self, row: int, col: int) -> int:
+		return row * 100 + col
+
+	def show_at_center(self, location) -> None:
+		pass
+
+	def set_status(self, key: str, value: str) -> None:
+		self._status[key] = value
+
+	def erase_status(self, key: str) -> None:
+		self._status.pop(key, None)
+
+	def set_name(self, name: str) -> None:
+		self.name = name
+
+	def set_scratch(self, scratch: bool) -> None:
+		pass
+
+	def set_read_only(self, read_only: bool) -> None:
+		pass
+
+	def assign_syntax(self, syntax: str) -> None:
+		pass
+
+	def run_command(self, command: str, args: dict = None) -> None:
+		if command == "append":
+			self.text += args["characters"]
+
+
+class Window:
+	def __init__(self):
+		self.quick_panels = []
+		self._folders = []
+		self._active_view = View(self)
+
+	def id(self) -> int:
+		return 1
+
+	def folders(self) -> list:
+		return self._folders
+
+	def project_file_name(self) -> str:
+		return None
+
+	def active_view(self) -> View:
+		return self._active_view
+
+	def new_file(self) -> View:
+		return View(self)
+
+	def open_file(self, fname: str, flags: int = 0, group: int = -1) -> View:
+		if flags & ENCODED_POSITION:
+			fname = fname.rsplit(":", 2)[0]
+		return View(self, fname)
+
+	def focus_view(self, view: View) -> None:
+		pass
+
+	def show_quick_panel(self, items: list, on_select, flags: int = 0, selected_index: int = -1, on_highlight=None, placeholder: str = "") -> None:
+		self.quick_panels.append((items, on_select, on_highlight, placeholder))
+
+
+_window = Window()
+
+def active_window() -> Window:
+	return _window
+
+
+def windows() -> list:
+	return [_window]
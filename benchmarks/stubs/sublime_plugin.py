@@ -0,0 +1,32 @@
+"""A minimal stand-in for Sublime Text's sublime_plugin module, see sublime.py next to it."""
+
+
+class ApplicationCommand:
+	pass
+
+
+class WindowCommand:
+	def __init__(self, window):
+		self.window = window
+
+
+class TextCommand:
+	def __init__(self, view):
+		self.view = view
+
+
+class EventListener:
+	pass
+
+
+class ViewEventListener:
+	def __init__(self, view):
+		self.view = view
+
+
+class TextInputHandler:
+	pass
+
+
+class ListInputHandler:
+	pass
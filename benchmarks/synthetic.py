@@ -0,0 +1,64 @@
+"""Synthetic inputs for the benchmarks: rg --json output and source trees to search."""
+import os
+import json
+import random
+import base64
+import subprocess
+
+WORDS = ["alpha", "beta", "gamma", "delta", "value", "index", "buffer", "render", "parse", "token",
+	"stream", "widget", "handler", "result", "config"]
+
+#------------------------------------------------------------------------------
+def make_corpus(folder: str, num_files: int, lines_per_file: int = 150) -> None:
+	"""Write num_files C files of random identifiers, with a rare symbol in about 1% of them."""
+	generator = random.Random(1)
+	for file_index in range(num_files):
+		directory = os.path.join(folder, "module_{0}".format(file_index % 20))
+		os.makedirs(directory, exist_ok=True)
+		lines = []
+		for _ in range(lines_per_file):
+			lines.append("    " + " ".join(generator.choice(WORDS) + ("_" + str(generator.randrange(50)) if generator.random() < 0.3 else "")
+				for _ in range(6)) + ";")
+		if generator.random() < 0.01:
+			lines[generator.randrange(lines_per_file)] = "    rare_symbol_xyz(value);"
+		with open(os.path.join(directory, "file_{0}.c".format(file_index)), "w") as corpus_file:
+			corpus_file.write("\n".join(lines) + "\n")
+	try:
+		for argv in (["git", "init", "-q"], ["git", "add", "-A"]):
+			subprocess.check_call(argv, cwd=folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	except (OSError, subprocess.CalledProcessError):
+		print("git not available, the git_grep engine will fail")
+
+
+#------------------------------------------------------------------------------
+def make_rg_output(num_files: int, matches_per_file: int, context: int, non_utf8_every: int = 0) -> bytes:
+	"""Build output shaped like rg --json: begin/context/match/end per file plus a summary."""
+	records = []
+	for file_index in range(num_files):
+		path = {"text": "src/module_{0}/file_{1}.c".format(file_index % 97, file_index)}
+		if non_utf8_every > 0 and file_index % non_utf8_every == 0:
+			path = {"bytes": base64.b64encode(b"src/latin1_\xe9_" + str(file_index).encode() + b".c").decode("ascii")}
+		records.append({"type": "begin", "data": {"path": path}})
+		for match_index in range(matches_per_file):
+			line_number = match_index * (2 * context + 2) + context + 1
+			for offset in range(context):
+				records.append({"type": "context", "data": {"path": path,
+					"lines": {"text": "    /* context line {0} */\n".format(offset)},
+					"line_number": line_number - context + offset, "absolute_offset": 0, "submatches": []}})
+			records.append({"type": "match", "data": {"path": path,
+				"lines": {"text": "    result = find_symbol(symbol_table, find_symbol_key);\n"},
+				"line_number": line_number, "absolute_offset": 0,
+				"submatches": [
+					{"match": {"text": "find_symbol"}, "start": 13, "end": 24},
+					{"match": {"text": "find_symbol"}, "start": 39, "end": 50}]}})
+			for offset in range(context):
+				records.append({"type": "context", "data": {"path": path,
+					"lines": {"text": "    /* context line {0} */\n".format(offset)},
+					"line_number": line_number + offset + 1, "absolute_offset": 0, "submatches": []}})
+		records.append({"type": "end", "data": {"path": path, "binary_offset": None, "stats": {
+			"elapsed": {"secs": 0, "nanos": 1000, "human": "0.000001s"}, "searches": 1, "searches_with_match": 1,
+			"bytes_searched": 4096, "bytes_printed": 0, "matched_lines": matches_per_file, "matches": 2 * matches_per_file}}})
+	records.append({"data": {"elapsed_total": {"secs": 0, "nanos": 1000, "human": "0.000001s"}, "stats": {
+		"elapsed": {"secs": 0, "nanos": 1000, "human": "0.000001s"}, "searches": num_files, "searches_with_match": num_files,
+		"bytes_searched": 4096 * num_files, "bytes_printed": 0, "matched_lines": 0, "matches": 0}}, "type": "summary"})
+	return "\n".join(json.dumps(record, separators=(",", ":")) for record in records).encode("utf8") + b"\n"
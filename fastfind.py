@@ -1,10 +1,26 @@
 import sublime, sublime_plugin
 import os
-import subprocess
 import threading
-import errno
-import json
-import pickle
+import html
+import bisect
+import re
+import time
+from collections import OrderedDict
+
+from .fastfind_core.batch import estimate_sequential_ms, parse_batch_terms
+from .fastfind_core.cache import FastFindResultCache
+from .fastfind_core.cancel import FastFindCancelToken
+from .fastfind_core.history import FastFindHistoryStore
+from .fastfind_core.engines import FastFindSearchEngine, make_search_engines
+from .fastfind_core.filelist import FastFindFileListRegistry
+from .fastfind_core.gitscope import FastFindGitScope, FastFindGitScopeCache
+from .fastfind_core.index import FastFindIndexRegistry
+from .fastfind_core.render import FastFindResultsRenderer, FastFindRenderedChunk, RESULT_FILE_REGEX, RESULT_LINE_REGEX
+from .fastfind_core.results import FastFindResult, FastFindResultSet
+from .fastfind_core.scheduler import FastFindScheduler, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_LIVE
+from .fastfind_core.search import FastFindSearchRunner
+from .fastfind_core.stats import FastFindStatsLog, format_report, stats_export_filename
+from .fastfind_core.settings import FastFindSettings, SETTINGS_KEYS, SETTINGS_PREFIX
 
 #------------------------------------------------------------------------------
 FASTFIND_PLUGIN_DIR = os.path.basename(os.path.dirname(os.path.realpath(__file__)))
@@ -16,7 +32,7 @@ if FASTFIND_PLUGIN_DIR.find(".sublime-package") != -1:
 
 FASTFIND_CONTEXT_MENU = os.path.dirname(os.path.realpath(__file__)) + "/Context.sublime-menu"
 FASTFIND_SETTINGS_FILE = os.path.dirname(os.path.realpath(__file__)) + "/fastfind.sublime-settings"
-FASTFIND_SYNTAX_FILE = "Packages/" + FASTFIND_PLUGIN_DIR + "/FastFindResults.hidden-tmLanguage"
+FASTFIND_SYNTAX_FILE = "Packages/" + FASTFIND_PLUGIN_DIR + "/fastfindResults.hidden-tmLanguage"
 
 # search_history = {}
 
@@ -30,13 +46,47 @@ def get_nth_key(dictionary, n=0):
 	raise IndexError("dictionary index out of range")
 
 #------------------------------------------------------------------------------
-def get_setting(key, default=None, view=None):
-		s = sublime.load_settings("fastfind.sublime-settings")
-		if view == None:
-			view = sublime.active_window().active_view()
+_settings_snapshot = None
+
+def load_fastfind_settings() -> FastFindSettings:
+	"""Take a new snapshot of fastfind.sublime-settings. Must run on the UI thread."""
+	global _settings_snapshot
+	s = sublime.load_settings("fastfind.sublime-settings")
+	values = {}
+	for key in SETTINGS_KEYS:
+		if s.has(SETTINGS_PREFIX + key):
+			values[key] = s.get(SETTINGS_PREFIX + key)
+	_settings_snapshot = FastFindSettings(values)
+	return _settings_snapshot
+
+
+def get_fastfind_settings() -> FastFindSettings:
+	if _settings_snapshot is None:
+		return load_fastfind_settings()
+	return _settings_snapshot
+
+
+def plugin_loaded():
+	s = sublime.load_settings("fastfind.sublime-settings")
+	s.clear_on_change("FastFind")
+	s.add_on_change("FastFind", load_fastfind_settings)
+	load_fastfind_settings()
+	make_search_engines_for_plugin()
+
 
-		if s.has("FastFindSublime_%s" % key):
-			return s.get("FastFindSublime_%s" % key)
+def plugin_unloaded():
+	sublime.load_settings("fastfind.sublime-settings").clear_on_change("FastFind")
+	if _index_registry is not None:
+		_index_registry.save_all()
+	_search_engines["python"].shutdown()
+
+#------------------------------------------------------------------------------
+def get_setting(key, default=None, view=None):
+		s = get_fastfind_settings()
+		if s.has(key):
+			return s.get(key)
+		elif default is not None:
+			return default
 		else:
 			error_string = ('\"{0}\" settting not specified\n'
 			'Add the following to your user FastFind.sublime-setttings:\n\n'
@@ -53,193 +103,319 @@ def get_setting(key, default=None, view=None):
 			sublime.error_message(error_string)
 
 #------------------------------------------------------------------------------
-def get_history_save_location() -> str:
+def get_history_save_location(window: sublime.Window = None) -> str:
 	search_history_filename = get_setting("history_file")
 	if search_history_filename != None:
 		save_dir = os.path.join(sublime.packages_path(), "FastFind")
-		project_file_path = sublime.active_window().project_file_name()
+		if window is None:
+			window = sublime.active_window()
+		project_file_path = window.project_file_name()
 		if project_file_path != None:
 			# we have a project loaded, so prefer to save in the project folder
 			save_dir = os.path.dirname(project_file_path)
 
 		search_history_filename = os.path.join(save_dir, search_history_filename)
-		print("history file path: " + search_history_filename)
 		return search_history_filename
 	return None
 
 
 #------------------------------------------------------------------------------
-def save_history_to_file(search_history: dict):
-	filename = get_history_save_location()
+def load_history_from_file(filename: str = None) -> FastFindHistoryStore:
+	# searches are appended to the history file as they finish, there is no separate save step
+	if filename is None:
+		filename = get_history_save_location()
 	if filename != None:
-		with open(filename, "wb+") as history_file:
-			pickle.dump(search_history, history_file)
+		print("history file path: " + filename)
+		os.makedirs(os.path.dirname(filename), exist_ok=True)
+	return FastFindHistoryStore(filename,
+		max_entries=get_setting("history_max_entries", 100),
+		max_bytes=get_setting("history_max_size_mb", 64) * 1024 * 1024)
 
 
 #------------------------------------------------------------------------------
-def load_history_from_file() -> dict:
-	search_history = {}
-	filename = get_history_save_location()
-	if filename != None:
-		if os.path.isfile(filename):
-			with open(filename, "rb") as history_file:
-				search_history = pickle.load(history_file)
-	return search_history
+# one history store per history file, shared by every view. Sublime makes a TextCommand for
+# each view, loading the history in each of them made startup cost grow with the open tabs
+_search_histories = {}
+_search_histories_lock = threading.Lock()
+
+def get_search_history(window: sublime.Window = None) -> FastFindHistoryStore:
+	"""The history of window's project (the active window by default), loaded on first use."""
+	filename = get_history_save_location(window)
+	key = (filename, get_setting("history_max_entries", 100), get_setting("history_max_size_mb", 64))
+	with _search_histories_lock:
+		search_history = _search_histories.get(key)
+		if search_history is None:
+			search_history = load_history_from_file(filename)
+			_search_histories[key] = search_history
+		return search_history
 
 
 #------------------------------------------------------------------------------
-def open_file_in_view(filename: str, line_number: int, char_index: int, preview_only: bool) -> sublime.View:
-		window = sublime.active_window()
-		flags = sublime.ENCODED_POSITION
-		if preview_only:
-			flags |= sublime.TRANSIENT
-		encoded_filename = "{0}:{1}:{2}".format(filename, line_number, char_index)
-		view = window.open_file(fname=encoded_filename,group=-1, flags=flags)
-		return view
+_result_cache = None
 
-#------------------------------------------------------------------------------
-class FastFindResult:
-	def __init__(self, filename: str, line_number: int, startpos: int, matchlen: int):
-		self.filename = filename
-		self.line_number = line_number
-		self.start_char_index = startpos
-		self.match_length = matchlen
-
-	@staticmethod
-	def from_json(json_content):
-		start_pos = int(json_content['submatches'][0]['start'])
-		match_len = int(json_content['submatches'][0]['end']) - start_pos
-		return FastFindResult(json_content['path']['text'],
-			int(json_content['line_number']),
-			start_pos,
-			match_len)
-
-	def to_string(self) -> str:
-		return "FastFindResult: filename = {0}\n\tline_number = {1}\n\tstart_char_index = {2}\n\tmatch_length = {3}\n".format(
-			self.filename,
-			self.line_number,
-			self.start_char_index,
-			self.match_length)
+def get_result_cache() -> FastFindResultCache:
+	# shared by every view and window, so repeating a search anywhere can reuse its results
+	global _result_cache
+	if _result_cache is None:
+		_result_cache = FastFindResultCache(get_setting("result_cache_max_entries", 32))
+	return _result_cache
 
 
 #------------------------------------------------------------------------------
-class FastFindSublimeWorker(threading.Thread):
-	def __init__(self, view, platform, root, symbol, folder, executable, case_sensitive):
-		super(FastFindSublimeWorker, self).__init__()
-		self._view = view
-		self._platform = platform
-		self._root = root
-		self._symbol = symbol
-		self._folder = folder
-		self._executable = executable
-		self._output = []
-		self._case_sensitive = case_sensitive
+# file lists of git scoped searches, shared by every view like the result cache
+_git_scope_cache = FastFindGitScopeCache()
 
-	def make_fastfind_cmd(self, folder, word):
-		if folder is None or folder == "":
-			sublime.error_message("No search path specified!")
-			return ([], [])
+def make_search_scope(scope: str, ref: str = None) -> FastFindGitScope:
+	"""The FastFindGitScope of a command's scope and ref args, None to search whole folders."""
+	if scope is None or scope == "all":
+		return None
+	return FastFindGitScope(scope, ref, _git_scope_cache)
 
-		#FIXME(BH): replace with search executable specified in user preferences
-		fastfind_arg_list = [str(get_setting("executable"))] #["rg"]
-		fastfind_arg_list.append("--json")
 
-		if self._case_sensitive == False:
-			fastfind_arg_list.append("-i")
+#------------------------------------------------------------------------------
+_stats_log = None
 
-		fastfind_arg_list.append("-B"+str(get_setting("before_context")))
-		fastfind_arg_list.append("-A"+str(get_setting("after_context")))
+def get_stats_log() -> FastFindStatsLog:
+	global _stats_log
+	if _stats_log is None:
+		export_filename = stats_export_filename(get_setting("stats_export_file", ""),
+			os.path.join(sublime.cache_path(), "FastFind"))
+		_stats_log = FastFindStatsLog(get_setting("stats_max_entries", 200), export_filename)
+	return _stats_log
 
-		std_file_types = get_setting("file_type_pattern")
-		if std_file_types is not None:
-			for file_type in std_file_types:
-				fastfind_arg_list.append("-t"+file_type)
 
-		non_std_file_types = get_setting("non_std_file_type_pattern")
-		if non_std_file_types is not None:
-			for file_type in non_std_file_types:
-				fastfind_arg_list.append("--type-add")
-				fastfind_arg_list.append("%s:*.%s" % (file_type, file_type))
-			for file_type in non_std_file_types:
-				fastfind_arg_list.append("-t"+file_type)
+#------------------------------------------------------------------------------
+# trigram indexes are kept in Sublime's cache directory, which is only known on the UI thread,
+# so the registry and the engines using it are made when the plugin loads
+_index_registry = None
+_search_engines = {}
+
+def make_search_engines_for_plugin() -> None:
+	global _index_registry, _search_engines
+	index_dir = os.path.join(sublime.cache_path(), "FastFind", "indexes")
+	_index_registry = FastFindIndexRegistry(index_dir,
+		on_message=lambda message: sublime.set_timeout(lambda: sublime.status_message(message), 0))
+	file_lists = FastFindFileListRegistry(os.path.join(sublime.cache_path(), "FastFind", "filelists"))
+	# worker processes can't be started from the plugin host, the python engine scans on threads
+	_search_engines = make_search_engines(_index_registry, use_processes=False, file_lists=file_lists)
+
+
+def get_search_engine(name: str) -> FastFindSearchEngine:
+	if len(_search_engines) == 0:
+		make_search_engines_for_plugin()
+	engine = _search_engines.get(name)
+	if engine is None:
+		print("[FastFind] Unknown search engine '{0}', using rg".format(name))
+		engine = _search_engines["rg"]
+	return engine
 
-		path = folder
-		print("FastFind: Search path is '{0}'".format(path))
 
-		fastfind_arg_list.append("--column")
-		fastfind_arg_list.append(word)
-		fastfind_arg_list.append(path)
+#------------------------------------------------------------------------------
+# every search of every window goes through one scheduler, so they share max_concurrent_searches
+_search_scheduler = None
+# views the queue status was set on, so it can be erased from them again
+_queue_status_views = {}
+_queue_status_refresh_pending = False
+# a search that waited at least this long in the queue says so when it is done
+QUEUE_WAIT_REPORT_MS = 100
+
+def get_search_scheduler() -> FastFindScheduler:
+	global _search_scheduler
+	max_running = get_setting("max_concurrent_searches", 2)
+	if _search_scheduler is None:
+		_search_scheduler = FastFindScheduler(max_running,
+			on_change=lambda: sublime.set_timeout(show_queue_status, 0))
+	else:
+		_search_scheduler.set_max_running(max_running)
+	return _search_scheduler
+
+
+def show_queue_status() -> None:
+	"""Show how many searches wait for the scheduler in the status bar of every window."""
+	global _queue_status_refresh_pending
+	running, queued, longest_wait = _search_scheduler.status()
+	for view in _queue_status_views.values():
+		view.erase_status("FastFindQueue")
+	_queue_status_views.clear()
+	if queued == 0:
+		return
+	message = "FastFind: {0} running, {1} queued, longest wait {2:.1f}s".format(running, queued, longest_wait)
+	for window in sublime.windows():
+		view = window.active_view()
+		if view is not None:
+			view.set_status("FastFindQueue", message)
+			_queue_status_views[view.id()] = view
+	# the wait keeps growing while nothing changes, refresh it until the queue is empty
+	if not _queue_status_refresh_pending:
+		_queue_status_refresh_pending = True
+		sublime.set_timeout(refresh_queue_status, 500)
+
+
+def refresh_queue_status() -> None:
+	global _queue_status_refresh_pending
+	_queue_status_refresh_pending = False
+	show_queue_status()
 
-		# print("FastFind: make_fastfind_cmd: fastfind_arg_list = {0}".format(fastfind_arg_list))
-		popen_arg_list = {
-			"shell": False,
-			"stdout": subprocess.PIPE,
-			"stderr": subprocess.PIPE,
-			"cwd": self._root
-		}
 
-		if self._platform == "windows":
-			popen_arg_list["creationflags"] = 0x08000000
+#------------------------------------------------------------------------------
+# the cancel token of the search currently running for each view, by view id
+_active_searches = {}
 
-		return fastfind_arg_list, popen_arg_list
+def begin_search(view: sublime.View) -> FastFindCancelToken:
+	"""Register a new search for view, cancelling the one it supersedes."""
+	token = FastFindCancelToken()
+	previous_token = _active_searches.get(view.id())
+	if previous_token is not None:
+		print("[FastFind] Cancelling superseded search")
+		previous_token.cancel()
+	_active_searches[view.id()] = token
+	return token
 
-	def run_fastfind(self, folder: str, word: str) -> str:
-		fastfind_arg_list, popen_arg_list = self.make_fastfind_cmd(folder, word)
-		try:
-			proc = subprocess.Popen(fastfind_arg_list, **popen_arg_list)
-		except OSError as e:
-			if e.errno == errno.ENOENT:
-				sublime.error_message("FastFind ERROR: fastfind binary \"%s\" not found!" % self._executable)
-			else:
-				sublime.error_message("FastFind ERROR: %s failed!" % fastfind_arg_list)
-			print("FastFind: Exiting due to error")
-			return ""
 
-		output, erroroutput = proc.communicate()
+def end_search(view: sublime.View, token: FastFindCancelToken) -> None:
+	if _active_searches.get(view.id()) is token:
+		del _active_searches[view.id()]
 
-		# if erroroutput is not None and erroroutput.strip() != "":
-		# 	print("FastFind: erroroutput = '{0}'".format(erroroutput))
 
-		try:
-			output = str(output, encoding="utf8")
-		except TypeError:
-			output = unicode(str(output), encoding="utf8")
+def cancel_search(view: sublime.View) -> bool:
+	token = _active_searches.pop(view.id(), None)
+	if token is None:
+		return False
+	token.cancel()
+	return True
 
-		# print("FastFind: output = {0}".format(output))
-		return output
 
-	def process_results(self, results):
-		for line in results:
-			print(line)
+#------------------------------------------------------------------------------
+def open_file_in_view(filename: str, line_number: int, char_index: int, preview_only: bool) -> sublime.View:
+		window = sublime.active_window()
+		flags = sublime.ENCODED_POSITION
+		if preview_only:
+			flags |= sublime.TRANSIENT
+		encoded_filename = "{0}:{1}:{2}".format(filename, line_number, char_index)
+		view = window.open_file(fname=encoded_filename,group=-1, flags=flags)
+		return view
 
-	def run(self) -> None:
-		print("[FastFind] Searching '%s' for '%s'" % (self._folder, self._symbol))
-		results = self.run_fastfind(self._folder, self._symbol)
-		search_result_locations = parse_search_results_from_json(results)
-		self._output = search_result_locations
+#------------------------------------------------------------------------------
+def show_error_message(message: str) -> None:
+	# safe to call from worker threads, the dialog itself is shown from the UI thread
+	sublime.set_timeout(lambda: sublime.error_message(message), 0)
 
 #------------------------------------------------------------------------------
-def parse_search_results_from_json(content: str) -> list:
-	results = []
-	# NOTE(BH): Ripgrep splits json results using Unix line-endings, so even on Windows,
-	# we need split the results on the Unix line termination character and not use os.linesep
-	for line in content.split("\n"):
-		# print("\n\nline:\n\n{0}\n\n".format(line))
-		line = line.strip()
-		if line == "":
-			# print("blank line...skipping")
-			continue
-		json_result = json.loads(line)
-		# print("json_result: ", json_result)
-
-		if json_result['type'] == 'match':
-			# print("found match type")
-			find_result = FastFindResult.from_json(json_result['data'])
-			if find_result != None:
-				# print(find_result.to_string())
-				results.append(find_result)
-	return results
+class FastFindSublimeWorker(FastFindSearchRunner):
+	"""A FastFindSearchRunner the search scheduler runs, handing its output to the UI thread."""
+	def __init__(self, view, symbol, folders, case_sensitive, settings, on_results=None, cache_key=None, cancel_token=None, max_results=0, engine=None, on_progress=None, on_done=None, on_rendered=None, scope=None, history=None):
+		FastFindSearchRunner.__init__(self, symbol, folders, case_sensitive, settings,
+			get_search_engine(engine or settings.get("search_engine", "rg")), cancel_token, max_results, scope)
+		self._view = view
+		# when on_results is set, results are streamed to it in batches from the UI thread
+		self._on_results = on_results
+		self._cache_key = cache_key
+		# on_progress is called (throttled) while the search runs and on_done once when it is
+		# over, both on the UI thread, so nothing has to poll the worker
+		self._on_progress = on_progress
+		self._on_done = on_done
+		# when on_rendered is set, hits and their context lines are rendered as results view text
+		# and handed to it a chunk at a time, see FastFindResultsRenderer
+		self._on_rendered = on_rendered
+		self._show_gaps = int(settings.get("before_context", 0)) > 0 or int(settings.get("after_context", 0)) > 0
+		# the view on_rendered fills in, set by the command that started the worker
+		self._results_view = None
+		self._last_progress_post = 0
+		# results this worker re-checks, when it was started to revalidate a cached search, and
+		# whether the fresh ones differ, which finish() works out off the UI thread
+		self._revalidates = None
+		self._results_changed = None
+		# where finish() saves the results, serializing them is too slow for the UI thread
+		self._history = history
+
+	def _make_renderer(self) -> FastFindResultsRenderer:
+		if self._on_rendered is None:
+			return None
+		return FastFindResultsRenderer(self._show_gaps, RESULTS_VIEW_CHUNK_LINES)
+
+	def _report_error(self, message: str) -> None:
+		show_error_message(message)
+
+	def _report_status(self, message: str) -> None:
+		sublime.set_timeout(lambda: sublime.status_message(message), 0)
+
+	def _save_history(self) -> None:
+		if self._history is None or self._returncode == 2 or self._results_changed is False:
+			return
+		if isinstance(self._search_terms, str):
+			self._history[self._symbol] = self._output
+		elif self._term_results is not None:
+			# a batch files its hits under each term
+			for term in self._search_terms:
+				self._history[term] = self._term_results[term]
+
+	def _post_progress(self) -> None:
+		on_progress = self._on_progress
+		if on_progress is None or time.time() - self._last_progress_post < self._batch_interval:
+			return
+		self._last_progress_post = time.time()
+		sublime.set_timeout(lambda: on_progress(self), 0)
+
+	def _post_rendered(self, renderer: FastFindResultsRenderer) -> None:
+		on_rendered = self._on_rendered
+		if renderer is None or on_rendered is None or self.cancelled:
+			return
+		# one dispatch per chunk, so the UI thread gets to do other work between inserts
+		for chunk in renderer.take_chunks():
+			sublime.set_timeout(lambda chunk=chunk: on_rendered(self, chunk), 0)
+
+	def _post_results(self, batch: FastFindResultSet) -> None:
+		on_results = self._on_results
+		if on_results is not None and not self.cancelled:
+			sublime.set_timeout(lambda: on_results(self, batch), 0)
+
+	def dedupe_key(self) -> tuple:
+		# a results view is filled in from the chunks its own search renders
+		if self._on_rendered is not None:
+			return None
+		return FastFindSearchRunner.dedupe_key(self)
+
+	def finish(self) -> None:
+		if self._revalidates is not None and not self.cancelled:
+			# comparing result sets costs as much as the results are long
+			self._results_changed = self._output != self._revalidates
+		FastFindSearchRunner.finish(self)
+		# the results go to the UI thread in one dispatch, before saving and caching them
+		on_done = self._on_done
+		if on_done is not None:
+			sublime.set_timeout(lambda: on_done(self), 0)
+		if self.cancelled:
+			print("[FastFind] Search for '%s' cancelled" % self._symbol)
+			return
+		self._save_history()
+		# rg exits with 1 when nothing matched and 2 on errors, which shouldn't be cached,
+		# and neither should a search cut short by max_results
+		if self._cache_key is not None and self._returncode in (0, 1) and not self._truncated:
+			get_result_cache().put(self._cache_key, self._output)
 
+#------------------------------------------------------------------------------
+def get_default_search_folder() -> str:
+	# Prefer to use the current project directory as the search path 
+	if sublime.active_window().project_file_name() is not None:
+		proj_file = sublime.active_window().project_file_name()
+		print("FastFind: Loaded Project File: ",proj_file)
+		folder_path = os.path.dirname(os.path.realpath(proj_file))
+		return folder_path
+	elif len(sublime.active_window().folders()) > 0:
+		# if no project is open, but folders are open, then use the first folder path as the 
+		# search path
+		folder_path = sublime.active_window().folders()[0]
+		print("FastFind: Loaded folder_path: ",folder_path)
+		return folder_path
+	else:
+		view = sublime.active_window().active_view()
+		if view is not None:
+			filename = view.buffer().file_name()
+			if filename is not None:
+				folder_path = os.path.dirname(os.path.realpath(filename))
+				print("FastFind: Path of currently open file: ",folder_path)
+				return folder_path
+	return None
 
 #------------------------------------------------------------------------------
 class ShowSearchHistoryHandler(sublime_plugin.TextInputHandler):
@@ -248,9 +424,31 @@ class ShowSearchHistoryHandler(sublime_plugin.TextInputHandler):
 
 #------------------------------------------------------------------------------
 class SearchTermInputHandler(sublime_plugin.TextInputHandler):
+	def __init__(self, command=None, args=None):
+		# live search needs to know where the command will search, which comes from its args
+		self._live_search = None
+		if command is not None and get_setting("live_search", False):
+			folders = command.get_search_folders(args or {})
+			if len(folders) > 0:
+				self._live_search = LiveSearch(command, folders, (args or {}).get("case_sensitive", False),
+					(args or {}).get("engine") or get_setting("search_engine", "rg"), command.get_search_scope(args or {}))
+
 	def placeholder(self):
 		return "Search Term"
 
+	def preview(self, text):
+		if self._live_search is None:
+			return None
+		return self._live_search.preview(text)
+
+	def cancel(self):
+		if self._live_search is not None:
+			self._live_search.cancel()
+
+	def confirm(self, text):
+		if self._live_search is not None:
+			self._live_search.cancel()
+
 	def initial_text(self):
 		if sublime.active_window() is not None:
 			if sublime.active_window().active_view() is not None:
@@ -274,32 +472,130 @@ class SearchTermInputHandler(sublime_plugin.TextInputHandler):
 
 
 
+#------------------------------------------------------------------------------
+# finished live search runs kept to preview again, e.g. after deleting a character
+LIVE_SEARCH_FINISHED_MAX_ENTRIES = 16
+
+class LiveSearch:
+	"""Search-as-you-type for SearchTermInputHandler.
+
+	Every change to the term cancels the running search and schedules a new one after
+	live_search_debounce_ms. Runs stop after live_search_max_results hits and terms shorter
+	than live_search_min_length never start one. Sublime only asks for a preview when the
+	text changes and has no call to ask for one again, so a run that completes after the
+	last keystroke is shown on the next one, its hit count goes to the status bar until
+	then. Complete runs go into the result cache, so confirming the term shows them
+	immediately.
+	"""
+	def __init__(self, command, folders: list, case_sensitive: bool, engine: str, scope: FastFindGitScope = None):
+		self._command = command
+		self._folders = folders
+		self._case_sensitive = case_sensitive
+		self._engine = engine
+		self._scope = scope
+		self._debounce_ms = get_setting("live_search_debounce_ms", 150)
+		self._min_length = get_setting("live_search_min_length", 3)
+		self._max_results = get_setting("live_search_max_results", 200)
+		self._preview_count = get_setting("live_search_preview_count", 5)
+		self._generation = 0
+		self._worker = None
+		# term -> (results, truncated, elapsed) of finished runs, least recently shown first
+		self._finished = OrderedDict()
+		self._latest_term = None
+		# the text of the input box, as of the last preview
+		self._text = None
+
+	def preview(self, text: str):
+		self._text = text
+		self._harvest()
+		self._generation += 1
+		self.cancel()
+		if len(text) < self._min_length:
+			return "Type at least {0} characters to search".format(self._min_length)
+		if text in self._finished:
+			self._finished.move_to_end(text)
+			return self._render(text)
+
+		generation = self._generation
+		sublime.set_timeout(lambda: self._start(generation, text), self._debounce_ms)
+		if self._latest_term is not None:
+			return self._render(self._latest_term, "searching for '{0}'...".format(text))
+		return "Searching for '{0}'...".format(text)
+
+	def cancel(self) -> None:
+		if self._worker is not None:
+			self._worker._cancel_token.cancel()
+			self._worker = None
+
+	def _start(self, generation: int, text: str) -> None:
+		if generation != self._generation:
+			# the term changed again before the debounce interval was up
+			return
+		settings = get_fastfind_settings()
+		cache_key = FastFindResultCache.make_key(text, self._folders, self._case_sensitive,
+			settings.get("file_type_pattern"),
+			settings.get("non_std_file_type_pattern"),
+			settings.get("before_context"),
+			settings.get("after_context"),
+			self._engine,
+			settings.get("max_results_per_file", 0),
+			settings.get("ignore_folders"))
+		if self._scope is not None:
+			# the files in a scope change without the results' files changing, see FastFindCommand
+			cache_key = None
+		self._worker = FastFindSublimeWorker(
+				view = self._command.view,
+				symbol = text,
+				folders = self._folders,
+				case_sensitive = self._case_sensitive,
+				settings = settings,
+				cache_key = cache_key,
+				max_results = self._max_results,
+				engine = self._engine,
+				on_done = self._on_search_done,
+				scope = self._scope)
+		get_search_scheduler().submit(self._worker, PRIORITY_LIVE, self._worker.dedupe_key())
+
+	def _on_search_done(self, worker) -> None:
+		if worker is not self._worker or worker.cancelled:
+			return
+		self._harvest()
+		if worker._symbol == self._text:
+			# the preview only changes on the next keystroke
+			sublime.status_message("FastFind: {0}{1} hits for '{2}'".format(len(worker._output),
+				"+" if worker._truncated else "", worker._symbol))
+
+	def _harvest(self) -> None:
+		worker = self._worker
+		if worker is None or not worker.finished or worker.cancelled:
+			return
+		self._finished[worker._symbol] = (worker._output, worker._truncated, worker._elapsed)
+		self._finished.move_to_end(worker._symbol)
+		while len(self._finished) > LIVE_SEARCH_FINISHED_MAX_ENTRIES:
+			self._finished.popitem(last=False)
+		self._latest_term = worker._symbol
+		self._worker = None
+
+	def _render(self, term: str, status: str = None):
+		results, truncated, elapsed = self._finished[term]
+		count = "{0}{1}".format(len(results), "+" if truncated else "")
+		lines = ["<b>{0}</b> hits for '{1}' in {2:.0f} ms".format(count, html.escape(term), elapsed * 1000)]
+		for index in range(min(self._preview_count, len(results))):
+			lines.append("{0}:{1}".format(html.escape(os.path.basename(results.filename(index))), results.line_number(index)))
+		if status is not None:
+			lines.append("<i>{0}</i>".format(html.escape(status)))
+		return sublime.Html("<br>".join(lines))
+
+
 #------------------------------------------------------------------------------
 class FolderInputHandler(sublime_plugin.TextInputHandler):
 	def placeholder(self):
 		return "Search Path"
 
 	def initial_text(self):
-		# Prefer to use the current project directory as the search path 
-		if sublime.active_window().project_file_name() is not None:
-			proj_file = sublime.active_window().project_file_name()
-			print("FastFind: Loaded Project File: ",proj_file)
-			folder_path = os.path.dirname(os.path.realpath(proj_file))
-			return folder_path
-		elif len(sublime.active_window().folders()) > 0:
-			# if no project is open, but folders are open, then use the first folder path as the 
-			# search path
-			folder_path = sublime.active_window().folders()[0]
-			print("FastFind: Loaded folder_path: ",folder_path)
+		folder_path = get_default_search_folder()
+		if folder_path is not None:
 			return folder_path
-		else:
-			view = sublime.active_window().active_view()
-			if view is not None:
-				filename = view.buffer().file_name()
-				if filename is not None:
-					folder_path = os.path.dirname(os.path.realpath(filename))
-					print("FastFind: Path of currently open file: ",folder_path)
-					return folder_path
 		return "enter a search path"
 
 
@@ -307,190 +603,795 @@ class FolderInputHandler(sublime_plugin.TextInputHandler):
 		return "FastFind Search Path"
 
 
+class RefInputHandler(sublime_plugin.TextInputHandler):
+	"""The revision a search of the files changed since a revision starts from."""
+	def placeholder(self):
+		return "Branch, tag or commit, e.g. origin/main"
+
+	def initial_text(self):
+		return "origin/main"
+
+	def validate(self, text):
+		return text.strip() != ""
+
+	def description(self, text):
+		return "Changed since " + text
+
+
 
 #------------------------------------------------------------------------------
-class FastFindCommand(sublime_plugin.TextCommand):
+class FastFindResultsPanel:
+	"""The quick panel listing the results of a search, one page at a time.
+
+	Only the hits of the page on screen are turned into QuickPanelItems, so showing or
+	refreshing the panel costs the same for a million results as for a hundred. Entries after
+	the hits move to the next or previous page, or list every result in a results view.
+	"""
+	NEXT_PAGE = "next"
+	PREVIOUS_PAGE = "previous"
+	SHOW_ALL = "show_all"
+
 	def __init__(self, view: sublime.View):
 		self.view = view
-		if view is None:
-			print("[FastFind] No view opened - using active window instead")
-			self.view = sublime.active_window().view()
-			if self.view is None:
-				print("[FastFind] WHAT? Still no view???")
-
-		self._executable = None
-		self._root = None
-		self._find_results = []
+		self.results = FastFindResultSet()
+		self.highlighted_index = 0
+		self.dismissed = False
+		self.last_refresh = 0
+		self._symbol = ""
+		self._searching = False
+		self._truncated = False
+		self._page_start = 0
+		self._page_end = 0
+		self._actions = []
+		self._panel_id = 0
+		# only the last highlight within preview_delay_ms opens a preview
+		self._preview_generation = 0
+		self._preview_view = None
 		self._current_position = None
 		self._saved_viewport_pos = None
-		self._folder = None
-		self._search_history = load_history_from_file()
-		print("[FastFind] Loaded")
 
+	def save_position(self) -> None:
+		if self.view is not None:
+			self._current_position = self.view.sel()[0]
+			self._saved_viewport_pos = self.view.viewport_position()
+		else:
+			self._current_position = None
+			self._saved_viewport_pos = None
 
-	def _update_status(self, workers: list, msgStr: str, show_results: bool, count: int = 0, dir: int = 1) -> None:
-		count = count + dir
-		found = False
+	def reset(self) -> None:
+		self.results = FastFindResultSet()
+		self.highlighted_index = 0
+		self.dismissed = False
+		self.last_refresh = 0
 
-		for worker in workers:
-			if worker.is_alive():
-				found = True
-				if count == 7:
-					dir = -1
-				elif count == 0:
-					dir = 1
-				sublime.set_timeout(lambda: self._update_status(workers, msgStr, show_results, count, dir), 100)
-				break
+	def show(self, symbol: str, results: FastFindResultSet, searching: bool = False, truncated: bool = False) -> None:
+		self.results = results
+		self.last_refresh = time.time()
+		self._symbol = symbol
+		self._searching = searching
+		self._truncated = truncated
 
-		if not found:
-			self.view.erase_status("FastFindSublime")
-			output = ""
-			if show_results:
-				for worker in workers:
-					for result in worker._output:
-						self._find_results.append(result)
-					self._search_history[worker._symbol] = worker._output
-					save_history_to_file(self._search_history)
-					self._display_results_in_jump_list(worker._symbol, worker._output)
-
-
-	def _select_entry(self, index: int) -> None:
-		# print("_select_entry called with index = {0}".format(index))
+		count = len(results)
+		page_size = max(1, int(get_setting("quick_panel_page_size", 1000)))
+		self._page_start = (min(self.highlighted_index, max(count - 1, 0)) // page_size) * page_size
+		self._page_end = min(self._page_start + page_size, count)
+
+		items = []
+		show_line_text = get_setting("quick_panel_line_text", True)
+		# basenames of the files on this page only, never of every file with a hit
+		basenames = {}
+		for index in range(self._page_start, self._page_end):
+			file_index = results.filename_index(index)
+			basename = basenames.get(file_index)
+			if basename is None:
+				basename = basenames[file_index] = os.path.basename(results.filename(index))
+			details = ""
+			if show_line_text:
+				result = results[index]
+				details = format_line_text(result.line_text, result.start_char_index, result.match_length)
+			items.append(sublime.QuickPanelItem("{0}:{1}".format(basename, results.line_number(index)), details=details))
+
+		self._actions = []
+		if self._page_end < count:
+			self._actions.append(self.NEXT_PAGE)
+			items.append(sublime.QuickPanelItem("Next page",
+				annotation="{0}-{1} of {2}".format(self._page_end + 1, min(self._page_end + page_size, count), count)))
+		if self._page_start > 0:
+			self._actions.append(self.PREVIOUS_PAGE)
+			items.append(sublime.QuickPanelItem("Previous page",
+				annotation="{0}-{1} of {2}".format(self._page_start - page_size + 1, self._page_start, count)))
+		if count > page_size:
+			self._actions.append(self.SHOW_ALL)
+			items.append(sublime.QuickPanelItem("Show all in results view", annotation="{0} results".format(count)))
+
+		placeholder = "[FastFind] found {0}{1} occurrences of '{2}'".format(count, "+" if truncated else "", symbol)
+		if count > page_size:
+			placeholder += " (page {0} of {1})".format(self._page_start // page_size + 1, (count + page_size - 1) // page_size)
+		if searching:
+			placeholder += " (searching...)"
+
+		# re-showing the panel while results stream in replaces the previous one, which then reports
+		# a cancel; only the panel currently on screen is allowed to act on a selection
+		self._panel_id += 1
+		panel_id = self._panel_id
+		page_start = self._page_start
+
+		self.view.window().show_quick_panel(items=items,
+			on_select=lambda index: self._on_select(panel_id, page_start, index),
+			on_highlight=lambda index: self._on_highlight(panel_id, page_start, index),
+			flags=sublime.KEEP_OPEN_ON_FOCUS_LOST,
+			selected_index=self.highlighted_index - self._page_start,
+			placeholder=placeholder)
+
+	def _on_select(self, panel_id: int, page_start: int, index: int) -> None:
+		if panel_id != self._panel_id:
+			return
+		if index >= self._page_end - page_start:
+			self._run_action(self._actions[index - (self._page_end - page_start)])
+			return
+		# don't pop the panel back up for results that arrive after the user is done with it
+		self.dismissed = True
 		if index < 0:
-			# print("FastFind: cancelled navigation - return to previous position")
-			# cancelled, return to saved position
+			self._restore_position()
+		else:
+			self._open_result(page_start + index)
+
+	def _on_highlight(self, panel_id: int, page_start: int, index: int) -> None:
+		if panel_id != self._panel_id or index < 0 or index >= self._page_end - page_start:
+			# the page entries have nothing to preview
+			return
+		self.highlighted_index = page_start + index
+		# scrolling through the list highlights entry after entry, wait for it to settle
+		self._preview_generation += 1
+		generation = self._preview_generation
+		delay_ms = get_setting("preview_delay_ms", 100)
+		if delay_ms <= 0:
+			self._show_preview(generation)
+		else:
+			sublime.set_timeout(lambda: self._show_preview(generation), delay_ms)
+
+	def _show_preview(self, generation: int) -> None:
+		if generation != self._preview_generation or self.dismissed or self.highlighted_index >= len(self.results):
+			return
+		self._preview_view = preview_result(self._preview_view, self.results[self.highlighted_index])
+
+	def _run_action(self, action: str) -> None:
+		if action == self.NEXT_PAGE:
+			self.highlighted_index = self._page_end
+		elif action == self.PREVIOUS_PAGE:
+			self.highlighted_index = self._page_start - 1
+		else:
+			self.dismissed = True
+			show_results_in_view(self.view.window() or sublime.active_window(), self._symbol, self.results)
+			return
+		self.highlighted_index = max(0, min(self.highlighted_index, len(self.results) - 1))
+		# a quick panel can't be shown from the on_select of another one
+		sublime.set_timeout(lambda: self.show(self._symbol, self.results, self._searching, self._truncated), 0)
+
+	def _open_result(self, index: int) -> None:
+		selected_entry = self.results[index]
+		view = open_file_in_view(selected_entry.filename,
+			selected_entry.line_number,
+			selected_entry.start_char_index+1,
+			False)
+		sublime.active_window().focus_view(view)
+
+	def _restore_position(self) -> None:
+		# cancelled, return to saved position
+		if self.view is None:
+			self.view = sublime.active_window().view()
 			if self.view is None:
-				self.view = sublime.active_window().view()
-				if self.view is None:
-					print("[FastFind] view is still none!!")
+				print("[FastFind] view is still none!!")
 
-			if self.view.window() is None:
-				sublime.active_window().focus_view(self.view)
-			else:
-				self.view.window().focus_view(self.view)
+		if self.view.window() is None:
+			sublime.active_window().focus_view(self.view)
+		else:
+			self.view.window().focus_view(self.view)
 
+		if self._current_position is not None:
 			self.view.sel().clear()
 			self.view.sel().add(self._current_position)
 			self.view.set_viewport_position(self._saved_viewport_pos, animate=True)
-		else:
-			# print("skipping...for index = {0}".format(index))
-			selected_entry = self._find_results[index]
-			# print("_select_entry %d: %s:%d:%d" % (index, selected_entry.filename, selected_entry.line_number, selected_entry.start_char_index))
-			view = open_file_in_view(selected_entry.filename,
-				selected_entry.line_number,
-				selected_entry.start_char_index+1,
-				False)
-			sublime.active_window().focus_view(view)
-		
-
-	def _highlight_entry(self, index: int) -> None:
-		# print("_highlight_entry called with index = {0}".format(index))
-		highlighted_result = self._find_results[index]
-		# print("_highlight_entry %d : %s:%d:%d" % (index, highlighted_result.filename, highlighted_result.line_number, highlighted_result.start_char_index))
-		preview = open_file_in_view(highlighted_result.filename, 
-			highlighted_result.line_number,
-			highlighted_result.start_char_index,
-			True)
-		result_location = preview.text_point(highlighted_result.line_number-1, highlighted_result.start_char_index)
-		result_region = sublime.Region(result_location, result_location+highlighted_result.match_length)
-		preview.sel().add(result_region)
-
-
-	def _display_results_in_jump_list(self, symbol: str, locations: list):
-		self._find_results = locations
-		window = self.view.window()
 
-		items = []
-		for location in locations:
-			items.append(sublime.QuickPanelItem(
-				"{0}:{1}".format(os.path.basename(location.filename), location.line_number)))
-
-		# print("_display_results: num items = {0}".format(len(items)))
-		window.show_quick_panel(items=items,
-			on_select=self._select_entry,
-			on_highlight=self._highlight_entry, 
-			flags=sublime.KEEP_OPEN_ON_FOCUS_LOST, 
-			placeholder="[FastFind] found {0} occurrences of '{1}'".format(len(items), symbol))
-
-
-	def _open_basic_file(self, 
-		filename: str, 
-		line_number: int, 
-		char_index: int, 
-		preview_only: bool) -> sublime.View:
-		window = sublime.active_window()
-		flags = sublime.ENCODED_POSITION
-		if preview_only:
-			flags |= sublime.TRANSIENT
-		encoded_filename = "{0}:{1}:{2}".format(filename, line_number, char_index)
-		view = window.open_file(fname=encoded_filename,group=-1, flags=flags)
-		return view
 
+def preview_result(view: sublime.View, result: FastFindResult) -> sublime.View:
+	"""Show result in a transient view, reusing view when it already has the file open."""
+	if view is None or not view.is_valid() or view.is_loading() or view.file_name() != result.filename:
+		view = open_file_in_view(result.filename, result.line_number, result.start_char_index, True)
+		if view.is_loading():
+			# the encoded position already puts the caret on the match once the file is loaded
+			return view
+	result_location = view.text_point(result.line_number-1, result.start_char_index)
+	result_region = sublime.Region(result_location, result_location+result.match_length)
+	# replace the previous preview's selection instead of adding to it
+	view.sel().clear()
+	view.sel().add(result_region)
+	view.show_at_center(result_region)
+	return view
+
+
+# characters of the matched line shown before the match, and in total, in quick panel details
+LINE_TEXT_CONTEXT_CHARS = 40
+LINE_TEXT_DISPLAY_CHARS = 120
+
+def format_line_text(text: str, column: int, length: int) -> str:
+	"""The matched line as quick panel details, trimmed around the match and with the match in bold."""
+	begin = len(text) - len(text.lstrip())
+	if column - begin > LINE_TEXT_CONTEXT_CHARS:
+		begin = column - LINE_TEXT_CONTEXT_CHARS
+	end = min(len(text), begin + LINE_TEXT_DISPLAY_CHARS)
+	if begin >= end:
+		return ""
+	if column < begin or column >= end:
+		# the match is past the part of a long line that was kept
+		line = html.escape(text[begin:end])
+	else:
+		match_end = min(column + length, end)
+		line = "{0}<b>{1}</b>{2}".format(html.escape(text[begin:column]), html.escape(text[column:match_end]),
+			html.escape(text[match_end:end]))
+	if begin > len(text) - len(text.lstrip()):
+		line = "..." + line
+	if end < len(text):
+		line += "..."
+	return line
+
+
+RESULTS_VIEW_CHUNK_LINES = 2000
+
+# results views that are open, by view id, for double-click navigation
+_results_views = {}
+
+class FastFindResultsView:
+	"""A scratch view listing hits grouped by file, with their context lines.
+
+	The text comes from a FastFindResultsRenderer and is appended one chunk at a time as it
+	arrives. The layout is the one of Sublime's Find Results, so result_file_regex and
+	result_line_regex make next/previous result work, and double-clicking a line opens it
+	(see FastFindGotoResultCommand).
+	"""
+	def __init__(self, window: sublime.Window, symbol: str):
+		self.view = window.new_file()
+		self.view.set_name("FastFind: '{0}'".format(symbol))
+		self.view.set_scratch(True)
+		self.view.assign_syntax(FASTFIND_SYNTAX_FILE)
+		settings = self.view.settings()
+		settings.set("result_file_regex", RESULT_FILE_REGEX)
+		settings.set("result_line_regex", RESULT_LINE_REGEX)
+		settings.set("fastfind_results", True)
+		settings.set("word_wrap", False)
+		self.view.set_read_only(True)
+		self._region_flags = sublime.DRAW_NO_FILL if get_setting("display_outline", True) else 0
+		# where each appended chunk starts, its matches are the regions "fastfind_matches_<n>"
+		self._chunk_starts = []
+		# where each file header starts, in view order
+		self._file_starts = []
+		self._filenames = []
+		_results_views[self.view.id()] = self
+		self._append_text('FastFind results for "{0}"\n'.format(symbol))
+
+	def append(self, chunk: FastFindRenderedChunk) -> None:
+		if not self.view.is_valid():
+			return
+		offset = self.view.size()
+		self._append_text(chunk.text)
+		self.view.add_regions("fastfind_matches_{0}".format(len(self._chunk_starts)),
+			[sublime.Region(offset + begin, offset + end) for begin, end in chunk.matches],
+			"string", "", self._region_flags)
+		self._chunk_starts.append(offset)
+		for file_offset, filename in chunk.files:
+			self._file_starts.append(offset + file_offset)
+			self._filenames.append(filename)
+
+	def finish(self, summary: str) -> None:
+		if self.view.is_valid():
+			self._append_text("\n" + summary + "\n")
+
+	def result_at(self, point: int) -> tuple:
+		"""The (filename, line_number, column) of the line at point, or None if it isn't a hit."""
+		line = self.view.line(point)
+		match = re.match(r"^ +([0-9]+)[: ]", self.view.substr(line))
+		file_index = bisect.bisect_right(self._file_starts, line.a) - 1
+		if match is None or file_index < 0:
+			return None
+		# the first hit on the line, for context lines the start of the line
+		column = 1
+		chunk_index = bisect.bisect_right(self._chunk_starts, line.a) - 1
+		if chunk_index >= 0:
+			for region in self.view.get_regions("fastfind_matches_{0}".format(chunk_index)):
+				if line.contains(region.a):
+					# the line number and ": " come before the text, however many digits it has
+					column = region.a - line.a - (match.end() + 1) + 1
+					break
+		return self._filenames[file_index], int(match.group(1)), column
+
+	def _append_text(self, text: str) -> None:
+		self.view.run_command("append", {"characters": text, "force": True, "scroll_to_end": False})
+
+
+def show_results_in_view(window: sublime.Window, symbol: str, results: FastFindResultSet) -> FastFindResultsView:
+	"""List every result in a new results view, without context lines.
+
+	The text is rendered on a worker thread and appended a chunk at a time, so the UI thread
+	never has to do all of it at once.
+	"""
+	results_view = FastFindResultsView(window, symbol)
+
+	def render():
+		renderer = FastFindResultsRenderer(chunk_lines=RESULTS_VIEW_CHUNK_LINES)
+		count = len(results)
+		for start in range(0, count, RESULTS_VIEW_CHUNK_LINES):
+			renderer.add_results(results, start, min(start + RESULTS_VIEW_CHUNK_LINES, count))
+			for chunk in renderer.take_chunks():
+				sublime.set_timeout(lambda chunk=chunk: results_view.append(chunk), 0)
+		renderer.finish()
+		for chunk in renderer.take_chunks():
+			sublime.set_timeout(lambda chunk=chunk: results_view.append(chunk), 0)
+		summary = "{0} matches in {1} files".format(renderer.match_count, renderer.file_count)
+		sublime.set_timeout(lambda: results_view.finish(summary), 0)
+
+	threading.Thread(target=render).start()
+	return results_view
 
-	def _on_search_confirmed(self, symbol):
-		print("[FastFind] Searching for symbol '%s' in path '%s'" % (symbol, self._folder))
-		worker = FastFindSublimeWorker(
+
+#------------------------------------------------------------------------------
+class FastFindCommand(sublime_plugin.TextCommand):
+	def __init__(self, view: sublime.View):
+		self.view = view
+		if view is None:
+			print("[FastFind] No view opened - using active window instead")
+			self.view = sublime.active_window().view()
+			if self.view is None:
+				print("[FastFind] WHAT? Still no view???")
+
+		self._panel = FastFindResultsPanel(self.view)
+		self._folder = None
+		self._folders = []
+		self._engine_name = None
+		self._output = "quick_panel"
+		# a FastFindGitScope when only the files git lists for it are searched
+		self._scope = None
+		self._refresh_interval = 0
+		self._refresh_pending = False
+		self.workers = []
+		print("[FastFind] Loaded")
+
+	@property
+	def _search_history(self) -> FastFindHistoryStore:
+		return get_search_history(self.view.window())
+
+	def _start_worker(self, worker: FastFindSublimeWorker, priority: int = PRIORITY_INTERACTIVE) -> None:
+		self.workers.append(worker)
+		get_search_scheduler().submit(worker, priority, worker.dedupe_key())
+		self.view.set_status("FastFindSublime", "FastFind: searching for '{0}'...".format(worker._symbol))
+
+
+	def _on_search_progress(self, worker) -> None:
+		if worker not in self.workers or worker.cancelled:
+			return
+		self.view.set_status("FastFindSublime", "FastFind: searching for '{0}', {1}".format(
+			worker._symbol, worker._progress.describe()))
+
+
+	def _on_search_done(self, worker) -> None:
+		# stop accepting streamed batches, worker._output already holds every result
+		worker._on_results = None
+		if worker._results_view is not None and worker.cancelled:
+			worker._results_view.finish("Search cancelled")
+		if worker not in self.workers:
+			# replaced by a newer search, which cancelled it
+			return
+		self.workers.remove(worker)
+		end_search(self.view, worker._cancel_token)
+		if len(self.workers) == 0:
+			self.view.erase_status("FastFindSublime")
+		if worker.cancelled:
+			# superseded or cancelled searches never get to open a panel
+			get_stats_log().add(worker._stats)
+			return
+		queued = ""
+		if worker._stats.queue_ms >= QUEUE_WAIT_REPORT_MS:
+			queued = ", {0:.2f}s of it queued".format(worker._stats.queue_ms / 1000.0)
+		sublime.status_message("FastFind: '{0}' {1} in {2:.2f}s{3}".format(
+			worker._symbol, worker._progress.describe(), worker._elapsed + worker._stats.queue_ms / 1000.0, queued))
+		panel_start = time.perf_counter()
+		self._show_results(worker)
+		worker._stats.panel_ms = (time.perf_counter() - panel_start) * 1000.0
+		get_stats_log().add(worker._stats)
+
+
+	def _show_results(self, worker) -> None:
+		if worker._results_view is not None:
+			worker._results_view.finish("{0}{1} in {2:.2f}s".format(worker._progress.describe(),
+				" (stopped at the max_results limit)" if worker._truncated else "", worker._elapsed))
+		elif worker._revalidates is not None:
+			self._on_revalidated(worker)
+		else:
+			if worker._truncated:
+				print("[FastFind] Stopped searching for '%s' at %d results" % (worker._symbol, len(worker._output)))
+			if not self._panel.dismissed:
+				self._panel.show(worker._symbol, worker._output, truncated=worker._truncated)
+
+
+	def _on_results_rendered(self, worker, chunk: FastFindRenderedChunk) -> None:
+		if worker not in self.workers or worker.cancelled:
+			return
+		worker._results_view.append(chunk)
+
+
+	def _on_results_streamed(self, worker, batch: FastFindResultSet) -> None:
+		if worker not in self.workers or worker._on_results is None or worker.cancelled:
+			# the search finished (or was replaced) before this batch made it to the UI thread
+			return
+		self._panel.results.extend(batch)
+		self._refresh_streamed_results(worker)
+
+
+	def _refresh_streamed_results(self, worker) -> None:
+		if worker not in self.workers or worker._on_results is None or self._refresh_pending or self._panel.dismissed:
+			return
+		wait_ms = int((self._panel.last_refresh + self._refresh_interval - time.time()) * 1000)
+		if wait_ms > 0:
+			# throttle re-showing the panel, but make sure the latest batch eventually gets drawn
+			self._refresh_pending = True
+			sublime.set_timeout(lambda: self._on_refresh_timeout(worker), wait_ms)
+			return
+		self._panel.show(worker._symbol, self._panel.results, searching=True, truncated=worker._truncated)
+
+
+	def _on_refresh_timeout(self, worker) -> None:
+		self._refresh_pending = False
+		self._refresh_streamed_results(worker)
+
+
+	def _make_cache_key(self, symbol: str) -> tuple:
+		return FastFindResultCache.make_key(symbol, self._folders, self._case_sensitive,
+			get_setting("file_type_pattern"),
+			get_setting("non_std_file_type_pattern"),
+			get_setting("before_context"),
+			get_setting("after_context"),
+			self._engine_name,
+			get_setting("max_results_per_file", 0),
+			get_setting("ignore_folders", []))
+
+
+	def _revalidate_cached_search(self, symbol: str, cache_key: tuple, cached, cancel_token: FastFindCancelToken) -> None:
+		# runs on its own thread, checking the mtimes can mean thousands of stat calls
+		if not get_result_cache().is_stale(cached):
+			print("[FastFind] Cached results for '%s' are up to date" % symbol)
+			sublime.set_timeout(lambda: end_search(self.view, cancel_token), 0)
+			return
+		sublime.set_timeout(lambda: self._rerun_cached_search(symbol, cache_key, cached, cancel_token), 0)
+
+
+	def _rerun_cached_search(self, symbol: str, cache_key: tuple, cached, cancel_token: FastFindCancelToken) -> None:
+		if cancel_token.cancelled or self._panel.results is not cached.results:
+			# another search has replaced the cached one in the meantime
+			return
+		print("[FastFind] Files changed since '%s' was cached, searching again" % symbol)
+		worker = self._make_worker(symbol, None, cache_key, cancel_token)
+		worker._revalidates = cached.results
+		# the cached results are already showing, a search the user is waiting for goes first
+		self._start_worker(worker, PRIORITY_BACKGROUND)
+
+
+	def _on_revalidated(self, worker) -> None:
+		if not worker._results_changed:
+			return
+		if self._panel.results is worker._revalidates and not self._panel.dismissed:
+			# fresh results differ, swap them into the panel the user is looking at
+			self._panel.show(worker._symbol, worker._output, truncated=worker._truncated)
+
+
+	def _make_worker(self, symbol: str, on_results, cache_key: tuple, cancel_token: FastFindCancelToken, on_rendered=None) -> FastFindSublimeWorker:
+		return FastFindSublimeWorker(
 				view = self.view,
-				platform = sublime.platform(),
-				root = self._root,
 				symbol = symbol,
-				folder = self._folder,
-				executable = self._executable,
-				case_sensitive = self._case_sensitive)
-		worker.start()
-		self.workers.append(worker)
-		self._update_status(self.workers, symbol, True)
+				folders = self._folders,
+				case_sensitive = self._case_sensitive,
+				settings = get_fastfind_settings(),
+				on_results = on_results,
+				cache_key = cache_key,
+				cancel_token = cancel_token,
+				max_results = get_setting("max_results", 0),
+				engine = self._engine_name,
+				on_progress = self._on_search_progress,
+				on_done = self._on_search_done,
+				on_rendered = on_rendered,
+				scope = self._scope,
+				history = self._search_history)
+
 
+	def _on_search_confirmed(self, symbol):
+		print("[FastFind] Searching for symbol '%s' in path '%s'" % (symbol, self._folder))
+		setup_start = time.perf_counter()
+		self._panel.reset()
+		self._refresh_interval = get_setting("stream_refresh_ms", 250) / 1000.0
+		self._refresh_pending = False
+		cancel_token = begin_search(self.view)
+
+		cache_key = self._make_cache_key(symbol)
+		if self._scope is not None:
+			# revalidating only notices changes to files with hits, a file can enter the scope
+			# without that, so scoped searches are neither cached nor served from the cache
+			cache_key = None
+		if self._output == "view":
+			# cached results have no context lines, the results view always comes from a fresh search
+			worker = self._make_worker(symbol, None, cache_key, cancel_token, self._on_results_rendered)
+			worker._results_view = FastFindResultsView(self.view.window() or sublime.active_window(), symbol)
+			worker._stats.setup_ms = (time.perf_counter() - setup_start) * 1000.0
+			self._start_worker(worker)
+			return
+
+		cached = get_result_cache().get(cache_key) if cache_key is not None else None
+		if cached is not None:
+			# show the last results straight away, then check whether they are still current
+			print("[FastFind] Using cached results for '%s'" % symbol)
+			self._panel.show(symbol, cached.results)
+			threading.Thread(target=self._revalidate_cached_search, args=(symbol, cache_key, cached, cancel_token)).start()
+			return
+
+		on_results = None
+		if get_setting("stream_results", True):
+			on_results = self._on_results_streamed
+		worker = self._make_worker(symbol, on_results, cache_key, cancel_token)
+		worker._stats.setup_ms = (time.perf_counter() - setup_start) * 1000.0
+		self._start_worker(worker)
+
+
+	def _search_all_folders(self, all_folders) -> bool:
+		if all_folders is None:
+			all_folders = get_setting("search_all_folders", False)
+		window = self.view.window() or sublime.active_window()
+		return bool(all_folders) and len(window.folders()) > 0
+
+
+	def get_search_folders(self, args: dict) -> list:
+		"""The folders a search with these command args would cover, if already known."""
+		if self._search_all_folders(args.get("all_folders")):
+			return (self.view.window() or sublime.active_window()).folders()
+		if "folder" in args:
+			return [os.path.expandvars(args["folder"])]
+		folder_path = get_default_search_folder()
+		if folder_path is not None:
+			return [folder_path]
+		return []
+
+
+	def get_search_scope(self, args: dict) -> FastFindGitScope:
+		"""The scope a search with these command args is limited to, None for whole folders."""
+		try:
+			return make_search_scope(args.get("scope"), args.get("ref"))
+		except ValueError:
+			return None
 
 	def input(self, args):
+		if args.get("scope") == "since" and "ref" not in args:
+			# asked first, so a live search already knows it
+			return RefInputHandler()
+
 		if "search_term" not in args:
-			return SearchTermInputHandler()
+			return SearchTermInputHandler(self, args)
 
-		if "folder" not in args:
+		if "folder" not in args and not self._search_all_folders(args.get("all_folders")):
 			return FolderInputHandler()
 
 
-	def run(self, _, case_sensitive, folder, search_term):
+	def _set_search_folders(self, folder, all_folders) -> None:
+		if self._search_all_folders(all_folders):
+			# search every root of the window, each one sharded separately
+			self._folders = (self.view.window() or sublime.active_window()).folders()
+			self._folder = ", ".join(self._folders)
+		else:
+			self._folder = os.path.expandvars(folder)
+			self._folders = [self._folder]
+
+
+	def run(self, _, case_sensitive=False, folder=None, search_term=None, all_folders=None, engine=None, output=None, scope=None, ref=None):
 		self._case_sensitive = case_sensitive
-		self._folder = os.path.expandvars(folder)
+		# "tracked", "modified" or "since" (with ref) only search the files git lists for them
+		try:
+			self._scope = make_search_scope(scope, ref)
+		except ValueError as e:
+			sublime.error_message("FastFind ERROR: {0}".format(e))
+			return
+		# an engine passed to the command wins over the search_engine setting for this search
+		self._engine_name = engine or get_setting("search_engine", "rg")
+		# where the results go, "quick_panel" or "view", the same way
+		self._output = output or get_setting("results_output", "quick_panel")
+		self._set_search_folders(folder, all_folders)
 		# print("FastFind search path: ",self._folder)
 		# print("FastFind search term: ",search_term)
 		# print("FastFind case_sensitive: ",case_sensitive)
 
-		if self.view is not None:
-			self._current_position = self.view.sel()[0]
-			self._saved_viewport_pos = self.view.viewport_position()
-		else:
-			self._current_position = None
-			self._saved_viewport_pos = None
-
-		self._executable = get_setting("executable")
+		self._panel.save_position()
 
 		self.workers = []
 		self._on_search_confirmed(search_term)
 
 
 
+class FastFindBatchCommand(FastFindCommand):
+	"""Search for several terms in one run of the engine (rg gets one -e per term), so the tree
+	is walked and read once, then file the hits under each term in the search history."""
+	def __init__(self, view: sublime.View):
+		super(FastFindBatchCommand, self).__init__(view)
+		self._terms = ()
+		self._term_results = {}
+
+
+	def input(self, args):
+		if "terms" not in args:
+			return BatchTermsInputHandler()
+
+		if "folder" not in args and not self._search_all_folders(args.get("all_folders")):
+			return FolderInputHandler()
+
+
+	def run(self, _, terms=None, case_sensitive=False, folder=None, all_folders=None, engine=None):
+		self._terms = parse_batch_terms(terms or ())
+		if len(self._terms) == 0:
+			sublime.status_message("FastFind: no search terms given")
+			return
+		self._case_sensitive = case_sensitive
+		self._engine_name = engine or get_setting("search_engine", "rg")
+		self._set_search_folders(folder, all_folders)
+		self._panel.save_position()
+		self.workers = []
+
+		print("[FastFind] Batch search for %s in path '%s'" % (", ".join(self._terms), self._folder))
+		self._panel.reset()
+		cancel_token = begin_search(self.view)
+		# batches aren't cached, a term searched for on its own later has its own cache entry
+		worker = self._make_worker(", ".join(self._terms), None, None, cancel_token)
+		worker._search_terms = self._terms
+		self._start_worker(worker)
+
+
+	def _show_results(self, worker) -> None:
+		if worker._term_results is None:
+			# the search failed before its results could be split up
+			return
+		self._term_results = worker._term_results
+
+		summary = "FastFind: {0} terms, {1}{2} hits in {3:.2f}s".format(
+			len(self._terms), len(worker._output), "+" if worker._truncated else "", worker._elapsed)
+		# only terms searched for on their own before have a time to compare with
+		sequential_ms, timed = estimate_sequential_ms(self._terms, worker._folders,
+			worker._engine.name, get_stats_log().entries())
+		if timed == len(self._terms):
+			summary += ", about {0:.2f}s saved over separate searches".format(
+				max(0.0, sequential_ms / 1000.0 - worker._elapsed))
+		elif timed > 0:
+			summary += ", separate searches for {0} of the {1} terms took {2:.2f}s".format(
+				timed, len(self._terms), sequential_ms / 1000.0)
+		print("[FastFind] " + summary)
+		sublime.status_message(summary)
+
+		items = []
+		for term in self._terms:
+			items.append(sublime.QuickPanelItem(term, annotation="{0} results".format(len(self._term_results[term]))))
+		self.view.window().show_quick_panel(
+			items=items,
+			on_select=self._on_term_selected,
+			placeholder=summary)
+
+
+	def _on_term_selected(self, index: int) -> None:
+		if index < 0:
+			return
+		term = self._terms[index]
+		self._panel.reset()
+		# a quick panel can't be shown from the on_select of another one
+		sublime.set_timeout(lambda: self._panel.show(term, self._term_results[term]), 0)
+
+
+class BatchTermsInputHandler(sublime_plugin.TextInputHandler):
+	def name(self):
+		return "terms"
+
+	def placeholder(self):
+		return "Search Terms"
+
+	def preview(self, text):
+		return "{0} terms, searched for in one pass".format(len(parse_batch_terms(text)))
+
+	def description(self, text):
+		return "Enter search terms separated by spaces"
+
+
+class FastFindCancelSearchCommand(sublime_plugin.TextCommand):
+	def run(self, _):
+		if cancel_search(self.view):
+			self.view.erase_status("FastFindSublime")
+			sublime.status_message("FastFind: search cancelled")
+
+	def is_enabled(self):
+		return self.view.id() in _active_searches
+
+
+class FastFindShowStatsCommand(sublime_plugin.TextCommand):
+	def run(self, _):
+		window = self.view.window() or sublime.active_window()
+		view = window.new_file()
+		view.set_name("FastFind Search Stats")
+		view.set_scratch(True)
+		view.settings().set("word_wrap", False)
+		view.run_command("append", {"characters": format_report(get_stats_log().entries())})
+		view.set_read_only(True)
+
+
+class FastFindRebuildIndexCommand(sublime_plugin.TextCommand):
+	def run(self, _):
+		folders = list(self.view.window().folders())
+		if len(folders) == 0 and get_default_search_folder() is not None:
+			folders = [get_default_search_folder()]
+		settings = get_fastfind_settings()
+		threading.Thread(target=self._rebuild, args=(folders, settings)).start()
+
+	def _rebuild(self, folders: list, settings: FastFindSettings) -> None:
+		for folder in folders:
+			_index_registry.get(folder, settings, rebuild=True)
+
+
+class FastFindIndexListener(sublime_plugin.EventListener):
+	def on_post_save_async(self, view):
+		filename = view.file_name()
+		if filename is None:
+			return
+		_index_registry.update_file(filename)
+		# revalidating only stats the files that had hits, the saved file may have gained its first
+		if get_result_cache().discard_folder_of(filename) > 0:
+			print("[FastFind] Dropped cached results covering '%s'" % filename)
+
+
+class FastFindGotoResultCommand(sublime_plugin.TextCommand):
+	"""Open the hit on the results view line that was double-clicked (or holds the caret)."""
+	def run(self, _, event=None):
+		results_view = _results_views.get(self.view.id())
+		if results_view is None:
+			return
+		if event is not None:
+			point = self.view.window_to_text((event["x"], event["y"]))
+		else:
+			point = self.view.sel()[0].b
+		result = results_view.result_at(point)
+		if result is None:
+			return
+		filename, line_number, column = result
+		view = open_file_in_view(filename, line_number, column, False)
+		(self.view.window() or sublime.active_window()).focus_view(view)
+
+	def want_event(self):
+		return True
+
+
+class FastFindResultsViewListener(sublime_plugin.EventListener):
+	def on_text_command(self, view, command_name, args):
+		# a double click selects a word, in a results view it opens the hit instead
+		if command_name == "drag_select" and args is not None and args.get("by") == "words" and view.settings().get("fastfind_results", False):
+			return ("fast_find_goto_result", {"event": args.get("event")})
+		return None
+
+	def on_close(self, view):
+		_results_views.pop(view.id(), None)
+
+
 class FastFindClearHistoryCommand(sublime_plugin.TextCommand):
 	def run(self, _):
-		self._search_history = load_history_from_file()
-		self._search_history.clear()
-		save_history_to_file(self._search_history)
+		get_search_history(self.view.window()).clear()
 
 
 class FastFindShowHistoryCommand(sublime_plugin.TextCommand):
 	def __init__(self, view):
 		self.view = view
-		self._search_history = load_history_from_file()
+		self._panel = FastFindResultsPanel(view)
+
+	@property
+	def _search_history(self) -> FastFindHistoryStore:
+		return get_search_history(self.view.window())
 
 	def run(self, _):
-		if self.view is not None:
-			self._current_position = self.view.sel()[0]
-			self._saved_viewport_pos = self.view.viewport_position()
-		else:
-			self._current_position = None
-			self._saved_viewport_pos = None
-		self._search_history = load_history_from_file()
+		self._panel.save_position()
 		self.show_search_history_in_jumplist()
 
 
@@ -502,10 +1403,10 @@ class FastFindShowHistoryCommand(sublime_plugin.TextCommand):
 		window = self.view.window()
 		items = []
 		# self._log(search_history)
-		for search_term, search_results in self._search_history.items():
+		for search_term in self._search_history.keys():
 			self._log("Search term = " + search_term)
 			items.append(sublime.QuickPanelItem(search_term,
-				annotation="{0} results".format(len(search_results))))
+				annotation="{0} results".format(self._search_history.result_count(search_term))))
 
 		window.show_quick_panel(
 			items=items,
@@ -514,63 +1415,18 @@ class FastFindShowHistoryCommand(sublime_plugin.TextCommand):
 
 
 	def _select_search_history_entry(self, index: int) -> None:
-		if index >= 0:
-			search_term = get_nth_key(self._search_history, index)
-			selected_entry = self._search_history[search_term]
-			self._display_results_in_jump_list(search_term, selected_entry)
-
-
-	def _select_entry(self, index: int) -> None:
 		if index < 0:
-			# cancelled, return to saved position
-			if self.view is None:
-				self.view = sublime.active_window().view()
-				if self.view is None:
-					print("[FastFindShowHistory] view is still none!!")
-
-			if self.view.window() is None:
-				sublime.active_window().focus_view(self.view)
-			else:
-				self.view.window().focus_view(self.view)
-
-			self.view.sel().clear()
-			self.view.sel().add(self._current_position)
-			self.view.set_viewport_position(self._saved_viewport_pos, animate=True)
-		else:
-			selected_entry = self._find_results[index]
-			# print("_select_entry %d: %s:%d:%d" % (index, selected_entry.filename, selected_entry.line_number, selected_entry.start_char_index))
-			view = open_file_in_view(selected_entry.filename,
-				selected_entry.line_number,
-				selected_entry.start_char_index+1,
-				False)
-			sublime.active_window().focus_view(view)
-
-
-	def _highlight_entry(self, index: int) -> None:
-		# print("_highlight_entry called with index = {0}".format(index))
-		highlighted_result = self._find_results[index]
-		# print("_highlight_entry %d : %s:%d:%d" % (index, highlighted_result.filename, highlighted_result.line_number, highlighted_result.start_char_index))
-		preview = open_file_in_view(highlighted_result.filename, 
-			highlighted_result.line_number,
-			highlighted_result.start_char_index,
-			True)
-		result_location = preview.text_point(highlighted_result.line_number-1, highlighted_result.start_char_index)
-		result_region = sublime.Region(result_location, result_location+highlighted_result.match_length)
-		preview.sel().add(result_region)
-
-
-	def _display_results_in_jump_list(self, symbol: str, locations: list):
-		self._find_results = locations
-		window = self.view.window()
+			return
+		search_term = get_nth_key(self._search_history, index)
+		self._panel.reset()
+		# reading and decoding the stored results takes as long as there are results
+		threading.Thread(target=self._load_search_history_entry, args=(self._search_history, search_term)).start()
 
-		items = []
-		for location in locations:
-			items.append(sublime.QuickPanelItem(
-				"{0}:{1}".format(os.path.basename(location.filename), location.line_number)))
-
-		# print("_display_results: num items = {0}".format(len(items)))
-		window.show_quick_panel(items=items,
-			on_select=self._select_entry,
-			on_highlight=self._highlight_entry, 
-			flags=sublime.KEEP_OPEN_ON_FOCUS_LOST, 
-			placeholder="FastFind found {0} occurrences of '{1}'".format(len(items), symbol))
\ No newline at end of file
+	def _load_search_history_entry(self, search_history: FastFindHistoryStore, search_term: str) -> None:
+		try:
+			selected_entry = search_history[search_term]
+		except KeyError:
+			# dropped from the history, by another window, since the list was shown
+			return
+		# shown from a fresh dispatch, a quick panel can't be shown from the on_select of another one
+		sublime.set_timeout(lambda: self._panel.show(search_term, selected_entry), 0)
@@ -0,0 +1 @@
+# Parts of FastFind that don't depend on the Sublime Text API
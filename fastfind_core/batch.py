@@ -0,0 +1,77 @@
+import re
+
+from .results import FastFindResultSet
+
+#------------------------------------------------------------------------------
+def parse_batch_terms(terms) -> tuple:
+	"""The distinct terms of a batch search, in order, from a list or a whitespace separated string."""
+	if isinstance(terms, str):
+		terms = terms.split()
+	unique = []
+	for term in terms:
+		if term != "" and term not in unique:
+			unique.append(term)
+	return tuple(unique)
+
+
+def compile_term_pattern(term: str, case_sensitive: bool):
+	"""term compiled with Python's re to match against line texts, None when re can't compile it."""
+	try:
+		return re.compile(term, 0 if case_sensitive else re.IGNORECASE)
+	except re.error:
+		return None
+
+
+#------------------------------------------------------------------------------
+def split_results_by_term(results: FastFindResultSet, terms: tuple, case_sensitive: bool) -> dict:
+	"""File the hits of a batch search under the terms they belong to, as term -> FastFindResultSet.
+
+	The engine reports the text that matched but not which term matched it. A hit belongs to
+	every term that matches the line at the hit's column, so overlapping terms ("foo" and
+	"foo_bar") both get it, each with the length of its own match. Hits that no term can be
+	matched to (a pattern Python's re can't compile, or a hit past the part of the line that is
+	kept) go to the first term re can't compile, or else the first term. A hit of one term that
+	starts inside the hit of another isn't reported by the engine at all, so it is missing.
+	"""
+	patterns = [(term, compile_term_pattern(term, case_sensitive)) for term in terms]
+	fallback = next((term for term, pattern in patterns if pattern is None), terms[0])
+	patterns = [(term, pattern) for term, pattern in patterns if pattern is not None]
+	# the rows of each term and their match lengths, the sets are built once at the end
+	rows = {term: ([], []) for term in terms}
+	for index in range(len(results)):
+		column = results.column(index)
+		line_text = results.line_text(index)
+		found = False
+		for term, pattern in patterns:
+			match = pattern.match(line_text, column)
+			if match is not None and match.end() > column:
+				indices, lengths = rows[term]
+				indices.append(index)
+				lengths.append(match.end() - column)
+				found = True
+		if not found:
+			indices, lengths = rows[fallback]
+			indices.append(index)
+			lengths.append(results.match_length(index))
+	return {term: results.select(indices, lengths) for term, (indices, lengths) in rows.items()}
+
+
+def estimate_sequential_ms(terms: tuple, folders: list, engine: str, logged: list) -> tuple:
+	"""How long the terms' earlier single-term searches took together, as (milliseconds, terms timed).
+
+	Only terms that were searched for on their own before (same folders and engine, in the
+	logged FastFindSearchStats) are counted, with the time of their latest such search.
+	Terms without one add nothing, whoever shows the estimate should say how many were timed.
+	"""
+	latest = {}
+	for stats in logged:
+		if stats.cancelled or stats.truncated or stats.engine != engine or stats.folders != list(folders):
+			continue
+		latest[stats.search_term] = stats.total_ms
+	estimate = 0.0
+	timed = 0
+	for term in terms:
+		if term in latest:
+			estimate += latest[term]
+			timed += 1
+	return estimate, timed
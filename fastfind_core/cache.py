@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import OrderedDict
+
+from .osutil import is_in_folder, stat_mtime
+from .results import FastFindResultSet
+from .settings import ignore_folder_patterns
+
+#------------------------------------------------------------------------------
+class CachedSearch:
+	"""Results of one search plus the mtimes of everything they were read from."""
+	__slots__ = ("results", "mtimes")
+
+	def __init__(self, results: FastFindResultSet, mtimes: dict):
+		self.results = results
+		self.mtimes = mtimes
+
+
+#------------------------------------------------------------------------------
+class FastFindResultCache:
+	"""LRU cache of search results, validated against file and directory mtimes.
+
+	A cached search records the mtime of every file with a hit, of the directories those files
+	live in up to the search folders, and of the search folders themselves. The entry is stale
+	as soon as any of them changes: a hit file was edited, or a file was added, removed or
+	renamed next to one. An edit that adds a first hit to a file nothing matched before changes
+	none of them, the plugin drops the entries covering a file when it is saved instead (see
+	discard_folder_of), edits made outside Sublime are not seen until one of those directories
+	changes too.
+	"""
+	def __init__(self, max_entries: int = 32):
+		self._max_entries = max_entries
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	@staticmethod
+	def make_key(search_term: str, folders: list, case_sensitive: bool, file_types: list, non_std_file_types: list,
+		before_context: int, after_context: int, engine: str = "rg", max_per_file: int = 0, ignore_folders: list = None) -> tuple:
+		# ignored folders change which files are searched without changing any file in the results
+		return (search_term, tuple(os.path.normpath(folder) for folder in folders), bool(case_sensitive),
+			tuple(file_types or ()), tuple(non_std_file_types or ()),
+			int(before_context), int(after_context), engine, int(max_per_file or 0),
+			tuple(sorted(set(ignore_folder_patterns(ignore_folders)))))
+
+	def get(self, key: tuple) -> CachedSearch:
+		with self._lock:
+			cached = self._entries.get(key)
+			if cached is not None:
+				self._entries.move_to_end(key)
+			return cached
+
+	def put(self, key: tuple, results: FastFindResultSet) -> CachedSearch:
+		"""Cache results for key. Stats every file involved, so call it off the UI thread."""
+		cached = CachedSearch(results, self.snapshot(key[1], results))
+		if self._max_entries <= 0:
+			return cached
+		with self._lock:
+			self._entries[key] = cached
+			self._entries.move_to_end(key)
+			while len(self._entries) > self._max_entries:
+				self._entries.popitem(last=False)
+		return cached
+
+	def discard(self, key: tuple) -> None:
+		with self._lock:
+			self._entries.pop(key, None)
+
+	def discard_folder_of(self, filename: str) -> int:
+		"""Drop every entry whose search folders contain filename, returning how many."""
+		with self._lock:
+			keys = [key for key in self._entries
+				if any(is_in_folder(filename, folder) for folder in key[1])]
+			for key in keys:
+				del self._entries[key]
+		return len(keys)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+
+	def is_stale(self, cached: CachedSearch) -> bool:
+		for path, mtime in cached.mtimes.items():
+			if stat_mtime(path) != mtime:
+				return True
+		return False
+
+	@staticmethod
+	def snapshot(folders: tuple, results: FastFindResultSet) -> dict:
+		paths = set(folders)
+		for filename in results.filenames():
+			# rg reports paths relative to the search folder only when that folder was relative
+			path = os.path.normpath(os.path.join(folders[0], filename))
+			paths.add(path)
+			directory = os.path.dirname(path)
+			while directory not in paths and any(is_in_folder(directory, folder) for folder in folders):
+				paths.add(directory)
+				directory = os.path.dirname(directory)
+		return {path: stat_mtime(path) for path in paths}
@@ -0,0 +1,49 @@
+import threading
+
+#------------------------------------------------------------------------------
+class FastFindCancelToken:
+	"""Shared between a search and whoever may want to stop it.
+
+	Processes started for the search are registered with the token, cancel() terminates them
+	so the parser reading their output sees EOF right away. Work that hasn't started yet
+	checks cancelled before starting.
+	"""
+	def __init__(self):
+		self._cancelled = threading.Event()
+		self._lock = threading.Lock()
+		self._processes = []
+
+	@property
+	def cancelled(self) -> bool:
+		return self._cancelled.is_set()
+
+	def cancel(self) -> None:
+		with self._lock:
+			self._cancelled.set()
+			processes = self._processes
+			self._processes = []
+		for process in processes:
+			terminate_process(process)
+
+	def register(self, process) -> bool:
+		"""Track a process for the search, returning False if it was cancelled already."""
+		with self._lock:
+			if not self._cancelled.is_set():
+				self._processes.append(process)
+				return True
+		terminate_process(process)
+		return False
+
+	def unregister(self, process) -> None:
+		with self._lock:
+			if process in self._processes:
+				self._processes.remove(process)
+
+
+#------------------------------------------------------------------------------
+def terminate_process(process) -> None:
+	try:
+		process.terminate()
+	except OSError:
+		# it already exited
+		pass
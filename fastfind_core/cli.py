@@ -0,0 +1,260 @@
+"""Run many searches outside Sublime and write their results and timings as JSON lines.
+
+Queries are read one per line, either a plain search term or a JSON object such as
+{"term": "foo", "case_sensitive": true, "folders": ["src"], "engine": "git_grep"}, where
+term may also be a list of terms for a batch search and "scope" (with "ref") limits the
+search to tracked, modified or changed files as in the plugin. Every query gets one output line, in
+input order, with its result count, return code and the phase timings of FastFind's
+search stats. The log FastFind prints while searching goes to stderr.
+
+    python -m fastfind_core queries.txt --folder ~/src/tree --concurrency 4 > runs.jsonl
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import threading
+import concurrent.futures
+
+from .cancel import FastFindCancelToken
+from .engines import make_search_engines
+from .filelist import FastFindFileListRegistry
+from .gitscope import SEARCH_SCOPES, FastFindGitScope, FastFindGitScopeCache
+from .index import FastFindIndexRegistry
+from .search import FastFindSearchRunner
+from .settings import FastFindSettings, load_settings_file
+from .stats import percentile
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+#------------------------------------------------------------------------------
+class FastFindQuery:
+	"""One line of the queries file, with the command line options filling in what it leaves out."""
+	def __init__(self, line_number: int, term, folders: list, case_sensitive: bool, engine: str, max_results: int,
+			scope: str = None, ref: str = None):
+		self.line_number = line_number
+		self.term = term
+		self.folders = folders
+		self.case_sensitive = case_sensitive
+		self.engine = engine
+		self.max_results = max_results
+		self.scope = scope
+		self.ref = ref
+
+	def to_dict(self) -> dict:
+		return {
+			"line": self.line_number,
+			"term": self.term if isinstance(self.term, str) else list(self.term),
+			"folders": self.folders,
+			"case_sensitive": self.case_sensitive,
+			"engine": self.engine,
+			"scope": self.scope,
+			"ref": self.ref,
+		}
+
+
+def parse_queries(lines, defaults: dict) -> list:
+	"""The queries in lines, skipping blank lines and lines starting with #."""
+	queries = []
+	for line_number, line in enumerate(lines, 1):
+		line = line.rstrip("\r\n")
+		if line.strip() == "" or line.startswith("#"):
+			continue
+		values = dict(defaults)
+		if line.lstrip().startswith("{"):
+			try:
+				query = json.loads(line)
+			except ValueError as e:
+				raise ValueError("line {0}: {1}".format(line_number, e))
+			values.update((key, query[key]) for key in defaults if key in query)
+			values["term"] = query.get("term", "")
+		else:
+			values["term"] = line
+		term = values["term"]
+		if not isinstance(term, str):
+			term = tuple(term)
+		folders = [os.path.abspath(os.path.expanduser(folder)) for folder in values["folders"]]
+		queries.append(FastFindQuery(line_number, term, folders, bool(values["case_sensitive"]),
+			values["engine"], int(values["max_results"]), values["scope"], values["ref"]))
+	return queries
+
+
+#------------------------------------------------------------------------------
+class FastFindReplaySearch(FastFindSearchRunner):
+	"""A search whose errors are kept for its output line instead of printed."""
+	def __init__(self, *args, **kwargs):
+		super(FastFindReplaySearch, self).__init__(*args, **kwargs)
+		self.errors = []
+
+	def _report_error(self, message: str) -> None:
+		self.errors.append(message)
+
+
+class FastFindReplay:
+	"""Runs queries on a pool of threads, each one search with its own cancel token."""
+	def __init__(self, settings: FastFindSettings, engines: dict, include_hits: bool = False):
+		self._settings = settings
+		self._engines = engines
+		self._include_hits = include_hits
+		self._scope_cache = FastFindGitScopeCache()
+		self._cancel_tokens = set()
+		self._lock = threading.Lock()
+
+	def run(self, query: FastFindQuery, queued: float) -> dict:
+		output = query.to_dict()
+		output["wait_ms"] = (time.time() - queued) * 1000.0
+		engine = self._engines.get(query.engine)
+		if engine is None:
+			output["error"] = "unknown engine '{0}'".format(query.engine)
+			return output
+		scope = None
+		if query.scope is not None and query.scope != "all":
+			try:
+				scope = FastFindGitScope(query.scope, query.ref, self._scope_cache)
+			except ValueError as e:
+				output["error"] = str(e)
+				return output
+		cancel_token = FastFindCancelToken()
+		with self._lock:
+			self._cancel_tokens.add(cancel_token)
+		runner = FastFindReplaySearch(query.term, query.folders, query.case_sensitive, self._settings, engine,
+			cancel_token, query.max_results, scope)
+		try:
+			results = runner.search()
+		finally:
+			with self._lock:
+				self._cancel_tokens.discard(cancel_token)
+		output["results"] = len(results)
+		output["files"] = len(set(results.filename(index) for index in range(len(results))))
+		output["returncode"] = runner._returncode
+		output["truncated"] = runner._truncated
+		if len(runner.errors) > 0:
+			output["error"] = runner.errors[0]
+		stats = runner._stats.to_dict()
+		for key in ("search_term", "engine", "folders", "results", "truncated", "returncode"):
+			del stats[key]
+		output["stats"] = stats
+		if runner._term_results is not None:
+			output["term_results"] = {term: len(term_results) for term, term_results in runner._term_results.items()}
+		if self._include_hits:
+			output["hits"] = [[results.filename(index), results.line_number(index), results.column(index),
+				results.match_length(index), results.line_text(index)] for index in range(len(results))]
+		return output
+
+	def cancel_all(self) -> None:
+		with self._lock:
+			cancel_tokens = list(self._cancel_tokens)
+		for cancel_token in cancel_tokens:
+			cancel_token.cancel()
+
+
+#------------------------------------------------------------------------------
+def make_settings(args) -> FastFindSettings:
+	values = load_settings_file(args.settings)
+	# a history file or cached results have no meaning for a one-off process
+	values["history_file"] = None
+	for assignment in args.set:
+		key, _, value = assignment.partition("=")
+		try:
+			values[key] = json.loads(value)
+		except ValueError:
+			values[key] = value
+	if args.executable is not None:
+		values["executable"] = args.executable
+	return FastFindSettings(values)
+
+
+def summarize(outputs: list, elapsed: float) -> str:
+	completed = [output for output in outputs if "stats" in output and not output["stats"]["cancelled"]]
+	lines = ["{0} queries in {1:.2f}s, {2} failed".format(len(outputs), elapsed,
+		len([output for output in outputs if "error" in output or output.get("returncode") == 2]))]
+	for field in ("wait_ms", "total_ms"):
+		values = [output.get(field, output.get("stats", {}).get(field)) for output in completed]
+		values = [value for value in values if value is not None]
+		if len(values) > 0:
+			lines.append("{0:<10} p50 {1:.1f}  p90 {2:.1f}  p99 {3:.1f}  max {4:.1f}".format(field,
+				percentile(values, 0.5), percentile(values, 0.9), percentile(values, 0.99), max(values)))
+	return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+	parser = argparse.ArgumentParser(prog="python -m fastfind_core", description=__doc__,
+		formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("queries", nargs="?", default="-", help="file with one query per line, - for stdin")
+	parser.add_argument("--folder", action="append", default=[], help="folder to search, repeat for several (default: the current directory)")
+	parser.add_argument("--engine", help="search engine, default the settings' search_engine")
+	parser.add_argument("--case-sensitive", action="store_true")
+	parser.add_argument("--scope", choices=SEARCH_SCOPES, help="only search the files git lists as tracked, modified or changed since --ref")
+	parser.add_argument("--ref", help="revision for --scope since")
+	parser.add_argument("--max-results", type=int, default=0, help="stop each search after this many hits, 0 for no limit")
+	parser.add_argument("--concurrency", type=int, default=1, help="queries searched at the same time")
+	parser.add_argument("--settings", default=os.path.join(PACKAGE_DIR, "fastfind.sublime-settings"),
+		help="sublime-settings file to take FastFind settings from")
+	parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+		help="override a setting (without the FastFindSublime_ prefix), VALUE is JSON or a plain string")
+	parser.add_argument("--executable", help="rg executable, overriding the settings")
+	parser.add_argument("--cache-dir", help="keep trigram indexes and file lists here, enabling the index engine and file_list_cache")
+	parser.add_argument("--hits", action="store_true", help="include every hit in the output")
+	parser.add_argument("--output", default="-", help="file to write JSON lines to, - for stdout")
+	parser.add_argument("--quiet", action="store_true", help="don't log searches to stderr")
+	args = parser.parse_args(argv)
+
+	settings = make_settings(args)
+	defaults = {
+		"folders": args.folder if len(args.folder) > 0 else [os.getcwd()],
+		"case_sensitive": args.case_sensitive,
+		"engine": args.engine or settings.get("search_engine", "rg"),
+		"max_results": args.max_results,
+		"scope": args.scope,
+		"ref": args.ref,
+	}
+	try:
+		if args.queries == "-":
+			queries = parse_queries(sys.stdin, defaults)
+		else:
+			with open(args.queries, encoding="utf8") as queries_file:
+				queries = parse_queries(queries_file, defaults)
+	except (OSError, ValueError) as e:
+		print("fastfind: can't read queries: {0}".format(e), file=sys.stderr)
+		return 2
+
+	index_registry = None
+	file_lists = None
+	if args.cache_dir is not None:
+		index_registry = FastFindIndexRegistry(os.path.join(args.cache_dir, "indexes"))
+		file_lists = FastFindFileListRegistry(os.path.join(args.cache_dir, "filelists"))
+	engines = make_search_engines(index_registry, file_lists=file_lists)
+	replay = FastFindReplay(settings, engines, args.hits)
+
+	output_file = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf8")
+	log_file = open(os.devnull, "w") if args.quiet else sys.stderr
+	outputs = []
+	start = time.time()
+	try:
+		# FastFind logs with print, which must not end up between the JSON lines
+		with contextlib.redirect_stdout(log_file):
+			with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+				futures = [pool.submit(replay.run, query, time.time()) for query in queries]
+				try:
+					for future in futures:
+						output = future.result()
+						outputs.append(output)
+						output_file.write(json.dumps(output) + "\n")
+						output_file.flush()
+				except KeyboardInterrupt:
+					for future in futures:
+						future.cancel()
+					replay.cancel_all()
+					raise
+	finally:
+		if output_file is not sys.stdout:
+			output_file.close()
+		if index_registry is not None:
+			index_registry.save_all()
+		engines["python"].shutdown()
+		if log_file is not sys.stderr:
+			log_file.close()
+	print(summarize(outputs, time.time() - start), file=sys.stderr)
+	return 1 if any("error" in output for output in outputs) else 0
@@ -0,0 +1,525 @@
+import os
+import re
+import sys
+import mmap
+import fnmatch
+import subprocess
+import threading
+import concurrent.futures
+from functools import lru_cache
+
+from .cancel import terminate_process
+from .osutil import popen_kwargs
+from .results import LINE_TEXT_MAX_CHARS, FastFindResultSet, parse_search_context, parse_search_progress, parse_search_record
+from .settings import FastFindSettings, ignore_folder_patterns, search_terms
+from .shards import FastFindShard, make_file_shards, make_search_shards
+
+#------------------------------------------------------------------------------
+# files handed to one pool task of the python engine, so small files don't cost a round trip each
+SCAN_CHUNK_FILES = 64
+
+# rg treats a file as binary when its first block has a NUL byte in it, the python engine does too
+BINARY_CHECK_BYTES = 8192
+
+#------------------------------------------------------------------------------
+class FastFindSearch:
+	"""One running search of one shard.
+
+	records() yields the engine's raw output, parse_record(record, results) appends the results
+	in one record to results and returns how many it added. That split lets the worker batch,
+	cap and cancel the same way whatever the engine. parse_progress(record) returns the bytes
+	searched that a record without results reports, for engines that report them, and
+	summary holds the engine's own totals once it has reported them (see
+	parse_search_progress). parse_context(record) returns the (filename, line_number, text) of
+	a context line around a match, for engines that report them.
+	terminate() stops the search early and may be called from any thread, wait() returns an
+	rg style exit code: 0 when something matched, 1 when nothing did and 2 on errors.
+	"""
+	summary = None
+
+	def records(self):
+		raise NotImplementedError
+
+	@staticmethod
+	def parse_record(record, results: FastFindResultSet) -> int:
+		raise NotImplementedError
+
+	def parse_progress(self, record) -> int:
+		return 0
+
+	def parse_context(self, record) -> tuple:
+		return None
+
+	def terminate(self) -> None:
+		raise NotImplementedError
+
+	def wait(self) -> int:
+		raise NotImplementedError
+
+
+#------------------------------------------------------------------------------
+class FastFindProcessSearch(FastFindSearch):
+	"""A search run by an external program, one output line per record."""
+	def __init__(self, argv: list, cwd: str, parse_record, parse_progress=None, parse_context=None):
+		# nothing reads stderr while stdout is streamed, so don't let a full pipe stall the search
+		popen_arg_list = popen_kwargs(shell=False, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=cwd)
+		self.argv = argv
+		self.parse_record = parse_record
+		self._parse_progress = parse_progress
+		self._parse_context = parse_context
+		self._bytes_searched = 0
+		self._proc = subprocess.Popen(argv, **popen_arg_list)
+
+	def records(self):
+		return self._proc.stdout
+
+	def parse_progress(self, record) -> int:
+		if self._parse_progress is None:
+			return 0
+		progress = self._parse_progress(record)
+		if progress is None:
+			return 0
+		bytes_searched, summary = progress
+		if summary is not None:
+			self.summary = summary
+			# the total includes the files before it, only the files without matches are new
+			bytes_searched = max(0, bytes_searched - self._bytes_searched)
+		self._bytes_searched += bytes_searched
+		return bytes_searched
+
+	def parse_context(self, record) -> tuple:
+		if self._parse_context is None:
+			return None
+		return self._parse_context(record)
+
+	def terminate(self) -> None:
+		terminate_process(self._proc)
+
+	def wait(self) -> int:
+		self._proc.stdout.close()
+		returncode = self._proc.wait()
+		# rg's codes are the common ground, git grep for one exits with 128 outside a repository
+		return returncode if returncode in (0, 1) else 2
+
+
+#------------------------------------------------------------------------------
+class FastFindSearchEngine:
+	"""A way of searching files. Every engine produces the same FastFindResultSet rows.
+
+	make_shards() splits a search over folders into shards, start() starts searching one of
+	them and raises OSError when the engine's program can't be run, or ValueError when it
+	can't search for the term. The term may also be a tuple of terms (see search_terms),
+	every engine then finds the matches of any of them.
+	"""
+	name = None
+
+	def executable(self, settings: FastFindSettings) -> str:
+		return None
+
+	def make_shards(self, folders: list, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> list:
+		return make_search_shards(folders, settings.get("split_top_level_folders", False),
+			ignore_folder_patterns(settings.get("ignore_folders", [])))
+
+	def start(self, shard: FastFindShard, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> FastFindSearch:
+		raise NotImplementedError
+
+
+#------------------------------------------------------------------------------
+class RgSearchEngine(FastFindSearchEngine):
+	"""Searches with rg. With the file_list_cache setting and a file list registry, rg is given
+	the cached list of a folder's files instead of walking the folder (see FastFindFileList)."""
+	name = "rg"
+
+	def __init__(self, file_lists=None):
+		self._file_lists = file_lists
+
+	def executable(self, settings: FastFindSettings) -> str:
+		return str(settings.get("executable", "rg"))
+
+	def make_shards(self, folders: list, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> list:
+		if self._file_lists is None or not settings.get("file_list_cache", False):
+			return super(RgSearchEngine, self).make_shards(folders, search_term, case_sensitive, settings)
+		shards = []
+		for folder in folders:
+			if not os.path.isdir(folder):
+				shards.append(FastFindShard(folder))
+				continue
+			try:
+				files = self._file_lists.get(folder, settings).files
+			except OSError as e:
+				print("[FastFind] Can't list the files of '{0}': {1}".format(folder, e))
+				shards.append(FastFindShard(folder))
+				continue
+			shards.extend(make_file_shards(folder, files))
+		return shards
+
+	def start(self, shard: FastFindShard, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> FastFindSearch:
+		argv = settings.make_search_argv(search_term, shard.search_paths(), case_sensitive, shard.extra_args)
+		return FastFindProcessSearch(argv, shard.path if os.path.isdir(shard.path) else None, parse_search_record,
+			parse_search_progress, parse_search_context)
+
+
+#------------------------------------------------------------------------------
+class GitGrepSearchEngine(FastFindSearchEngine):
+	"""Searches the files git tracks, with git grep's extended regexes.
+
+	git grep only reports the column of the first match on a line (and with -o gets the
+	columns of later ones wrong), so every match on a matching line is found again with the
+	pattern compiled by Python's re. Patterns Python can't compile fall back to git's column
+	of the first match.
+	"""
+	name = "git_grep"
+
+	def executable(self, settings: FastFindSettings) -> str:
+		return "git"
+
+	def make_shards(self, folders: list, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> list:
+		# git grep walks the index rather than the tree, there's nothing to gain from splitting it
+		return [FastFindShard(folder) for folder in folders]
+
+	def start(self, shard: FastFindShard, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> FastFindSearch:
+		argv = ["git", "grep", "--no-color", "-I", "-E", "-n", "--column", "-z"]
+		if not case_sensitive:
+			argv.append("-i")
+		for term in search_terms(search_term):
+			argv.extend(("-e", term))
+		argv.append("--")
+		if shard.files is not None:
+			argv.extend(os.path.relpath(filename, shard.path) for filename in shard.files)
+		else:
+			argv.extend(type_pathspecs(settings))
+			argv.extend(ignore_pathspecs(settings))
+		try:
+			pattern = compile_search_pattern(search_term, case_sensitive)
+		except re.error:
+			pattern = None
+		folder = shard.path
+		return FastFindProcessSearch(argv, folder, lambda line, results: parse_git_grep_line(folder, pattern, line, results))
+
+
+def parse_git_grep_line(folder: str, pattern, line: bytes, results: FastFindResultSet) -> int:
+	"""Parse one `git grep -n --column -z` line: path NUL line NUL column NUL text."""
+	fields = line.rstrip(b"\n").split(b"\0", 3)
+	if len(fields) < 4:
+		return 0
+	filename = os.path.join(folder, os.fsdecode(fields[0]))
+	line_number = int(fields[1])
+	text = fields[3]
+	line_text = text[:LINE_TEXT_MAX_CHARS * 4].decode("utf8", "replace")[:LINE_TEXT_MAX_CHARS].rstrip("\r")
+	count = 0
+	if pattern is not None:
+		for match in pattern.finditer(text):
+			if match.end() > match.start():
+				results.append(filename, line_number, len(text[:match.start()].decode("utf8", "replace")),
+					len(match.group().decode("utf8", "replace")), line_text)
+				count += 1
+	if count == 0:
+		# git's column counts bytes from 1, and says nothing about the length of the match
+		results.append(filename, line_number, int(fields[2]) - 1, 0, line_text)
+		count = 1
+	return count
+
+
+def ignore_pathspecs(settings: FastFindSettings) -> list:
+	"""git pathspecs leaving out the ignore_folders directories, wherever they are."""
+	return [":(exclude,glob)**/{0}/**".format(pattern) for pattern in ignore_folder_patterns(settings.get("ignore_folders", []))]
+
+
+def type_pathspecs(settings: FastFindSettings) -> list:
+	globs = file_type_globs(str(settings.get("executable", "rg")),
+		tuple(settings.get("file_type_pattern", [])), tuple(settings.get("non_std_file_type_pattern", [])))
+	return list(globs)
+
+
+@lru_cache(maxsize=16)
+def file_type_globs(executable: str, file_types: tuple, non_std_file_types: tuple) -> tuple:
+	"""Filename globs of the configured file types, for engines that can't take rg's -t.
+
+	rg's own type definitions are used when rg can be run, otherwise a type name is taken
+	to be a file extension. No types at all means every file.
+	"""
+	known_types = {}
+	if len(file_types) > 0:
+		try:
+			output = subprocess.check_output([executable, "--type-list"], **popen_kwargs(stderr=subprocess.DEVNULL))
+			for line in output.decode("utf8", "replace").splitlines():
+				name, _, globs = line.partition(":")
+				known_types[name.strip()] = [glob.strip() for glob in globs.split(",") if len(glob.strip()) > 0]
+		except (OSError, subprocess.CalledProcessError):
+			pass
+	globs = []
+	for file_type in file_types:
+		globs.extend(known_types.get(file_type, ["*." + file_type]))
+	for file_type in non_std_file_types:
+		globs.append("*." + file_type)
+	return tuple(globs)
+
+
+#------------------------------------------------------------------------------
+class PythonSearchEngine(FastFindSearchEngine):
+	"""Searches in-process with Python's re over mmapped files, for machines without rg.
+
+	Files are found by walking the folders, skipping hidden files and directories and files
+	that don't match the configured types; unlike rg, .gitignore files are not read. The
+	files are scanned in a process pool where one can be started, and a thread pool where it
+	can't, such as inside Sublime Text's plugin host. Patterns use Python's regex syntax,
+	which agrees with rg's on the common parts.
+	"""
+	name = "python"
+
+	def __init__(self, use_processes: bool = None):
+		if use_processes is None:
+			use_processes = can_start_processes()
+		self._use_processes = use_processes
+		self._pool = None
+		self._pool_lock = threading.Lock()
+
+	def make_shards(self, folders: list, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> list:
+		# the pool already spreads the files of a folder over every core
+		return [FastFindShard(folder) for folder in folders]
+
+	def start(self, shard: FastFindShard, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> FastFindSearch:
+		return FastFindScanSearch(self._get_pool(settings), shard, search_term, case_sensitive, settings)
+
+	def _get_pool(self, settings: FastFindSettings):
+		# one pool shared by all searches, starting worker processes is expensive
+		with self._pool_lock:
+			if self._pool is None:
+				max_workers = settings.get("max_search_processes", 0)
+				if max_workers <= 0:
+					max_workers = os.cpu_count() or 1
+				if self._use_processes:
+					self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+				else:
+					self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+			return self._pool
+
+	def shutdown(self) -> None:
+		with self._pool_lock:
+			if self._pool is not None:
+				# not waiting leaves Python 3.8's process pool hanging at interpreter exit
+				self._pool.shutdown(wait=True)
+				self._pool = None
+
+
+def can_start_processes() -> bool:
+	# multiprocessing starts children with sys.executable, which is only a usable Python
+	# interpreter outside of applications embedding one
+	return os.path.basename(sys.executable).lower().startswith("python")
+
+
+class FastFindScanSearch(FastFindSearch):
+	"""A search of one shard by the python engine, one record per chunk of files."""
+	def __init__(self, pool, shard: FastFindShard, search_term: str, case_sensitive: bool, settings: FastFindSettings):
+		self._pool = pool
+		self._shard = shard
+		self._search_term = search_term
+		self._case_sensitive = case_sensitive
+		self._globs = type_pathspecs(settings)
+		self._ignore_folders = ignore_folder_patterns(settings.get("ignore_folders", []))
+		self._max_per_file = int(settings.get("max_results_per_file", 0))
+		self._futures = []
+		self._terminated = False
+		self._returncode = 1
+		# an invalid pattern should fail here, like a process that can't start, not in the pool
+		try:
+			compile_search_pattern(search_term, case_sensitive)
+		except re.error as e:
+			raise ValueError("invalid pattern '{0}': {1}".format("', '".join(search_terms(search_term)), e))
+
+	def records(self):
+		if self._shard.files is not None:
+			files = self._shard.files
+		else:
+			files = list_files(self._shard.path, self._globs, self._ignore_folders)
+		for start in range(0, len(files), SCAN_CHUNK_FILES):
+			if self._terminated:
+				return
+			self._futures.append(self._pool.submit(scan_files, files[start:start + SCAN_CHUNK_FILES],
+				self._search_term, self._case_sensitive, self._max_per_file))
+		for future in list(self._futures):
+			if self._terminated:
+				return
+			try:
+				matches = future.result()
+			except concurrent.futures.CancelledError:
+				return
+			if len(matches) > 0:
+				self._returncode = 0
+				yield matches
+
+	@staticmethod
+	def parse_record(record, results: FastFindResultSet) -> int:
+		for filename, line_number, column, length, line_text in record:
+			results.append(filename, line_number, column, length, line_text)
+		return len(record)
+
+	def terminate(self) -> None:
+		self._terminated = True
+		for future in list(self._futures):
+			future.cancel()
+
+	def wait(self) -> int:
+		return self._returncode
+
+
+#------------------------------------------------------------------------------
+def list_files(folder: str, globs: list, ignore_folders: list = ()) -> list:
+	"""Every visible file under folder matching one of globs (or all files without globs),
+	leaving out directories matching one of ignore_folders."""
+	files = []
+	for root, dirnames, filenames in os.walk(folder):
+		dirnames[:] = sorted(dirname for dirname in dirnames if not dirname.startswith(".")
+			and not any(fnmatch.fnmatch(dirname, pattern) for pattern in ignore_folders))
+		for filename in sorted(filenames):
+			if filename.startswith("."):
+				continue
+			if len(globs) > 0 and not any(fnmatch.fnmatch(filename, glob) for glob in globs):
+				continue
+			files.append(os.path.join(root, filename))
+	return files
+
+
+@lru_cache(maxsize=32)
+def compile_search_pattern(search_term, case_sensitive: bool):
+	"""Compile an rg pattern (or a tuple of them, matching any) with Python's re, for the in-process scanners.
+
+	rg and Python regexes agree on common syntax, but not everywhere. Raises re.error for
+	patterns Python can't compile.
+	"""
+	flags = re.MULTILINE
+	if not case_sensitive:
+		flags |= re.IGNORECASE
+	if isinstance(search_term, str):
+		return re.compile(search_term.encode("utf8"), flags)
+	return re.compile(b"|".join(b"(?:" + term.encode("utf8") + b")" for term in search_term), flags)
+
+
+def scan_files(filenames: list, search_term: str, case_sensitive: bool, max_per_file: int = 0) -> list:
+	"""Scan files for a pattern, as (filename, line, column, length, line text) tuples. Runs in the pool."""
+	pattern = compile_search_pattern(search_term, case_sensitive)
+	matches = []
+	for filename in filenames:
+		for line_number, column, length, line_text in scan_file(filename, pattern, max_per_file):
+			matches.append((filename, line_number, column, length, line_text))
+	return matches
+
+
+def scan_file(filename: str, pattern, max_matches: int = 0) -> list:
+	"""Find every match of a compiled bytes regex in a file, as (line, column, length, line text) tuples.
+
+	Columns and lengths are in characters, like the results parsed from rg. Binary files,
+	recognised the way rg does, have no matches. With max_matches, scanning stops after that
+	many matches.
+	"""
+	try:
+		with open(filename, "rb") as scanned_file:
+			try:
+				data = mmap.mmap(scanned_file.fileno(), 0, access=mmap.ACCESS_READ)
+			except ValueError:
+				# empty files can't be mapped
+				return []
+	except OSError:
+		return []
+	try:
+		if data.find(b"\0", 0, BINARY_CHECK_BYTES) != -1:
+			return []
+		matches = []
+		line_number = 1
+		line_start = 0
+		line_text = None
+		position = 0
+		for match in pattern.finditer(data):
+			text = match.group()
+			if len(text) == 0 or b"\n" in text:
+				# rg without --multiline never matches across lines, or matches nothing
+				continue
+			newlines = data[position:match.start()].count(b"\n")
+			if newlines > 0:
+				line_number += newlines
+				line_start = data.rfind(b"\n", 0, match.start()) + 1
+				line_text = None
+			position = match.start()
+			if line_text is None:
+				# decoded once per line, however many matches it has
+				line_end = data.find(b"\n", line_start, line_start + LINE_TEXT_MAX_CHARS * 4)
+				if line_end == -1:
+					line_end = min(len(data), line_start + LINE_TEXT_MAX_CHARS * 4)
+				line_text = data[line_start:line_end].decode("utf8", "replace")[:LINE_TEXT_MAX_CHARS].rstrip("\r\n")
+			prefix = data[line_start:match.start()]
+			if prefix.isascii() and text.isascii():
+				matches.append((line_number, len(prefix), len(text), line_text))
+			else:
+				matches.append((line_number, len(prefix.decode("utf8", "replace")), len(text.decode("utf8", "replace")), line_text))
+			if max_matches > 0 and len(matches) >= max_matches:
+				break
+		return matches
+	finally:
+		data.close()
+
+
+#------------------------------------------------------------------------------
+class IndexSearchEngine(FastFindSearchEngine):
+	"""Narrows a search down to the files a trigram index says can match, then has another
+	engine (rg, or python with "index_verify": "python") search just those."""
+	name = "index"
+
+	def __init__(self, registry, engines: dict):
+		self._registry = registry
+		self._engines = engines
+
+	def executable(self, settings: FastFindSettings) -> str:
+		return self._verify_engine(settings).executable(settings)
+
+	def make_shards(self, folders: list, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> list:
+		shards = []
+		for folder in folders:
+			try:
+				index = self._registry.get(folder, settings)
+			except OSError as e:
+				# without rg there is no file list to index, a plain search reports the problem
+				print("[FastFind] Can't index '{0}': {1}".format(folder, e))
+				shards.append(FastFindShard(folder))
+				continue
+			candidates = self._registry.candidates(index, search_term, case_sensitive, settings)
+			if candidates is None:
+				shards.append(FastFindShard(folder))
+			elif len(candidates) > len(index) / 2:
+				# rg walks a folder faster than it opens a long list of files one by one
+				shards.append(FastFindShard(folder))
+			else:
+				shards.extend(make_file_shards(folder, candidates))
+		return shards
+
+	def start(self, shard: FastFindShard, search_term: str, case_sensitive: bool, settings: FastFindSettings) -> FastFindSearch:
+		return self._verify_engine(settings).start(shard, search_term, case_sensitive, settings)
+
+	def _verify_engine(self, settings: FastFindSettings) -> FastFindSearchEngine:
+		return self._engines.get(settings.get("index_verify", "rg"), self._engines["rg"])
+
+
+#------------------------------------------------------------------------------
+def make_search_engines(index_registry=None, use_processes: bool = None, file_lists=None) -> dict:
+	"""One instance of every engine, by name. The index engine needs an index registry, rg
+	only uses cached file lists when given a FastFindFileListRegistry."""
+	engines = {}
+	for engine in (RgSearchEngine(file_lists), GitGrepSearchEngine(), PythonSearchEngine(use_processes)):
+		engines[engine.name] = engine
+	if index_registry is not None:
+		engines[IndexSearchEngine.name] = IndexSearchEngine(index_registry, engines)
+	return engines
+
+
+def run_search(engine: FastFindSearchEngine, folders: list, search_term: str, case_sensitive: bool,
+	settings: FastFindSettings) -> tuple:
+	"""Search folders with engine and wait for it, returning the results and an rg exit code."""
+	results = FastFindResultSet()
+	returncodes = []
+	for shard in engine.make_shards(folders, search_term, case_sensitive, settings):
+		search = engine.start(shard, search_term, case_sensitive, settings)
+		for record in search.records():
+			search.parse_record(record, results)
+		returncodes.append(search.wait())
+	if 2 in returncodes:
+		return results, 2
+	return results, 0 if len(results) > 0 else 1
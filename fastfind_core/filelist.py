@@ -0,0 +1,115 @@
+import os
+import time
+import hashlib
+import threading
+
+from .index import list_search_files
+from .osutil import load_state, save_state, stat_mtime
+
+#------------------------------------------------------------------------------
+FILE_LIST_FORMAT_VERSION = 1
+
+#------------------------------------------------------------------------------
+class FastFindFileList:
+	"""The files a search of one folder reads, listed once by `rg --files` and cached on disk.
+
+	The list is taken with the type filters and ignore_folders globs of a search, so giving it
+	to rg searches exactly the files a walk of the folder would have found, without the walk.
+	Adding, removing or renaming a file changes the mtime of its directory, so the list is
+	stale once any directory it has files in (or any of their parents) has a different mtime.
+	A file added to a directory none of whose files are listed doesn't show up that way, which
+	is what max_age is for.
+	"""
+	def __init__(self, folder: str, cache_filename: str, list_files_argv: list):
+		self.folder = folder
+		self._cache_filename = cache_filename
+		self._list_files_argv = list(list_files_argv)
+		self.files = []
+		# directory -> mtime_ns when the list was taken
+		self._directories = {}
+		self.built = 0
+		self.build_time = 0
+
+	@staticmethod
+	def cache_filename_for(cache_dir: str, folder: str, list_files_argv: list) -> str:
+		# the filters are part of the name, changing them starts a fresh list
+		key = "\0".join([os.path.normpath(folder)] + list(list_files_argv)).encode("utf8", "surrogateescape")
+		return os.path.join(cache_dir, hashlib.sha1(key).hexdigest() + ".files")
+
+	def load(self) -> bool:
+		"""Load the list from disk, returning False if there is none (or it is unusable)."""
+		state = load_state(self._cache_filename, FILE_LIST_FORMAT_VERSION)
+		if state is None:
+			return False
+		self.files = state["files"]
+		self._directories = state["directories"]
+		self.built = state["built"]
+		self.build_time = state["build_time"]
+		return True
+
+	def save(self) -> None:
+		state = {
+			"version": FILE_LIST_FORMAT_VERSION,
+			"folder": self.folder,
+			"files": self.files,
+			"directories": self._directories,
+			"built": self.built,
+			"build_time": self.build_time,
+		}
+		save_state(self._cache_filename, state)
+
+	def build(self) -> None:
+		start = time.time()
+		files = list_search_files(self._list_files_argv, self.folder)
+		root = self.folder.rstrip("/\\") or self.folder
+		directories = {root: None}
+		for filename in files:
+			directory = os.path.dirname(filename)
+			# stop at the first directory already seen, its parents are in there too
+			while directory not in directories and len(directory) > len(root):
+				directories[directory] = None
+				directory = os.path.dirname(directory)
+		for directory in directories:
+			directories[directory] = stat_mtime(directory)
+		self.files = files
+		self._directories = directories
+		self.built = time.time()
+		self.build_time = self.built - start
+		self.save()
+
+	def is_stale(self, max_age: float) -> bool:
+		if max_age > 0 and time.time() - self.built > max_age:
+			return True
+		for directory, mtime in self._directories.items():
+			if stat_mtime(directory) != mtime:
+				return True
+		return False
+
+
+#------------------------------------------------------------------------------
+class FastFindFileListRegistry:
+	"""The file lists of every folder searched with file_list_cache on, kept as files in cache_dir."""
+	def __init__(self, cache_dir: str):
+		self._cache_dir = cache_dir
+		self._file_lists = {}
+		self._lock = threading.Lock()
+
+	def get(self, folder: str, settings) -> FastFindFileList:
+		"""The up to date file list of folder, rebuilt if stale. Slow, so call it off the UI thread.
+
+		Raises OSError when rg can't be run.
+		"""
+		list_files_argv = settings.list_files_argv()
+		cache_filename = FastFindFileList.cache_filename_for(self._cache_dir, folder, list_files_argv)
+		max_age = settings.get("file_list_max_age_s", 600)
+		with self._lock:
+			file_list = self._file_lists.get(cache_filename)
+			if file_list is None:
+				file_list = FastFindFileList(folder, cache_filename, list_files_argv)
+				if not file_list.load():
+					file_list.built = 0
+				self._file_lists[cache_filename] = file_list
+			if file_list.built == 0 or file_list.is_stale(max_age):
+				file_list.build()
+				print("[FastFind] Listed {0} files in '{1}' in {2:.2f}s".format(len(file_list.files), folder, file_list.build_time))
+			return file_list
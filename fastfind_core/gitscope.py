@@ -0,0 +1,126 @@
+import os
+import fnmatch
+import threading
+import subprocess
+
+from .engines import type_pathspecs
+from .osutil import popen_kwargs, stat_mtime
+from .settings import ignore_folder_patterns
+
+#------------------------------------------------------------------------------
+# "all" searches the whole folder, the others only the files git lists for them
+SEARCH_SCOPES = ("all", "tracked", "modified", "since")
+
+#------------------------------------------------------------------------------
+class FastFindGitScope:
+	"""Limits a search to the files git lists: tracked, modified or changed since ref.
+
+	modified is every tracked file that differs from HEAD, staged or not (untracked files
+	only count once added). since is every file changed between ref and the working tree.
+	Listed files still have to match the file types and ignore_folders, which rg doesn't
+	apply to files it is given by name.
+	"""
+	def __init__(self, scope: str, ref: str = None, cache: "FastFindGitScopeCache" = None):
+		if scope not in SEARCH_SCOPES or scope == "all":
+			raise ValueError("unknown search scope '{0}'".format(scope))
+		if scope == "since" and (ref is None or ref.strip() == ""):
+			raise ValueError("searching files changed since a revision needs the revision")
+		self.scope = scope
+		self.ref = ref.strip() if scope == "since" else None
+		self._cache = cache if cache is not None else FastFindGitScopeCache()
+
+	def describe(self) -> str:
+		if self.scope == "since":
+			return "files changed since {0}".format(self.ref)
+		return "{0} files".format(self.scope)
+
+	def files(self, folder: str, settings) -> list:
+		"""The files of folder in scope, as absolute paths. Raises ValueError outside a git repo
+		or for a ref git doesn't know."""
+		files = self._cache.files(folder, self.scope, self.ref)
+		globs = type_pathspecs(settings)
+		ignored = ignore_folder_patterns(settings.get("ignore_folders", []))
+		selected = []
+		for filename in files:
+			directory, basename = os.path.split(filename)
+			if len(globs) > 0 and not any(fnmatch.fnmatch(basename, glob) for glob in globs):
+				continue
+			if len(ignored) > 0 and any(fnmatch.fnmatch(name, pattern)
+					for name in directory.replace("\\", "/").split("/") for pattern in ignored):
+				continue
+			path = os.path.join(folder, filename)
+			# diffs list deleted files too
+			if os.path.isfile(path):
+				selected.append(path)
+		return selected
+
+
+#------------------------------------------------------------------------------
+class FastFindGitScopeCache:
+	"""The file lists behind FastFindGitScope, per folder.
+
+	What git reads from its index and commits is cached against HEAD and the mtime of the
+	index file, which git rewrites whenever it changes: tracked files, and for since the
+	files changed between ref and HEAD. Edits that aren't staged change neither, so the
+	working tree's changes (git diff HEAD) are listed again on every search; git only has
+	to re-read files whose stat info differs from its index, so that stays cheap.
+	"""
+	def __init__(self):
+		self._lists = {}
+		self._lock = threading.Lock()
+
+	def files(self, folder: str, scope: str, ref: str = None) -> list:
+		"""Paths relative to folder, as git lists them."""
+		head, index_mtime, ref_commit = git_repo_state(folder, ref)
+		if scope == "tracked":
+			return self._cached(folder, scope, (head, index_mtime),
+				lambda: run_git_list(folder, ["ls-files", "-z"]))
+		modified = run_git_list(folder, ["diff", "--name-only", "--relative", "-z", "HEAD"])
+		if scope == "modified":
+			return modified
+		committed = self._cached(folder, (scope, ref_commit), (head,),
+			lambda: run_git_list(folder, ["diff", "--name-only", "--relative", "-z", ref_commit, "HEAD"]))
+		return sorted(set(committed).union(modified))
+
+	def _cached(self, folder: str, key, state: tuple, list_files) -> list:
+		key = (os.path.normpath(folder), key)
+		with self._lock:
+			cached = self._lists.get(key)
+			if cached is not None and cached[0] == state:
+				return cached[1]
+		files = list_files()
+		with self._lock:
+			self._lists[key] = (state, files)
+		return files
+
+
+#------------------------------------------------------------------------------
+def git_repo_state(folder: str, ref: str = None) -> tuple:
+	"""(HEAD commit, mtime of the index file, commit of ref) of the repo folder is in."""
+	argv = ["rev-parse", "--absolute-git-dir", "HEAD"]
+	if ref is not None:
+		# --verify can only check one name, the commit of ref^{commit} also rejects trees and blobs
+		argv.append(ref + "^{commit}")
+	lines = run_git(folder, argv).decode("utf8", "surrogateescape").splitlines()
+	git_dir = lines[0]
+	# None in a repo nothing was ever added to, which has no index
+	index_mtime = stat_mtime(os.path.join(git_dir, "index"))
+	return lines[1], index_mtime, lines[2] if ref is not None else None
+
+
+def run_git_list(folder: str, argv: list) -> list:
+	"""The NUL separated paths a git command prints."""
+	output = run_git(folder, argv)
+	return [os.fsdecode(path) for path in output.split(b"\0") if len(path) > 0]
+
+
+def run_git(folder: str, argv: list) -> bytes:
+	try:
+		proc = subprocess.Popen(["git"] + argv, **popen_kwargs(cwd=folder, stdout=subprocess.PIPE, stderr=subprocess.PIPE))
+	except OSError as e:
+		raise ValueError("git can't be run: {0}".format(e))
+	output, errors = proc.communicate()
+	if proc.returncode != 0:
+		message = errors.decode("utf8", "replace").strip().splitlines()
+		raise ValueError("git {0} failed in '{1}': {2}".format(argv[0], folder, message[0] if len(message) > 0 else proc.returncode))
+	return output
@@ -0,0 +1,330 @@
+import os
+import io
+import pickle
+import struct
+import threading
+from collections import OrderedDict
+
+from .results import FastFindResultSet
+
+#------------------------------------------------------------------------------
+# On-disk layout: HISTORY_MAGIC followed by a log of records. Each record is a RECORD_HEADER
+# (op, term length, result count, payload length), the UTF-8 search term and the payload.
+# Only PUT records carry a payload, which is a serialized FastFindResultSet.
+HISTORY_MAGIC = b"FFHIST1\n"
+RECORD_HEADER = struct.Struct("<BIII")
+
+OP_PUT = 1
+OP_DELETE = 2
+OP_TOUCH = 3
+OP_CLEAR = 4
+
+# compact once at least this many bytes of the log are superseded records...
+COMPACT_MIN_DEAD_BYTES = 1024 * 1024
+# ...and they outweigh the live ones by this factor
+COMPACT_DEAD_RATIO = 1.0
+
+#------------------------------------------------------------------------------
+class HistoryEntry:
+	__slots__ = ("offset", "length", "count")
+
+	def __init__(self, offset: int, length: int, count: int):
+		self.offset = offset
+		self.length = length
+		self.count = count
+
+
+#------------------------------------------------------------------------------
+class FastFindHistoryStore:
+	"""Search history kept in an append-only log with LRU eviction.
+
+	Saving a search appends only that search's results, older entries are never rewritten.
+	Only an index of term -> (offset, length, count) is held in memory, result payloads are
+	read back from the file when a term is looked up. Entries beyond max_entries or max_bytes
+	are evicted least recently used first, and the log is compacted once superseded records
+	make up most of it. With filename None the log lives in memory instead.
+
+	Looking an entry up makes it the most recently used one in memory only, lookups never
+	write to the file. The new order is written along with the next record appended, or by
+	the next compaction, whichever comes first.
+
+	A store can be shared between threads. Other stores (and other Sublime instances) may
+	write the same file, a store notices by the file's size and mtime changing and reads
+	only what changed, so looking entries up in an unchanged file costs one stat.
+	"""
+	def __init__(self, filename: str, max_entries: int = 100, max_bytes: int = 64 * 1024 * 1024):
+		self._filename = filename
+		self._max_entries = max_entries
+		self._max_bytes = max_bytes
+		self._entries = OrderedDict()
+		# terms looked up since the last write, in the order of their last lookup
+		self._touched = OrderedDict()
+		self._live_bytes = 0
+		self._end = 0
+		self._file_id = None
+		self._memory_file = None
+		self._lock = threading.RLock()
+		if filename is None:
+			self._memory_file = io.BytesIO()
+			self._memory_file.write(HISTORY_MAGIC)
+			self._end = len(HISTORY_MAGIC)
+		else:
+			self._load()
+
+	#--------------------------------------------------------------------------
+	# mapping interface, oldest entry first
+
+	def __len__(self) -> int:
+		with self._lock:
+			self._refresh()
+			return len(self._entries)
+
+	def __contains__(self, search_term: str) -> bool:
+		with self._lock:
+			self._refresh()
+			return search_term in self._entries
+
+	def __getitem__(self, search_term: str) -> FastFindResultSet:
+		with self._lock:
+			self._refresh()
+			entry = self._entries[search_term]
+			with self._open("rb") as history_file:
+				history_file.seek(entry.offset)
+				payload = history_file.read(entry.length)
+			self._entries.move_to_end(search_term)
+			self._touched[search_term] = None
+			self._touched.move_to_end(search_term)
+		# decoding needs no lock, the payload is a copy
+		return FastFindResultSet.from_bytes(payload)
+
+	def __setitem__(self, search_term: str, search_results: FastFindResultSet) -> None:
+		payload = search_results.to_bytes()
+		with self._lock:
+			self._refresh()
+			self._append(OP_PUT, search_term, len(search_results), payload)
+			self._evict()
+			self._compact_if_needed()
+
+	def __delitem__(self, search_term: str) -> None:
+		with self._lock:
+			self._refresh()
+			if search_term not in self._entries:
+				raise KeyError(search_term)
+			self._append(OP_DELETE, search_term)
+			self._compact_if_needed()
+
+	def keys(self) -> list:
+		with self._lock:
+			self._refresh()
+			return list(self._entries.keys())
+
+	def result_count(self, search_term: str) -> int:
+		"""Number of results stored for search_term, without loading them."""
+		with self._lock:
+			self._refresh()
+			return self._entries[search_term].count
+
+	def clear(self) -> None:
+		with self._lock:
+			self._refresh()
+			self._append(OP_CLEAR, "")
+			self.compact()
+
+	#--------------------------------------------------------------------------
+	def compact(self) -> None:
+		"""Rewrite the log so it holds only the live entries, in LRU order."""
+		with self._lock:
+			self._compact()
+
+	def _compact(self) -> None:
+		output = io.BytesIO()
+		output.write(HISTORY_MAGIC)
+		entries = OrderedDict()
+		with self._open("rb") as history_file:
+			for search_term, entry in self._entries.items():
+				history_file.seek(entry.offset)
+				payload = history_file.read(entry.length)
+				term = search_term.encode("utf8", "surrogatepass")
+				output.write(RECORD_HEADER.pack(OP_PUT, len(term), entry.count, len(payload)))
+				output.write(term)
+				entries[search_term] = HistoryEntry(output.tell(), len(payload), entry.count)
+				output.write(payload)
+
+		if self._memory_file is not None:
+			self._memory_file = output
+		else:
+			temp_filename = self._filename + ".tmp"
+			with open(temp_filename, "wb") as temp_file:
+				temp_file.write(output.getvalue())
+			os.replace(temp_filename, self._filename)
+			self._file_id = self._stat_id()
+		self._entries = entries
+		# the rewritten log is in LRU order already
+		self._touched.clear()
+		self._end = len(output.getvalue())
+
+	#--------------------------------------------------------------------------
+	def _open(self, mode: str):
+		if self._memory_file is not None:
+			return _Unclosable(self._memory_file)
+		return open(self._filename, mode)
+
+	def _stat_id(self):
+		# identifies the file and the version of it this store has read
+		try:
+			stat = os.stat(self._filename)
+		except OSError:
+			return None
+		return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+	def _load(self) -> None:
+		if not os.path.isfile(self._filename):
+			self._create()
+			return
+		with open(self._filename, "rb") as history_file:
+			magic = history_file.read(len(HISTORY_MAGIC))
+		if magic == b"":
+			self._create()
+			return
+		if magic != HISTORY_MAGIC:
+			self._migrate_pickle()
+			return
+		self._entries = OrderedDict()
+		self._live_bytes = 0
+		self._end = len(HISTORY_MAGIC)
+		self._file_id = self._stat_id()
+		self._scan()
+		self._compact_if_needed()
+
+	def _create(self) -> None:
+		with open(self._filename, "wb") as history_file:
+			history_file.write(HISTORY_MAGIC)
+		self._entries = OrderedDict()
+		self._live_bytes = 0
+		self._end = len(HISTORY_MAGIC)
+		self._file_id = self._stat_id()
+
+	def _migrate_pickle(self) -> None:
+		# history files from older versions are a single pickled {term: results} dict
+		try:
+			with open(self._filename, "rb") as history_file:
+				search_history = pickle.load(history_file)
+		except Exception as e:
+			print("[FastFind] Discarding unreadable history file '{0}': {1}".format(self._filename, e))
+			search_history = {}
+		if not isinstance(search_history, dict):
+			print("[FastFind] Discarding unreadable history file '{0}': not a search history".format(self._filename))
+			search_history = {}
+		self._create()
+		for search_term, search_results in search_history.items():
+			if not isinstance(search_results, FastFindResultSet):
+				try:
+					search_results = FastFindResultSet(search_results)
+				except Exception:
+					continue
+			if isinstance(search_term, str):
+				self[search_term] = search_results
+
+	def _refresh(self) -> None:
+		"""Pick up records appended, or a compaction done, by another store on the same file."""
+		if self._memory_file is not None:
+			return
+		file_id = self._stat_id()
+		if file_id == self._file_id:
+			return
+		if file_id is None:
+			self._create()
+		elif self._file_id is None or file_id[:2] != self._file_id[:2] or file_id[2] < self._end:
+			self._load()
+		else:
+			if file_id[2] > self._end:
+				self._scan()
+			self._file_id = self._stat_id()
+		# another store's records don't know about the lookups not written yet
+		for search_term in self._touched:
+			if search_term in self._entries:
+				self._entries.move_to_end(search_term)
+
+	def _scan(self) -> None:
+		with self._open("rb") as history_file:
+			file_size = history_file.seek(0, io.SEEK_END)
+			history_file.seek(self._end)
+			while True:
+				header = history_file.read(RECORD_HEADER.size)
+				if len(header) < RECORD_HEADER.size:
+					break
+				op, term_len, count, payload_len = RECORD_HEADER.unpack(header)
+				term = history_file.read(term_len)
+				payload_offset = history_file.tell()
+				history_file.seek(payload_len, io.SEEK_CUR)
+				if len(term) < term_len or history_file.tell() > file_size:
+					# a record cut short by a crash mid-write, the next append overwrites it
+					break
+				self._apply(op, term.decode("utf8", "surrogatepass"), HistoryEntry(payload_offset, payload_len, count))
+				self._end = history_file.tell()
+
+	def _apply(self, op: int, search_term: str, entry: HistoryEntry) -> None:
+		if op == OP_PUT:
+			old_entry = self._entries.pop(search_term, None)
+			if old_entry is not None:
+				self._live_bytes -= old_entry.length
+			self._entries[search_term] = entry
+			self._live_bytes += entry.length
+		elif op == OP_DELETE:
+			old_entry = self._entries.pop(search_term, None)
+			if old_entry is not None:
+				self._live_bytes -= old_entry.length
+		elif op == OP_TOUCH:
+			if search_term in self._entries:
+				self._entries.move_to_end(search_term)
+		elif op == OP_CLEAR:
+			self._entries.clear()
+			self._live_bytes = 0
+
+	def _append(self, op: int, search_term: str, count: int = 0, payload: bytes = b"") -> None:
+		# the lookups since the last write go first, as OP_TOUCH records in the same write
+		records = [(OP_TOUCH, touched_term, 0, b"") for touched_term in self._touched if touched_term in self._entries]
+		records.append((op, search_term, count, payload))
+		self._touched.clear()
+		data = []
+		applied = []
+		end = self._end
+		for record_op, record_term, record_count, record_payload in records:
+			term = record_term.encode("utf8", "surrogatepass")
+			header = RECORD_HEADER.pack(record_op, len(term), record_count, len(record_payload)) + term
+			applied.append((record_op, record_term, HistoryEntry(end + len(header), len(record_payload), record_count)))
+			data.append(header)
+			data.append(record_payload)
+			end += len(header) + len(record_payload)
+		with self._open("r+b") as history_file:
+			history_file.seek(self._end)
+			history_file.write(b"".join(data))
+			history_file.truncate()
+		for record_op, record_term, entry in applied:
+			self._apply(record_op, record_term, entry)
+		self._end = end
+		if self._memory_file is None:
+			self._file_id = self._stat_id()
+
+	def _evict(self) -> None:
+		while len(self._entries) > 1 and (len(self._entries) > self._max_entries or self._live_bytes > self._max_bytes):
+			oldest_term = next(iter(self._entries))
+			self._append(OP_DELETE, oldest_term)
+
+	def _compact_if_needed(self) -> None:
+		dead_bytes = self._end - self._live_bytes - len(HISTORY_MAGIC)
+		if dead_bytes >= COMPACT_MIN_DEAD_BYTES and dead_bytes > self._live_bytes * COMPACT_DEAD_RATIO:
+			self.compact()
+
+
+#------------------------------------------------------------------------------
+class _Unclosable:
+	"""Lets the in-memory log be used in the same with-blocks as a real file."""
+	def __init__(self, memory_file):
+		self._memory_file = memory_file
+
+	def __enter__(self):
+		return self._memory_file
+
+	def __exit__(self, *args):
+		return False
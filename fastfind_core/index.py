@@ -0,0 +1,462 @@
+import os
+import re
+import time
+import hashlib
+import threading
+import subprocess
+from array import array
+
+from .osutil import load_state, popen_kwargs, save_state, stat_mtime
+
+#------------------------------------------------------------------------------
+INDEX_FORMAT_VERSION = 2
+
+# regex syntax that makes the characters around it optional, repeated or alternatives
+REGEX_SPECIAL_CHARS = set(".^$*+?()[]{}|\\")
+REGEX_OPTIONAL_SUFFIXES = set("*?")
+
+# entries kept in the token -> trigrams cache while building, before it's thrown away
+TOKEN_CACHE_MAX_ENTRIES = 200000
+
+# the separators bytes.split() splits on, trigrams spanning them are never indexed
+WHITESPACE_BYTES = set(b" \t\n\r\x0b\x0c")
+
+# trigrams are taken from every position in the text, the lookahead makes findall overlap them
+_trigram_pattern = re.compile(b"(?=(...))", re.DOTALL)
+
+#------------------------------------------------------------------------------
+def file_trigrams(data: bytes, token_cache: dict = None) -> set:
+	"""Distinct lowercased trigrams of the whitespace separated tokens in a file.
+
+	Source files repeat the same tokens over and over, within a file and across files, so
+	each token is only split into trigrams once per file, or once per token_cache.
+	"""
+	if token_cache is None:
+		token_cache = {}
+	trigrams = set()
+	for token in set(data.lower().split()):
+		token_trigrams = token_cache.get(token)
+		if token_trigrams is None:
+			token_trigrams = token_cache[token] = _trigram_pattern.findall(token)
+		trigrams.update(token_trigrams)
+	return trigrams
+
+
+#------------------------------------------------------------------------------
+def query_trigrams(search_term: str, case_sensitive: bool) -> set:
+	"""Trigrams every match of the rg pattern search_term must contain.
+
+	Returns None when nothing can be required of a match, for instance with alternations or
+	terms without three consecutive literal characters, and the index can't narrow the search.
+	"""
+	if "|" in search_term:
+		return None
+
+	literals = []
+	current = []
+	# characters inside classes and groups may be optional or alternatives, only take literals outside them
+	depth = 0
+	index = 0
+	while index < len(search_term):
+		char = search_term[index]
+		if char == "\\":
+			# escapes like \w or \. stand for other characters, skip the escaped one too
+			literals.append("".join(current))
+			current = []
+			index += 1
+		elif char in "[(":
+			depth += 1
+		elif char in "])":
+			depth = max(depth - 1, 0)
+		elif depth > 0:
+			pass
+		elif char == "{":
+			# a counted repetition like {2,4} or {0}: the digits in it match nothing, and the
+			# character before it may be repeated zero times
+			if len(current) > 0:
+				current.pop()
+			literals.append("".join(current))
+			current = []
+			close = search_term.find("}", index)
+			index = len(search_term) if close == -1 else close + 1
+			continue
+		elif char in REGEX_SPECIAL_CHARS:
+			if char in REGEX_OPTIONAL_SUFFIXES and len(current) > 0:
+				# the character before * ? or {0,n} may not be there at all
+				current.pop()
+			literals.append("".join(current))
+			current = []
+		else:
+			current.append(char)
+		if char in "[(])":
+			literals.append("".join(current))
+			current = []
+		index += 1
+	literals.append("".join(current))
+
+	trigrams = set()
+	for literal in literals:
+		data = literal.encode("utf8").lower()
+		for start in range(len(data) - 2):
+			trigram = data[start:start + 3]
+			if not WHITESPACE_BYTES.isdisjoint(trigram):
+				continue
+			if not case_sensitive and max(trigram) >= 0x80:
+				# bytes.lower() leaves non-ASCII letters alone, so with -i these could miss
+				continue
+			trigrams.add(trigram)
+	if len(trigrams) == 0:
+		return None
+	return trigrams
+
+
+#------------------------------------------------------------------------------
+def list_search_files(argv: list, folder: str) -> list:
+	"""Run an `rg --files` command line and return the files it lists."""
+	proc = subprocess.Popen(argv + ["--", folder], **popen_kwargs(stdout=subprocess.PIPE, stderr=subprocess.DEVNULL))
+	output, _ = proc.communicate()
+	return [os.fsdecode(line) for line in output.splitlines() if len(line) > 0]
+
+
+#------------------------------------------------------------------------------
+class FastFindTrigramIndex:
+	"""Persistent trigram index of the files rg would search under one folder.
+
+	Files come from `rg --files` with the configured type filters, so the index covers exactly
+	what a plain search would read. A query returns the files that contain every trigram the
+	search term requires, and only those get searched. Changed files are re-indexed under a
+	new id and their old id is marked dead, so updates never have to edit posting lists in
+	place. Files larger than max_file_size are not indexed and always returned as candidates.
+	"""
+	def __init__(self, folder: str, index_filename: str, list_files_argv: list, max_file_size: int = 1024 * 1024):
+		self.folder = folder
+		self._index_filename = index_filename
+		self._list_files_argv = list(list_files_argv)
+		self._max_file_size = max_file_size
+		self._lock = threading.RLock()
+		self._file_ids = {}
+		self._filenames = []
+		self._mtimes = array("q")
+		self._dead = set()
+		self._unindexed = set()
+		self._postings = {}
+		self._dirty = False
+		self.last_rescan = 0
+		self.build_time = 0
+
+	def __len__(self) -> int:
+		"""Number of files in the index."""
+		return len(self._file_ids)
+
+	#--------------------------------------------------------------------------
+	@staticmethod
+	def index_filename_for(index_dir: str, folder: str, list_files_argv: list) -> str:
+		# the type filters are part of the name, changing them starts a fresh index
+		key = "\0".join([os.path.normpath(folder)] + list(list_files_argv)).encode("utf8", "surrogateescape")
+		return os.path.join(index_dir, hashlib.sha1(key).hexdigest() + ".trigrams")
+
+	def load(self) -> bool:
+		"""Load the index from disk, returning False if there is none (or it is unusable)."""
+		state = load_state(self._index_filename, INDEX_FORMAT_VERSION)
+		if state is None:
+			return False
+		with self._lock:
+			self._filenames = state["filenames"]
+			self._file_ids = {filename: file_id for file_id, filename in enumerate(self._filenames)
+				if file_id not in state["dead"]}
+			self._mtimes = state["mtimes"]
+			self._dead = state["dead"]
+			self._unindexed = state["unindexed"]
+			self._postings = state["postings"]
+			self.build_time = state["build_time"]
+			self.last_rescan = 0
+		return True
+
+	def save(self) -> None:
+		with self._lock:
+			state = {
+				"version": INDEX_FORMAT_VERSION,
+				"folder": self.folder,
+				"filenames": self._filenames,
+				"mtimes": self._mtimes,
+				"dead": self._dead,
+				"unindexed": self._unindexed,
+				"postings": self._postings,
+				"build_time": self.build_time,
+			}
+			save_state(self._index_filename, state)
+			self._dirty = False
+
+	def build(self) -> None:
+		"""Index every file from scratch. Searches keep using the old index until the new one is complete."""
+		start = time.time()
+		# nothing else sees the new index while it's filled in, so it needs no locking
+		fresh = FastFindTrigramIndex(self.folder, self._index_filename, self._list_files_argv, self._max_file_size)
+		token_cache = {}
+		for filename in list_search_files(self._list_files_argv, self.folder):
+			fresh._add_file(filename, *fresh._read_file(filename, token_cache))
+		with self._lock:
+			self._file_ids = fresh._file_ids
+			self._filenames = fresh._filenames
+			self._mtimes = fresh._mtimes
+			self._dead = fresh._dead
+			self._unindexed = fresh._unindexed
+			self._postings = fresh._postings
+			self.last_rescan = time.time()
+			self.build_time = time.time() - start
+		self.save()
+
+	#--------------------------------------------------------------------------
+	def rescan(self) -> int:
+		"""Bring the index up to date with the tree, returning the number of files changed.
+
+		Files are listed, checked and read without the lock held, it's only taken to put the
+		changes in, so searches using the index don't wait for the rescan.
+		"""
+		listed = set(list_search_files(self._list_files_argv, self.folder))
+		with self._lock:
+			known_mtimes = {filename: self._mtimes[file_id] for filename, file_id in self._file_ids.items()}
+		removed = [filename for filename in known_mtimes if filename not in listed]
+		updated = []
+		token_cache = {}
+		for filename in listed:
+			mtime = stat_mtime(filename)
+			if known_mtimes.get(filename) != mtime:
+				updated.append((filename,) + self._read_file(filename, token_cache))
+
+		with self._lock:
+			for filename in removed:
+				if filename in self._file_ids:
+					self._remove_file(filename)
+			for filename, mtime, trigrams in updated:
+				file_id = self._file_ids.get(filename)
+				if file_id is not None:
+					if self._mtimes[file_id] != known_mtimes.get(filename):
+						# re-indexed since it was checked, by update_file or another rescan
+						continue
+					self._remove_file(filename)
+				self._add_file(filename, mtime, trigrams)
+			self.last_rescan = time.time()
+			if self._dirty:
+				self._compact_if_needed()
+		if self._dirty:
+			self.save()
+		return len(removed) + len(updated)
+
+	def update_file(self, filename: str) -> None:
+		"""Re-index one file, e.g. after it was saved.
+
+		Only files already in the index are updated, new files get picked up by the next rescan,
+		which knows which of them the type filters let through.
+		"""
+		if filename not in self._file_ids:
+			return
+		exists = os.path.isfile(filename)
+		if exists:
+			mtime, trigrams = self._read_file(filename, {})
+		with self._lock:
+			if filename not in self._file_ids:
+				return
+			self._remove_file(filename)
+			if exists:
+				self._add_file(filename, mtime, trigrams)
+
+	def candidates(self, search_term: str, case_sensitive: bool) -> list:
+		"""Files that may contain search_term, or None if the index can't narrow it down.
+
+		For a tuple of terms (a batch search) that is the files that may contain any of them.
+		"""
+		if not isinstance(search_term, str):
+			filenames = set()
+			for term in search_term:
+				term_candidates = self.candidates(term, case_sensitive)
+				if term_candidates is None:
+					return None
+				filenames.update(term_candidates)
+			return sorted(filenames)
+		trigrams = query_trigrams(search_term, case_sensitive)
+		if trigrams is None:
+			return None
+		with self._lock:
+			postings = []
+			for trigram in trigrams:
+				file_ids = self._postings.get(trigram)
+				if file_ids is None:
+					postings = []
+					break
+				postings.append(file_ids)
+
+			file_ids = set()
+			if len(postings) > 0:
+				# intersect starting from the rarest trigram
+				postings.sort(key=len)
+				file_ids = set(postings[0])
+				for posting in postings[1:]:
+					file_ids.intersection_update(posting)
+					if len(file_ids) == 0:
+						break
+			file_ids.update(self._unindexed)
+			file_ids.difference_update(self._dead)
+			return sorted(self._filenames[file_id] for file_id in file_ids)
+
+	def stats(self) -> dict:
+		with self._lock:
+			try:
+				size = os.path.getsize(self._index_filename)
+			except OSError:
+				size = 0
+			return {
+				"folder": self.folder,
+				"files": len(self._file_ids),
+				"trigrams": len(self._postings),
+				"postings": sum(len(file_ids) for file_ids in self._postings.values()),
+				"bytes": size,
+				"build_time": self.build_time,
+			}
+
+	#--------------------------------------------------------------------------
+	def _read_file(self, filename: str, token_cache: dict) -> tuple:
+		# (mtime, trigrams) of filename, trigrams is None for files that aren't indexed;
+		# the slow part of adding a file, so called without the lock held
+		mtime = stat_mtime(filename)
+		try:
+			if os.path.getsize(filename) > self._max_file_size:
+				return mtime, None
+			with open(filename, "rb") as indexed_file:
+				data = indexed_file.read()
+		except OSError:
+			return mtime, None
+		if len(token_cache) > TOKEN_CACHE_MAX_ENTRIES:
+			token_cache.clear()
+		return mtime, file_trigrams(data, token_cache)
+
+	def _add_file(self, filename: str, mtime: int, trigrams: set) -> None:
+		file_id = len(self._filenames)
+		self._filenames.append(filename)
+		self._file_ids[filename] = file_id
+		self._mtimes.append(mtime or 0)
+		self._dirty = True
+		if trigrams is None:
+			self._unindexed.add(file_id)
+			return
+		for trigram in trigrams:
+			file_ids = self._postings.get(trigram)
+			if file_ids is None:
+				file_ids = self._postings[trigram] = array("I")
+			file_ids.append(file_id)
+
+	def _remove_file(self, filename: str) -> None:
+		file_id = self._file_ids.pop(filename)
+		self._dead.add(file_id)
+		self._unindexed.discard(file_id)
+		self._dirty = True
+
+	def _compact_if_needed(self) -> None:
+		# dead ids only cost memory and intersection time until they outnumber the live ones
+		if len(self._dead) < 1024 or len(self._dead) < len(self._file_ids):
+			return
+		remap = {}
+		filenames = []
+		mtimes = array("q")
+		for filename, file_id in sorted(self._file_ids.items(), key=lambda item: item[1]):
+			remap[file_id] = len(filenames)
+			filenames.append(filename)
+			mtimes.append(self._mtimes[file_id])
+		postings = {}
+		for trigram, file_ids in self._postings.items():
+			live_ids = array("I", (remap[file_id] for file_id in file_ids if file_id in remap))
+			if len(live_ids) > 0:
+				postings[trigram] = live_ids
+		self._unindexed = set(remap[file_id] for file_id in self._unindexed if file_id in remap)
+		self._filenames = filenames
+		self._file_ids = {filename: file_id for file_id, filename in enumerate(filenames)}
+		self._mtimes = mtimes
+		self._postings = postings
+		self._dead = set()
+
+
+#------------------------------------------------------------------------------
+class FastFindIndexRegistry:
+	"""The trigram indexes of every folder searched so far, kept as files in index_dir.
+
+	An index is loaded, or built, the first time a folder is searched, and rescanned in the
+	background every rescan interval after that. on_message receives progress messages.
+	"""
+	def __init__(self, index_dir: str, on_message=None):
+		self._index_dir = index_dir
+		self._on_message = on_message if on_message is not None else (lambda message: None)
+		self._indexes = {}
+		# index filename -> lock held while that index is loaded or built
+		self._folder_locks = {}
+		self._lock = threading.Lock()
+
+	def get(self, folder: str, settings, rebuild: bool = False) -> FastFindTrigramIndex:
+		"""The index of folder, loaded or built on first use. Slow, so call it off the UI thread."""
+		list_files_argv = settings.list_files_argv()
+		index_filename = FastFindTrigramIndex.index_filename_for(self._index_dir, folder, list_files_argv)
+		with self._lock:
+			index = self._indexes.get(index_filename)
+			if index is not None and not rebuild:
+				return index
+			# loading or building one folder mustn't hold up searches in the others
+			folder_lock = self._folder_locks.setdefault(index_filename, threading.Lock())
+		with folder_lock:
+			with self._lock:
+				index = self._indexes.get(index_filename)
+			if index is not None:
+				if rebuild:
+					self._build(index)
+				return index
+			index = FastFindTrigramIndex(folder, index_filename, list_files_argv,
+				max_file_size=settings.get("index_max_file_size_kb", 1024) * 1024)
+			start = time.time()
+			if not rebuild and index.load():
+				# edits made while the index wasn't loaded must not be missed by the first search
+				changed = index.rescan()
+				print("[FastFind] Loaded index of '{0}' in {1:.2f}s, {2} files changed".format(folder, time.time() - start, changed))
+			else:
+				self._build(index)
+			with self._lock:
+				self._indexes[index_filename] = index
+			return index
+
+	def candidates(self, index: FastFindTrigramIndex, search_term: str, case_sensitive: bool, settings) -> list:
+		"""Look up search_term in index, and start a background rescan if one is due."""
+		start = time.time()
+		candidates = index.candidates(search_term, case_sensitive)
+		self.rescan_in_background(index, settings.get("index_rescan_interval_s", 300))
+		if candidates is None:
+			print("[FastFind] Index can't narrow down '{0}', searching all of '{1}'".format(search_term, index.folder))
+		else:
+			print("[FastFind] Index lookup in '{0}': {1} of {2} files in {3:.1f}ms".format(
+				index.folder, len(candidates), len(index), (time.time() - start) * 1000))
+		return candidates
+
+	def rescan_in_background(self, index: FastFindTrigramIndex, interval: float) -> None:
+		if time.time() - index.last_rescan < interval:
+			return
+		# claim this rescan so searches starting meanwhile don't start their own
+		index.last_rescan = time.time()
+		threading.Thread(target=index.rescan).start()
+
+	def loaded(self) -> list:
+		with self._lock:
+			return list(self._indexes.values())
+
+	def update_file(self, filename: str) -> None:
+		for index in self.loaded():
+			if filename.startswith(os.path.join(index.folder, "")):
+				index.update_file(filename)
+
+	def save_all(self) -> None:
+		for index in self.loaded():
+			index.save()
+
+	def _build(self, index: FastFindTrigramIndex) -> None:
+		self._on_message("FastFind: indexing '{0}'...".format(index.folder))
+		index.build()
+		stats = index.stats()
+		summary = "FastFind: indexed {0} files of '{1}' in {2:.2f}s, {3} trigrams, {4:.1f} MB".format(
+			stats["files"], stats["folder"], stats["build_time"], stats["trigrams"], stats["bytes"] / (1024 * 1024))
+		print("[FastFind] " + summary)
+		self._on_message(summary)
@@ -0,0 +1,53 @@
+import os
+import pickle
+
+#------------------------------------------------------------------------------
+# CREATE_NO_WINDOW, without it every child process flashes a console window on Windows
+WINDOWS_CREATE_NO_WINDOW = 0x08000000
+
+def popen_kwargs(**kwargs) -> dict:
+	"""Keyword arguments for subprocess.Popen and friends, adding what the platform needs."""
+	if os.name == "nt":
+		kwargs["creationflags"] = WINDOWS_CREATE_NO_WINDOW
+	return kwargs
+
+
+#------------------------------------------------------------------------------
+def stat_mtime(path: str) -> int:
+	"""mtime of path in nanoseconds, None if it doesn't exist."""
+	try:
+		return os.stat(path).st_mtime_ns
+	except OSError:
+		return None
+
+
+#------------------------------------------------------------------------------
+def is_in_folder(path: str, folder: str) -> bool:
+	"""Whether path is folder or lies under it, comparing whole path components, so /src/app
+	isn't in /src/a."""
+	path = os.path.normcase(os.path.normpath(path))
+	folder = os.path.normcase(os.path.normpath(folder))
+	return path == folder or path.startswith(os.path.join(folder, ""))
+
+
+#------------------------------------------------------------------------------
+def load_state(filename: str, version: int) -> dict:
+	"""The dict save_state() wrote to filename, or None if there is none, it is unusable or
+	it was written with another format version."""
+	try:
+		with open(filename, "rb") as state_file:
+			state = pickle.load(state_file)
+	except (OSError, EOFError, pickle.UnpicklingError):
+		return None
+	if not isinstance(state, dict) or state.get("version") != version:
+		return None
+	return state
+
+
+def save_state(filename: str, state: dict) -> None:
+	"""Pickle state to filename, replacing the old file only once the new one is complete."""
+	os.makedirs(os.path.dirname(filename), exist_ok=True)
+	temp_filename = filename + ".tmp"
+	with open(temp_filename, "wb") as state_file:
+		pickle.dump(state, state_file, pickle.HIGHEST_PROTOCOL)
+	os.replace(temp_filename, filename)
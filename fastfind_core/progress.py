@@ -0,0 +1,30 @@
+import threading
+
+#------------------------------------------------------------------------------
+class FastFindSearchProgress:
+	"""Running totals of one search, added to by its worker threads and read from the UI thread.
+
+	Matches and files with matches are counted as results are parsed. Bytes searched are only
+	known for engines that report them (rg, in its end and summary records).
+	"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.matches = 0
+		self.files_with_matches = 0
+		self.bytes_searched = 0
+
+	def add(self, matches: int = 0, files_with_matches: int = 0, bytes_searched: int = 0) -> None:
+		with self._lock:
+			self.matches += matches
+			self.files_with_matches += files_with_matches
+			self.bytes_searched += bytes_searched
+
+	def describe(self) -> str:
+		with self._lock:
+			matches, files_with_matches, bytes_searched = self.matches, self.files_with_matches, self.bytes_searched
+		text = "{0} matches in {1} files".format(matches, files_with_matches)
+		if bytes_searched >= 1024 * 1024:
+			text += ", {0:.1f} MB searched".format(bytes_searched / (1024.0 * 1024.0))
+		elif bytes_searched > 0:
+			text += ", {0:.0f} KB searched".format(bytes_searched / 1024.0)
+		return text
@@ -0,0 +1,130 @@
+#------------------------------------------------------------------------------
+# the layout of Sublime's own Find Results, which these regexes pick the file and line out of
+RESULT_FILE_REGEX = r"^([^ \t].*):$"
+RESULT_LINE_REGEX = r"^ +([0-9]+):"
+
+# a line of the rendered text: the number right aligned (see format_line_number), ":" after matched lines
+LINE_NUMBER_WIDTH = 6
+MATCH_LINE_FORMAT = "{0}: {1}\n"
+CONTEXT_LINE_FORMAT = "{0}  {1}\n"
+GAP_LINE = "{0:>{1}}\n".format("..", LINE_NUMBER_WIDTH)
+
+#------------------------------------------------------------------------------
+def format_line_number(line_number: int) -> str:
+	"""line_number right aligned in LINE_NUMBER_WIDTH characters. Longer numbers get wider, but
+	always keep one space in front, which RESULT_LINE_REGEX needs to tell them from file names."""
+	number = str(line_number)
+	return " " * max(LINE_NUMBER_WIDTH - len(number), 1) + number
+
+
+#------------------------------------------------------------------------------
+class FastFindRenderedChunk:
+	"""A piece of a results view's text, ending on a line boundary.
+
+	matches are the (begin, end) offsets of every match in text, files the (offset, filename)
+	of every file header in it.
+	"""
+	__slots__ = ("text", "matches", "files")
+
+	def __init__(self, text: str, matches: list, files: list):
+		self.text = text
+		self.matches = matches
+		self.files = files
+
+
+#------------------------------------------------------------------------------
+class FastFindResultsRenderer:
+	"""Renders hits grouped by file, with their context lines, as the text of a results view.
+
+	Results and context lines are added in the order rg reports them and rendered straight
+	away, the only thing held back is the last matched line, which further hits on the same
+	line still have to be marked on. take_chunks() hands over what has been rendered so far in
+	chunks of at most chunk_lines lines, so no single insert into the view gets large.
+	"""
+	def __init__(self, show_gaps: bool = False, chunk_lines: int = 2000):
+		# ".." between lines that aren't adjacent, only useful when there are context lines
+		self._show_gaps = show_gaps
+		self._chunk_lines = max(1, chunk_lines)
+		self._chunks = []
+		self._parts = []
+		self._size = 0
+		self._matches = []
+		self._files = []
+		self._filename = None
+		self._line_number = 0
+		# the matched line not rendered yet, as (line_number, text, [(column, length)])
+		self._pending = None
+		self.match_count = 0
+		self.file_count = 0
+
+	def add_results(self, results, start: int = 0, end: int = None) -> None:
+		"""Render the rows of a FastFindResultSet from start on, up to end."""
+		for index in range(start, len(results) if end is None else end):
+			filename = results.filename(index)
+			line_number = results.line_number(index)
+			pending = self._pending
+			if pending is not None and filename == self._filename and line_number == pending[0]:
+				# another hit on the line that is still pending
+				pending[2].append((results.column(index), results.match_length(index)))
+				continue
+			self._flush_pending()
+			self._start_line(filename, line_number)
+			self._pending = (line_number, results.line_text(index),
+				[(results.column(index), results.match_length(index))])
+
+	def add_context(self, filename: str, line_number: int, text: str) -> None:
+		self._flush_pending()
+		self._start_line(filename, line_number)
+		self._write(CONTEXT_LINE_FORMAT.format(format_line_number(line_number), text))
+
+	def finish(self) -> None:
+		self._flush_pending()
+
+	def take_chunks(self) -> list:
+		"""Every chunk rendered since the last call, as FastFindRenderedChunks."""
+		self._seal_chunk()
+		chunks = self._chunks
+		self._chunks = []
+		return chunks
+
+	def _start_line(self, filename: str, line_number: int) -> None:
+		if filename != self._filename:
+			self._filename = filename
+			self.file_count += 1
+			self._write("\n")
+			self._files.append((self._size, filename))
+			self._write(filename + ":\n")
+		elif self._show_gaps and line_number > self._line_number + 1:
+			self._write(GAP_LINE)
+		self._line_number = line_number
+
+	def _flush_pending(self) -> None:
+		if self._pending is None:
+			return
+		line_number, text, hits = self._pending
+		self._pending = None
+		number = format_line_number(line_number)
+		# the match offsets are taken from the prefix actually written, however wide the number is
+		line_start = self._size + len(number) + 2
+		for column, length in hits:
+			# line texts are cut off at LINE_TEXT_MAX_CHARS, hits past that aren't marked
+			begin = min(column, len(text))
+			self._matches.append((line_start + begin, line_start + min(column + length, len(text))))
+		self.match_count += len(hits)
+		self._write(MATCH_LINE_FORMAT.format(number, text))
+
+	def _write(self, text: str) -> None:
+		# every write is one line (or a blank line), so chunks end on line boundaries
+		self._parts.append(text)
+		self._size += len(text)
+		if len(self._parts) >= self._chunk_lines:
+			self._seal_chunk()
+
+	def _seal_chunk(self) -> None:
+		if len(self._parts) == 0:
+			return
+		self._chunks.append(FastFindRenderedChunk("".join(self._parts), self._matches, self._files))
+		self._parts = []
+		self._size = 0
+		self._matches = []
+		self._files = []
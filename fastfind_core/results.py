@@ -0,0 +1,403 @@
+import os
+import sys
+import json
+import json.scanner
+import base64
+import struct
+from array import array
+
+#------------------------------------------------------------------------------
+# Ripgrep always writes the record type first, so match records can be picked out of the
+# stream with a prefix test and every other record type skipped without decoding it
+MATCH_RECORD_PREFIX = b'{"type":"match"'
+TYPED_RECORD_PREFIX = b'{"type":'
+MATCH_DATA_OFFSET = len(b'{"type":"match","data":')
+END_RECORD_PREFIX = b'{"type":"end"'
+SUMMARY_RECORD_PREFIX = b'{"type":"summary"'
+CONTEXT_RECORD_PREFIX = b'{"type":"context"'
+CONTEXT_DATA_OFFSET = len(b'{"type":"context","data":')
+
+# calling the JSON scanner directly skips the encoding detection and whitespace handling
+# json.loads does on every call, which is measurable at hundreds of thousands of records
+_scan_json = json.scanner.make_scanner(json.JSONDecoder())
+
+# matched lines are kept for display only, very long (minified) lines are cut off here
+LINE_TEXT_MAX_CHARS = 1000
+
+#------------------------------------------------------------------------------
+class FastFindResult:
+	__slots__ = ("filename", "line_number", "start_char_index", "match_length", "line_text")
+
+	def __init__(self, filename: str, line_number: int, startpos: int, matchlen: int, line_text: str = ""):
+		self.filename = filename
+		self.line_number = line_number
+		self.start_char_index = startpos
+		self.match_length = matchlen
+		self.line_text = line_text
+
+	def __getstate__(self):
+		return {name: getattr(self, name) for name in self.__slots__}
+
+	def __setstate__(self, state):
+		# older history files pickled these with a plain __dict__, which arrives here as a dict too
+		self.line_text = ""
+		for name, value in state.items():
+			setattr(self, name, value)
+
+	@staticmethod
+	def from_json(json_content):
+		start_pos = int(json_content['submatches'][0]['start'])
+		match_len = int(json_content['submatches'][0]['end']) - start_pos
+		return FastFindResult(decode_path(json_content['path']),
+			int(json_content['line_number']),
+			start_pos,
+			match_len)
+
+	def to_string(self) -> str:
+		return "FastFindResult: filename = {0}\n\tline_number = {1}\n\tstart_char_index = {2}\n\tmatch_length = {3}\n".format(
+			self.filename,
+			self.line_number,
+			self.start_char_index,
+			self.match_length)
+
+
+#------------------------------------------------------------------------------
+class FastFindResultSet:
+	"""Search results stored column-wise instead of as one FastFindResult per hit.
+
+	Each distinct filename is kept once in a table and rows refer to it by index. Line number,
+	column and match length live in compact arrays, the text of the matched line (empty when
+	the engine didn't report it) in a list. Indexing or iterating returns
+	FastFindResult objects built on demand, so callers that only need one row at a time
+	(quick panel callbacks) never hold the whole result list as objects.
+	"""
+	def __init__(self, results=None):
+		self._filenames = []
+		self._file_ids = {}
+		self._file_index = array("I")
+		self._line_numbers = array("I")
+		self._columns = array("I")
+		self._match_lengths = array("I")
+		self._line_texts = []
+		if results is not None:
+			self.extend(results)
+
+	def __len__(self) -> int:
+		# match lengths are written last by append(), so every row below this count is complete
+		return len(self._match_lengths)
+
+	def __getitem__(self, index: int) -> FastFindResult:
+		if index < 0:
+			index += len(self)
+		return FastFindResult(self._filenames[self._file_index[index]],
+			self._line_numbers[index],
+			self._columns[index],
+			self._match_lengths[index],
+			self._line_texts[index])
+
+	def __iter__(self):
+		for index in range(len(self)):
+			yield self[index]
+
+	def __eq__(self, other) -> bool:
+		if not isinstance(other, FastFindResultSet):
+			return NotImplemented
+		if (len(self) != len(other) or self._line_numbers != other._line_numbers
+			or self._columns != other._columns or self._match_lengths != other._match_lengths
+			or self._line_texts != other._line_texts):
+			return False
+		if self._filenames == other._filenames:
+			return self._file_index == other._file_index
+		return all(self.filename(index) == other.filename(index) for index in range(len(self)))
+
+	def __ne__(self, other) -> bool:
+		equal = self.__eq__(other)
+		if equal is NotImplemented:
+			return equal
+		return not equal
+
+	__hash__ = None
+
+	def __getstate__(self):
+		return {
+			"filenames": self._filenames,
+			"file_index": self._file_index,
+			"line_numbers": self._line_numbers,
+			"columns": self._columns,
+			"match_lengths": self._match_lengths,
+			"line_texts": self._line_texts,
+		}
+
+	def __setstate__(self, state):
+		self._filenames = state["filenames"]
+		self._file_ids = {filename: file_id for file_id, filename in enumerate(self._filenames)}
+		self._file_index = state["file_index"]
+		self._line_numbers = state["line_numbers"]
+		self._columns = state["columns"]
+		self._match_lengths = state["match_lengths"]
+		self._line_texts = state.get("line_texts") or [""] * len(self._match_lengths)
+
+	def to_bytes(self) -> bytes:
+		"""Serialize to a compact, pickle-free form (see from_bytes)."""
+		filenames = "\0".join(self._filenames).encode("utf8", "surrogatepass")
+		columns = [self._file_index, self._line_numbers, self._columns, self._match_lengths]
+		if sys.byteorder == "big":
+			columns = [array("I", column) for column in columns]
+			for column in columns:
+				column.byteswap()
+		header = struct.pack("<III", len(self._filenames), len(self), len(filenames))
+		parts = [header, filenames] + [column.tobytes() for column in columns]
+		if any(self._line_texts):
+			# an optional trailing section, so results serialized without it still load
+			parts.append("\n".join(self._line_texts).encode("utf8", "surrogatepass"))
+		return b"".join(parts)
+
+	@staticmethod
+	def from_bytes(data: bytes) -> "FastFindResultSet":
+		num_files, num_rows, filenames_len = struct.unpack_from("<III", data)
+		offset = struct.calcsize("<III")
+		results = FastFindResultSet()
+		if num_files > 0:
+			results._filenames = data[offset:offset + filenames_len].decode("utf8", "surrogatepass").split("\0")
+			results._file_ids = {filename: file_id for file_id, filename in enumerate(results._filenames)}
+		offset += filenames_len
+		columns = []
+		for _ in range(4):
+			column = array("I")
+			column.frombytes(data[offset:offset + num_rows * column.itemsize])
+			if sys.byteorder == "big":
+				column.byteswap()
+			offset += num_rows * column.itemsize
+			columns.append(column)
+		results._file_index, results._line_numbers, results._columns, results._match_lengths = columns
+		if offset < len(data):
+			results._line_texts = data[offset:].decode("utf8", "surrogatepass").split("\n")
+		else:
+			results._line_texts = [""] * num_rows
+		return results
+
+	def file_id(self, filename: str) -> int:
+		file_id = self._file_ids.get(filename)
+		if file_id is None:
+			file_id = len(self._filenames)
+			self._filenames.append(filename)
+			self._file_ids[filename] = file_id
+		return file_id
+
+	def append(self, filename: str, line_number: int, start_char_index: int, match_length: int, line_text: str = "") -> None:
+		self._file_index.append(self.file_id(filename))
+		self._line_numbers.append(line_number)
+		self._columns.append(start_char_index)
+		self._line_texts.append(line_text)
+		self._match_lengths.append(match_length)
+
+	def extend(self, results) -> None:
+		if isinstance(results, FastFindResultSet):
+			remap = [self.file_id(filename) for filename in results._filenames]
+			self._file_index.extend(remap[file_id] for file_id in results._file_index)
+			self._line_numbers.extend(results._line_numbers)
+			self._columns.extend(results._columns)
+			self._line_texts.extend(results._line_texts)
+			self._match_lengths.extend(results._match_lengths)
+			return
+		for result in results:
+			self.append(result.filename, result.line_number, result.start_char_index, result.match_length,
+				getattr(result, "line_text", ""))
+
+	def select(self, indices: list, match_lengths: list = None) -> "FastFindResultSet":
+		"""A new set of the rows at indices, in that order, with match_lengths instead of their own if given."""
+		selected = FastFindResultSet()
+		remap = {}
+		file_index = []
+		for index in indices:
+			file_id = self._file_index[index]
+			selected_id = remap.get(file_id)
+			if selected_id is None:
+				selected_id = remap[file_id] = selected.file_id(self._filenames[file_id])
+			file_index.append(selected_id)
+		selected._file_index = array("I", file_index)
+		selected._line_numbers = array("I", [self._line_numbers[index] for index in indices])
+		selected._columns = array("I", [self._columns[index] for index in indices])
+		selected._line_texts = [self._line_texts[index] for index in indices]
+		if match_lengths is None:
+			match_lengths = [self._match_lengths[index] for index in indices]
+		selected._match_lengths = array("I", match_lengths)
+		return selected
+
+	def truncate(self, length: int) -> None:
+		"""Drop every row from length on. Filenames only those rows used stay in the table."""
+		# match lengths go first, so a concurrent len() never counts a row being removed
+		del self._match_lengths[length:]
+		del self._columns[length:]
+		del self._line_texts[length:]
+		del self._line_numbers[length:]
+		del self._file_index[length:]
+
+	def filenames(self) -> list:
+		"""The table of distinct filenames, in the order they were first seen."""
+		return self._filenames
+
+	def filename_index(self, index: int) -> int:
+		return self._file_index[index]
+
+	def filename(self, index: int) -> str:
+		return self._filenames[self._file_index[index]]
+
+	def line_number(self, index: int) -> int:
+		return self._line_numbers[index]
+
+	def column(self, index: int) -> int:
+		return self._columns[index]
+
+	def match_length(self, index: int) -> int:
+		return self._match_lengths[index]
+
+	def line_text(self, index: int) -> str:
+		return self._line_texts[index]
+
+
+#------------------------------------------------------------------------------
+def decode_path(json_data: dict) -> str:
+	# rg sends paths that aren't valid UTF-8 base64 encoded under "bytes" instead of "text"
+	if 'text' in json_data:
+		return json_data['text']
+	return os.fsdecode(base64.b64decode(json_data['bytes']))
+
+
+#------------------------------------------------------------------------------
+def decode_line(json_data: dict) -> bytes:
+	if 'text' in json_data:
+		return json_data['text'].encode("utf8")
+	return base64.b64decode(json_data['bytes'])
+
+
+#------------------------------------------------------------------------------
+def parse_match_record(match_data: dict, results: FastFindResultSet) -> int:
+	"""Append one row for every submatch of a decoded rg match record, returning the rows added."""
+	path = match_data['path']
+	if 'text' in path:
+		filename = path['text']
+	else:
+		filename = decode_path(path)
+	line_number = int(match_data['line_number'])
+	lines = match_data.get('lines', {})
+	line_text = line_text_for_display(lines)
+	submatches = match_data['submatches']
+	if len(submatches) == 0:
+		results.append(filename, line_number, 0, 0, line_text)
+		return 1
+
+	# rg reports submatch offsets in bytes, Sublime wants character offsets. They only
+	# differ for lines with non-ASCII text, which is the only time the line gets decoded
+	line_bytes = None
+	if 'bytes' in lines or not lines.get('text', "").isascii():
+		line_bytes = decode_line(lines)
+
+	for submatch in submatches:
+		start_pos = int(submatch['start'])
+		end_pos = int(submatch['end'])
+		if line_bytes is not None:
+			prefix_len = len(line_bytes[:start_pos].decode("utf8", "replace"))
+			end_pos = prefix_len + len(line_bytes[start_pos:end_pos].decode("utf8", "replace"))
+			start_pos = prefix_len
+		results.append(filename, line_number, start_pos, end_pos - start_pos, line_text)
+	return len(submatches)
+
+
+def line_text_for_display(lines: dict) -> str:
+	"""The matched line of an rg record without its line ending, cut to LINE_TEXT_MAX_CHARS."""
+	if 'text' in lines:
+		text = lines['text']
+	else:
+		text = decode_line(lines).decode("utf8", "replace")
+	return text[:LINE_TEXT_MAX_CHARS].rstrip("\r\n")
+
+
+#------------------------------------------------------------------------------
+def decode_match_data(line: bytes) -> dict:
+	"""Decode the "data" object of a line already known to start with MATCH_RECORD_PREFIX."""
+	return _scan_json(line.decode("utf8"), MATCH_DATA_OFFSET)[0]
+
+
+#------------------------------------------------------------------------------
+def parse_search_record(line: bytes, results: FastFindResultSet) -> int:
+	"""Parse a single raw line of rg --json output into results, returning the rows added."""
+	if not line.startswith(MATCH_RECORD_PREFIX):
+		if line.startswith(TYPED_RECORD_PREFIX) or line.strip() == b"":
+			return 0
+		# not in the layout rg normally uses, fall back to decoding the whole record
+		json_result = json.loads(line)
+		if json_result['type'] != 'match':
+			return 0
+		return parse_match_record(json_result['data'], results)
+	return parse_match_record(decode_match_data(line), results)
+
+
+#------------------------------------------------------------------------------
+def parse_search_progress(line: bytes) -> tuple:
+	"""Bytes searched according to an rg end or summary record, as (bytes, summary).
+
+	End records follow every file with a match and have no summary. The summary record at the
+	end of the output covers all files searched, summary is then a dict of its elapsed
+	(seconds), bytes_searched and files_searched. Other records return None.
+	"""
+	if line.startswith(END_RECORD_PREFIX) or line.startswith(SUMMARY_RECORD_PREFIX):
+		record = json.loads(line)
+	elif line.startswith(TYPED_RECORD_PREFIX) or line.strip() == b"":
+		return None
+	else:
+		# not in the layout rg normally uses, see parse_search_record
+		record = json.loads(line)
+	if record.get('type') == 'end':
+		return int(record['data']['stats']['bytes_searched']), None
+	if record.get('type') == 'summary':
+		stats = record['data']['stats']
+		elapsed = stats.get('elapsed', {})
+		summary = {
+			"elapsed": elapsed.get('secs', 0) + elapsed.get('nanos', 0) / 1e9,
+			"bytes_searched": int(stats['bytes_searched']),
+			"files_searched": int(stats.get('searches', 0)),
+		}
+		return summary["bytes_searched"], summary
+	return None
+
+
+#------------------------------------------------------------------------------
+def parse_search_context(line: bytes) -> tuple:
+	"""The line an rg context record (from -B/-A) holds, as (filename, line_number, text).
+
+	Other records return None.
+	"""
+	if line.startswith(CONTEXT_RECORD_PREFIX):
+		context_data = _scan_json(line.decode("utf8"), CONTEXT_DATA_OFFSET)[0]
+	elif line.startswith(TYPED_RECORD_PREFIX) or line.strip() == b"":
+		return None
+	else:
+		# not in the layout rg normally uses, see parse_search_record
+		record = json.loads(line)
+		if record.get('type') != 'context':
+			return None
+		context_data = record['data']
+	return (decode_path(context_data['path']), int(context_data['line_number']),
+		line_text_for_display(context_data.get('lines', {})))
+
+
+#------------------------------------------------------------------------------
+def parse_search_results(lines) -> FastFindResultSet:
+	"""Parse an iterable of raw rg --json output lines (bytes)."""
+	results = FastFindResultSet()
+	for line in lines:
+		if line.startswith(MATCH_RECORD_PREFIX):
+			parse_match_record(decode_match_data(line), results)
+		elif not line.startswith(TYPED_RECORD_PREFIX):
+			parse_search_record(line, results)
+	return results
+
+
+#------------------------------------------------------------------------------
+def parse_search_results_from_json(content) -> FastFindResultSet:
+	# NOTE(BH): Ripgrep splits json results using Unix line-endings, so even on Windows,
+	# we need split the results on the Unix line termination character and not use os.linesep
+	if isinstance(content, str):
+		content = content.encode("utf8")
+	return parse_search_results(content.split(b"\n"))
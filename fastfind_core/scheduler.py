@@ -0,0 +1,161 @@
+import time
+import heapq
+import itertools
+import threading
+import traceback
+
+from .cancel import FastFindCancelToken
+
+#------------------------------------------------------------------------------
+# lower runs first: searches someone is waiting for, then live search previews, then
+# background work such as checking whether cached results are still current
+PRIORITY_INTERACTIVE = 0
+PRIORITY_LIVE = 1
+PRIORITY_BACKGROUND = 2
+
+#------------------------------------------------------------------------------
+class FastFindScheduledSearch:
+	"""One run of a search and every caller waiting for its results."""
+	def __init__(self, search, priority: int, key, queued: float):
+		self.search = search
+		self.priority = priority
+		self.key = key
+		self.queued = queued
+		self.started = None
+		# (search, when it was submitted) of the searches waiting for this one's results
+		self.followers = []
+		self.callers = 1
+		self.search_token = None
+
+
+class _Detach:
+	"""Registered with a caller's cancel token, so cancelling it gives up that caller's share."""
+	def __init__(self, scheduler: "FastFindScheduler", scheduled: FastFindScheduledSearch):
+		self._scheduler = scheduler
+		self._scheduled = scheduled
+
+	def terminate(self) -> None:
+		self._scheduler._detach(self._scheduled)
+
+
+#------------------------------------------------------------------------------
+class FastFindScheduler:
+	"""Runs searches for the whole plugin, at most max_running at a time.
+
+	Searches wait in a queue ordered by priority, then by when they were submitted. While
+	more than one may run, background searches are kept to max_running - 1 so an interactive
+	search never waits behind them. A search submitted with the key of one that is queued or
+	running doesn't run again, it gets the first one's results when that finishes (see
+	FastFindSearchRunner.adopt). The shared run is cancelled only once every search waiting
+	for it has been. on_change is called, from whichever thread changed it, when the number
+	of running or queued searches changes.
+
+	Searches need run(), finish(), adopt(), share_search_token() and _cancel_token, as
+	FastFindSearchRunner has.
+	"""
+	def __init__(self, max_running: int = 2, on_change=None):
+		self._max_running = max(1, max_running)
+		self._on_change = on_change
+		self._queue = []
+		self._sequence = itertools.count()
+		# key -> FastFindScheduledSearch, while it is queued or running
+		self._by_key = {}
+		self._waiting = set()
+		self._running = set()
+		self._lock = threading.Lock()
+
+	def set_max_running(self, max_running: int) -> None:
+		with self._lock:
+			self._max_running = max(1, max_running)
+			self._start_queued()
+		self._changed()
+
+	def submit(self, search, priority: int = PRIORITY_INTERACTIVE, key=None) -> None:
+		"""Queue search to run, or with a key, join a queued or running search with the same key."""
+		queued = time.time()
+		with self._lock:
+			scheduled = self._by_key.get(key) if key is not None else None
+			if scheduled is not None and not scheduled.search_token.cancelled:
+				scheduled.followers.append((search, queued))
+				scheduled.callers += 1
+				if priority < scheduled.priority and scheduled.started is None:
+					# the old queue entry is skipped when it comes up
+					scheduled.priority = priority
+					heapq.heappush(self._queue, (priority, next(self._sequence), scheduled))
+				print("[FastFind] Search for '%s' joins the identical search already %s" % (search._symbol,
+					"queued" if scheduled.started is None else "running"))
+			else:
+				scheduled = FastFindScheduledSearch(search, priority, key, queued)
+				if key is not None:
+					scheduled.search_token = FastFindCancelToken()
+					search.share_search_token(scheduled.search_token)
+					self._by_key[key] = scheduled
+				self._waiting.add(scheduled)
+				heapq.heappush(self._queue, (priority, next(self._sequence), scheduled))
+				self._start_queued()
+		if key is not None:
+			search._cancel_token.register(_Detach(self, scheduled))
+		self._changed()
+
+	def status(self) -> tuple:
+		"""(running, queued, seconds the longest queued search has waited)"""
+		with self._lock:
+			now = time.time()
+			longest_wait = max((now - scheduled.queued for scheduled in self._waiting), default=0.0)
+			return len(self._running), len(self._waiting), longest_wait
+
+	#--------------------------------------------------------------------------
+	def _start_queued(self) -> None:
+		# called with the lock held
+		while len(self._queue) > 0:
+			priority, _, scheduled = self._queue[0]
+			if scheduled.started is not None or priority != scheduled.priority:
+				heapq.heappop(self._queue)
+				continue
+			limit = self._max_running
+			if priority >= PRIORITY_BACKGROUND and limit > 1:
+				limit -= 1
+			if len(self._running) >= limit:
+				# anything queued behind it has the same or a lower priority
+				return
+			heapq.heappop(self._queue)
+			self._waiting.discard(scheduled)
+			self._running.add(scheduled)
+			scheduled.started = time.time()
+			threading.Thread(target=self._run, args=(scheduled,)).start()
+
+	def _run(self, scheduled: FastFindScheduledSearch) -> None:
+		leader = scheduled.search
+		leader._stats.queue_ms = (scheduled.started - scheduled.queued) * 1000.0
+		try:
+			leader.run()
+		except Exception:
+			traceback.print_exc()
+		with self._lock:
+			if self._by_key.get(scheduled.key) is scheduled:
+				del self._by_key[scheduled.key]
+			self._running.discard(scheduled)
+			followers = list(scheduled.followers)
+			self._start_queued()
+		self._changed()
+		for follower, queued in followers:
+			try:
+				follower.adopt(leader)
+				# only the wait for the shared run to start, not the part of it the follower sat out
+				follower._stats.queue_ms = max(0.0, scheduled.started - queued) * 1000.0
+			finally:
+				follower.finish()
+
+	def _detach(self, scheduled: FastFindScheduledSearch) -> None:
+		with self._lock:
+			scheduled.callers -= 1
+			if scheduled.callers > 0:
+				return
+			if self._by_key.get(scheduled.key) is scheduled:
+				# a new identical search must not join a cancelled run
+				del self._by_key[scheduled.key]
+		scheduled.search_token.cancel()
+
+	def _changed(self) -> None:
+		if self._on_change is not None:
+			self._on_change()
@@ -0,0 +1,362 @@
+import os
+import errno
+import time
+import threading
+import concurrent.futures
+
+from .batch import split_results_by_term
+from .cancel import FastFindCancelToken
+from .engines import FastFindSearch, FastFindSearchEngine
+from .progress import FastFindSearchProgress
+from .render import FastFindResultsRenderer
+from .results import FastFindResultSet
+from .settings import FastFindSettings
+from .shards import FastFindShard, make_file_shards
+from .stats import FastFindSearchStats
+
+#------------------------------------------------------------------------------
+class FastFindSearchRunner:
+	"""One search from start to finish: sharding, running the engine, parsing and limits.
+
+	Sublime-free, so the same pipeline runs in the editor and from the command line. The
+	_post_* and _report_* methods are where results, progress and errors leave the search;
+	they do nothing (or print) here, the plugin's worker overrides them to hand everything
+	to the UI thread. search() runs on the caller's thread, run() also calls finish().
+
+	cancel_token belongs to whoever asked for the search. The processes and scans are
+	registered with _search_token, which is the same token unless a FastFindScheduler shares
+	this run between several callers and only cancels it once all of them have.
+	"""
+	def __init__(self, symbol, folders: list, case_sensitive: bool, settings: FastFindSettings, engine: FastFindSearchEngine,
+			cancel_token: FastFindCancelToken = None, max_results: int = 0, scope=None):
+		self._symbol = symbol
+		# what the engine searches for: symbol, or a tuple of terms set by a batch search
+		self._search_terms = symbol
+		# a batch search's results by term, filled in by search()
+		self._term_results = None
+		self._folders = list(folders)
+		self._output = FastFindResultSet()
+		self._case_sensitive = case_sensitive
+		# a snapshot, the search never reads settings from anywhere else
+		self._settings = settings
+		self._engine = engine
+		# a FastFindGitScope, which lists the files to search instead of the engine walking folders
+		self._scope = scope
+		self._progress = FastFindSearchProgress()
+		self._stats = FastFindSearchStats(symbol, engine.name, self._folders)
+		self._cancel_token = cancel_token if cancel_token is not None else FastFindCancelToken()
+		self._search_token = self._cancel_token
+		self._finished = threading.Event()
+		self._returncode = None
+		# stop once this many results have been found, 0 for no limit
+		self._max_results = max_results
+		self._max_per_file = int(settings.get("max_results_per_file", 0))
+		self._truncated = False
+		# hits kept so far by every shard together, which max_results applies to
+		self._found = 0
+		self._found_lock = threading.Lock()
+		self._elapsed = 0
+		self._shard_timings = []
+		self._error_reported = False
+		self._batch_size = int(settings.get("stream_batch_size", 500))
+		self._batch_interval = settings.get("stream_refresh_ms", 250) / 1000.0
+
+	@property
+	def cancelled(self) -> bool:
+		return self._cancel_token.cancelled
+
+	@property
+	def finished(self) -> bool:
+		return self._finished.is_set()
+
+	def dedupe_key(self) -> tuple:
+		"""Searches with equal keys find the same results, so one run can serve them all."""
+		# the settings snapshot is compared by identity, the running search keeps it alive
+		return (self._search_terms, tuple(self._folders), bool(self._case_sensitive), self._engine.name,
+			self._max_results, None if self._scope is None else (self._scope.scope, self._scope.ref), id(self._settings))
+
+	def share_search_token(self, search_token: FastFindCancelToken) -> None:
+		"""Run the search under search_token instead of the caller's cancel token."""
+		self._search_token = search_token
+
+	def adopt(self, other: "FastFindSearchRunner") -> None:
+		"""Take the outcome of an identical search that ran in this one's place."""
+		self._output = other._output
+		self._term_results = other._term_results
+		self._returncode = other._returncode
+		self._truncated = other._truncated
+		self._elapsed = other._elapsed
+		self._progress = other._progress
+		self._shard_timings = other._shard_timings
+		self._stats.copy_run(other._stats)
+		self._stats.cancelled = self.cancelled
+
+	#--------------------------------------------------------------------------
+	# where the search hands its output on, see the class docstring
+
+	def _post_progress(self) -> None:
+		pass
+
+	def _post_results(self, batch: FastFindResultSet) -> None:
+		pass
+
+	def _post_rendered(self, renderer: FastFindResultsRenderer) -> None:
+		pass
+
+	def _make_renderer(self) -> FastFindResultsRenderer:
+		return None
+
+	def _report_error(self, message: str) -> None:
+		print("[FastFind] " + message)
+
+	def _report_status(self, message: str) -> None:
+		pass
+
+	def finish(self) -> None:
+		"""Called once the results are final, whether searched or adopted."""
+		self._finished.set()
+
+	#--------------------------------------------------------------------------
+	def run(self) -> None:
+		try:
+			self.search()
+		finally:
+			self.finish()
+
+	def search(self) -> FastFindResultSet:
+		"""Run the search to the end (or until cancelled) and return its results."""
+		print("[FastFind] Searching '%s' for '%s'" % (", ".join(self._folders), self._symbol))
+		start = time.time()
+		try:
+			if self._search_token.cancelled:
+				# everyone waiting for it gave up while it was queued
+				return self._output
+			shard_start = time.perf_counter()
+			shards = self.make_shards()
+			self._stats.shard_ms = (time.perf_counter() - shard_start) * 1000.0
+			self._stats.shards = len(shards or ())
+			if shards is None:
+				self._returncode = 2
+			elif len(shards) == 0:
+				# the index ruled out every file, or the scope has none
+				self._returncode = 1
+			elif len(shards) > 1 or len(shards[0].extra_args) > 0 or shards[0].files is not None:
+				self._output = self.run_shards(shards)
+			else:
+				# batches only go anywhere when _post_results does, but reading the output record by
+				# record also keeps memory bounded and lets max_results stop the search early
+				self._output = self.stream_search(shards[0])
+			if not isinstance(self._search_terms, str) and not self._search_token.cancelled:
+				self._term_results = split_results_by_term(self._output, self._search_terms, self._case_sensitive)
+		finally:
+			self._elapsed = time.time() - start
+			self._stats.total_ms = self._elapsed * 1000.0
+			self._stats.results = len(self._output)
+			self._stats.truncated = self._truncated
+			self._stats.cancelled = self.cancelled
+			self._stats.returncode = self._returncode
+		return self._output
+
+	def make_shards(self) -> list:
+		"""The engine's shards, or with a scope the scope's files. None if the scope failed."""
+		if self._scope is None:
+			return self._engine.make_shards(self._folders, self._search_terms, self._case_sensitive, self._settings)
+		shards = []
+		for folder in self._folders:
+			try:
+				files = self._scope.files(folder, self._settings)
+			except ValueError as e:
+				self._report_error("FastFind ERROR: can't search {0}: {1}".format(self._scope.describe(), e))
+				return None
+			print("[FastFind] Searching {0} of {1} in '{2}'".format(len(files), self._scope.describe(), folder))
+			shards.extend(make_file_shards(folder, files))
+		return shards
+
+	def start_search(self, shard: FastFindShard) -> FastFindSearch:
+		if shard.path is None or shard.path == "":
+			self._report_error("No search path specified!")
+			return None
+		if self._search_token.cancelled:
+			return None
+		spawn_start = time.perf_counter()
+		try:
+			search = self._engine.start(shard, self._search_terms, self._case_sensitive, self._settings)
+		except (OSError, ValueError) as e:
+			if self._error_reported:
+				# every shard of a sharded search fails the same way, one report is enough
+				return None
+			self._error_reported = True
+			if isinstance(e, OSError) and e.errno == errno.ENOENT:
+				self._report_error("FastFind ERROR: fastfind binary \"%s\" not found!" % self._engine.executable(self._settings))
+			else:
+				self._report_error("FastFind ERROR: %s search failed: %s" % (self._engine.name, e))
+			print("FastFind: Exiting due to error")
+			return None
+		self._stats.add_spawn(time.perf_counter() - spawn_start)
+		# a search cancelled between the check above and now is terminated here
+		self._search_token.register(search)
+		return search
+
+	def stream_search(self, shard: FastFindShard) -> FastFindResultSet:
+		"""Run the search and parse the engine's output one record at a time as it is produced.
+
+		Batches of results are posted every stream_batch_size hits or stream_refresh_ms
+		milliseconds, whichever comes first. Only the parsed results are kept, so memory
+		no longer grows with the size of rg's raw output.
+		"""
+		print("FastFind: Search path is '{0}'".format(shard.path))
+		search = self.start_search(shard)
+		results = FastFindResultSet()
+		if search is None:
+			return results
+		renderer = self._make_renderer()
+		self._returncode = self._read_results(search, results, self._post_results, renderer)
+		self._post_rendered(renderer)
+		return results
+
+	def _read_results(self, search: FastFindSearch, results: FastFindResultSet, on_batch, renderer: FastFindResultsRenderer = None) -> int:
+		batch = FastFindResultSet()
+		# hits per file in this search, for progress and max_results_per_file
+		file_counts = {}
+		last_flush = time.time()
+		read_start = time.perf_counter()
+		first_byte = None
+		parse_time = 0.0
+		limit_reached = False
+		for record in search.records():
+			parse_start = time.perf_counter()
+			if first_byte is None:
+				first_byte = parse_start - read_start
+			if self._search_token.cancelled or self._truncated:
+				# cancelled, or another shard already found max_results hits
+				search.terminate()
+				break
+			start = len(batch)
+			if search.parse_record(record, batch) == 0:
+				bytes_searched = search.parse_progress(record)
+				if bytes_searched > 0:
+					self._progress.add(bytes_searched=bytes_searched)
+					self._post_progress()
+				elif renderer is not None:
+					context = search.parse_context(record)
+					if context is not None:
+						renderer.add_context(*context)
+				parse_time += time.perf_counter() - parse_start
+				continue
+			new_files = self._count_per_file(batch, start, file_counts)
+			limit_reached = self._max_results > 0 and self._cap_total(batch, start)
+			if renderer is not None:
+				renderer.add_results(batch, start)
+			self._progress.add(matches=len(batch) - start, files_with_matches=new_files)
+			self._post_progress()
+			parse_time += time.perf_counter() - parse_start
+			if limit_reached:
+				search.terminate()
+				break
+			if on_batch is not None and (len(batch) >= self._batch_size or time.time() - last_flush >= self._batch_interval):
+				results.extend(batch)
+				on_batch(batch)
+				self._post_rendered(renderer)
+				batch = FastFindResultSet()
+				last_flush = time.time()
+
+		returncode = search.wait()
+		if limit_reached:
+			# terminated because it found enough, not because it failed
+			returncode = 0
+		self._stats.add_process(first_byte, time.perf_counter() - read_start, parse_time, search.summary)
+		self._search_token.unregister(search)
+		if renderer is not None:
+			renderer.finish()
+		if len(batch) > 0:
+			results.extend(batch)
+			if on_batch is not None:
+				on_batch(batch)
+		return returncode
+
+	def _count_per_file(self, batch: FastFindResultSet, start: int, file_counts: dict) -> int:
+		"""Count the rows batch gained from start on per file, dropping any over max_results_per_file.
+
+		Returns the number of files those rows are the first hits in.
+		"""
+		new_files = 0
+		kept = []
+		for index in range(start, len(batch)):
+			filename = batch.filename(index)
+			count = file_counts.get(filename, 0) + 1
+			file_counts[filename] = count
+			if count == 1:
+				new_files += 1
+			if self._max_per_file <= 0 or count <= self._max_per_file:
+				kept.append(index)
+		if len(kept) < len(batch) - start:
+			rows = [batch[index] for index in kept]
+			batch.truncate(start)
+			batch.extend(rows)
+		return new_files
+
+	def _cap_total(self, batch: FastFindResultSet, start: int) -> bool:
+		"""Count the rows batch gained from start on, dropping any past max_results.
+
+		Returns True once the limit is reached, which stops every shard of the search.
+		"""
+		with self._found_lock:
+			self._found += len(batch) - start
+			overflow = self._found - self._max_results
+			if overflow < 0:
+				return False
+			self._found -= overflow
+			self._truncated = True
+		batch.truncate(len(batch) - overflow)
+		return True
+
+	def search_shard(self, shard: FastFindShard) -> tuple:
+		start = time.time()
+		search = self.start_search(shard)
+		results = FastFindResultSet()
+		renderer = self._make_renderer()
+		if search is None:
+			return results, None, time.time() - start, renderer
+		returncode = self._read_results(search, results, None, renderer)
+		return results, returncode, time.time() - start, renderer
+
+	def run_shards(self, shards: list) -> FastFindResultSet:
+		"""Search every shard in a bounded pool of searches.
+
+		Results are merged in shard order, so the output doesn't depend on which process
+		finishes first. A shard's results are passed on as soon as it and every shard
+		before it are done.
+		"""
+		start = time.time()
+		max_processes = self._settings.get("max_search_processes", 0)
+		if max_processes <= 0:
+			max_processes = os.cpu_count() or 1
+		results = FastFindResultSet()
+		returncodes = []
+		with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_processes, len(shards))) as pool:
+			futures = [pool.submit(self.search_shard, shard) for shard in shards]
+			for shard, future in zip(shards, futures):
+				shard_results, returncode, elapsed, renderer = future.result()
+				returncodes.append(returncode)
+				self._shard_timings.append((shard.describe(), elapsed, len(shard_results)))
+				print("[FastFind] Shard '{0}': {1} results in {2:.3f}s".format(shard.describe(), len(shard_results), elapsed))
+				results.extend(shard_results)
+				if len(shard_results) > 0:
+					self._post_results(shard_results)
+				self._post_rendered(renderer)
+
+		# one failed shard makes the whole search a failure, any match makes it a success
+		if None in returncodes or 2 in returncodes:
+			self._returncode = 2
+		elif 0 in returncodes:
+			self._returncode = 0
+		else:
+			self._returncode = 1
+
+		elapsed = time.time() - start
+		slowest = max(self._shard_timings, key=lambda timing: timing[1])
+		summary = "FastFind: searched {0} shards with {1} processes in {2:.2f}s, slowest '{3}' {4:.2f}s".format(
+			len(shards), min(max_processes, len(shards)), elapsed, slowest[0], slowest[1])
+		print("[FastFind] " + summary)
+		self._report_status(summary)
+		return results
@@ -0,0 +1,169 @@
+import re
+import json
+from types import MappingProxyType
+
+#------------------------------------------------------------------------------
+SETTINGS_PREFIX = "FastFindSublime_"
+
+# every setting FastFind reads, so a snapshot can be taken without enumerating the settings file
+SETTINGS_KEYS = (
+	"file_type_pattern",
+	"non_std_file_type_pattern",
+	"ignore_folders",
+	"prompt_before_searching",
+	"executable",
+	"before_context",
+	"after_context",
+	"display_outline",
+	"history_file",
+	"history_max_entries",
+	"history_max_size_mb",
+	"result_cache_max_entries",
+	"stream_results",
+	"stream_batch_size",
+	"stream_refresh_ms",
+	"search_all_folders",
+	"split_top_level_folders",
+	"max_search_processes",
+	"max_concurrent_searches",
+	"live_search",
+	"live_search_debounce_ms",
+	"live_search_min_length",
+	"live_search_max_results",
+	"live_search_preview_count",
+	"search_engine",
+	"index_max_file_size_kb",
+	"index_rescan_interval_s",
+	"index_verify",
+	"max_results",
+	"max_results_per_file",
+	"quick_panel_page_size",
+	"quick_panel_line_text",
+	"preview_delay_ms",
+	"stats_max_entries",
+	"stats_export_file",
+	"results_output",
+	"file_list_cache",
+	"file_list_max_age_s",
+)
+
+#------------------------------------------------------------------------------
+def load_settings_file(filename: str) -> dict:
+	"""The FastFind settings in a .sublime-settings file, by key without SETTINGS_PREFIX.
+
+	For use outside Sublime, which reads the file itself. Handles the line comments and
+	trailing commas Sublime allows in it.
+	"""
+	with open(filename, encoding="utf8") as settings_file:
+		text = settings_file.read()
+	text = re.sub(r"^\s*//.*$", "", text, flags=re.MULTILINE)
+	text = re.sub(r",(\s*[\]}])", r"\1", text)
+	values = {}
+	for key, value in json.loads(text).items():
+		if key.startswith(SETTINGS_PREFIX) and key[len(SETTINGS_PREFIX):] in SETTINGS_KEYS:
+			values[key[len(SETTINGS_PREFIX):]] = value
+	return values
+
+
+def ignore_folder_patterns(patterns) -> list:
+	"""The ignore_folders setting as directory name globs, without trailing slashes."""
+	ignored = []
+	for pattern in patterns or []:
+		pattern = str(pattern).rstrip("/\\")
+		if pattern != "":
+			ignored.append(pattern)
+	return ignored
+
+
+def search_terms(search_term) -> tuple:
+	"""The terms of a search, which is either one term or a tuple of them (a batch search)."""
+	if isinstance(search_term, str):
+		return (search_term,)
+	return tuple(search_term)
+
+
+#------------------------------------------------------------------------------
+class FastFindSettings:
+	"""Read-only snapshot of the FastFind settings.
+
+	Built once on the UI thread (and again whenever the settings file changes) and handed to
+	search workers, so they never call into the Sublime API. The parts of the rg command line
+	that only depend on settings are compiled once per snapshot.
+	"""
+	def __init__(self, values: dict):
+		self._values = MappingProxyType(dict(values))
+		self._search_argv = {
+			True: self._compile_search_argv(True),
+			False: self._compile_search_argv(False),
+		}
+
+	def has(self, key: str) -> bool:
+		return key in self._values
+
+	def get(self, key: str, default=None):
+		value = self._values.get(key)
+		if value is None:
+			return default
+		return value
+
+	def search_argv(self, case_sensitive: bool) -> tuple:
+		"""The rg arguments shared by every search, up to (not including) the term and path."""
+		return self._search_argv[bool(case_sensitive)]
+
+	def make_search_argv(self, search_term, path, case_sensitive: bool, extra_args: tuple = ()) -> list:
+		"""Full rg command line searching path, which may also be a list of files.
+
+		search_term may also be a tuple of terms, which rg then matches any of.
+		"""
+		argv = list(self._search_argv[bool(case_sensitive)])
+		argv.extend(extra_args)
+		# -e and -- keep terms and paths that start with a dash from being read as options
+		for term in search_terms(search_term):
+			argv.extend(("-e", term))
+		argv.append("--")
+		if isinstance(path, str):
+			argv.append(path)
+		else:
+			argv.extend(path)
+		return argv
+
+	def list_files_argv(self) -> list:
+		"""rg command line listing the files a search would read, up to (not including) the path."""
+		return [str(self.get("executable", "rg")), "--files"] + self._file_type_args() + self._ignore_args()
+
+	def _compile_search_argv(self, case_sensitive: bool) -> tuple:
+		argv = [str(self.get("executable", "rg")), "--json"]
+		if not case_sensitive:
+			argv.append("-i")
+
+		argv.append("-B" + str(self.get("before_context", 0)))
+		argv.append("-A" + str(self.get("after_context", 0)))
+		argv.extend(self._file_type_args())
+		argv.extend(self._ignore_args())
+		max_per_file = int(self.get("max_results_per_file", 0))
+		if max_per_file > 0:
+			# rg counts matching lines, the worker trims lines with several hits down to the cap
+			argv.append("--max-count=" + str(max_per_file))
+		argv.append("--column")
+		return tuple(argv)
+
+	def _file_type_args(self) -> list:
+		argv = []
+		for file_type in self.get("file_type_pattern", []):
+			argv.append("-t" + file_type)
+
+		non_std_file_types = self.get("non_std_file_type_pattern", [])
+		for file_type in non_std_file_types:
+			argv.append("--type-add")
+			argv.append("%s:*.%s" % (file_type, file_type))
+		for file_type in non_std_file_types:
+			argv.append("-t" + file_type)
+		return argv
+
+	def _ignore_args(self) -> list:
+		# with a trailing slash rg's gitignore style globs only match directories, which rg then
+		# doesn't descend into at all
+		argv = []
+		for pattern in ignore_folder_patterns(self.get("ignore_folders", [])):
+			argv.extend(("-g", "!" + pattern + "/"))
+		return argv
@@ -0,0 +1,100 @@
+import os
+import fnmatch
+import subprocess
+
+from .osutil import popen_kwargs
+
+# the longest command line make_file_shards builds. Windows limits one to 32767 characters,
+# elsewhere the limit is far higher but shared with the environment
+MAX_ARGV_CHARS = 24000 if os.name == "nt" else 128 * 1024
+
+#------------------------------------------------------------------------------
+class FastFindShard:
+	"""One rg invocation of a sharded search: a path plus any arguments limiting it.
+
+	With files set, only those files under path are searched instead of the whole path.
+	"""
+	__slots__ = ("path", "extra_args", "files")
+
+	def __init__(self, path: str, extra_args: tuple = (), files: list = None):
+		self.path = path
+		self.extra_args = extra_args
+		self.files = files
+
+	def search_paths(self):
+		if self.files is not None:
+			return self.files
+		return self.path
+
+	def describe(self) -> str:
+		if self.files is not None:
+			return "{0} ({1} files)".format(self.path, len(self.files))
+		if len(self.extra_args) > 0:
+			return "{0} ({1})".format(self.path, " ".join(self.extra_args))
+		return self.path
+
+
+#------------------------------------------------------------------------------
+def git_ignored_names(root: str, names: list) -> set:
+	"""Which of root's entries git ignores. rg searches ignored directories passed to it
+	explicitly, so they must not become shards of their own."""
+	if len(names) == 0 or not os.path.exists(os.path.join(root, ".git")):
+		return set()
+	try:
+		proc = subprocess.Popen(["git", "check-ignore", "--stdin"],
+			**popen_kwargs(cwd=root, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL))
+	except OSError:
+		return set()
+	output, _ = proc.communicate("\n".join(names).encode("utf8", "surrogateescape"))
+	return set(output.decode("utf8", "surrogateescape").splitlines())
+
+
+#------------------------------------------------------------------------------
+def make_search_shards(folders: list, split_top_level: bool = False, ignore_folders: list = ()) -> list:
+	"""Split a search over folders into shards, in the order their results are reported.
+
+	Every folder is one shard. With split_top_level, a folder is instead searched as one shard
+	for the files directly inside it plus one shard per visible top-level subdirectory, so a
+	single large root can be spread over several rg processes. Subdirectories matching one of
+	the ignore_folders globs get no shard, rg would search them when passed them explicitly.
+	"""
+	shards = []
+	for folder in folders:
+		if not split_top_level or not os.path.isdir(folder):
+			shards.append(FastFindShard(folder))
+			continue
+
+		try:
+			subdirectories = sorted(entry.name for entry in os.scandir(folder)
+				if entry.is_dir() and not entry.name.startswith("."))
+		except OSError:
+			shards.append(FastFindShard(folder))
+			continue
+
+		ignored = git_ignored_names(folder, subdirectories)
+		shards.append(FastFindShard(folder, ("--max-depth", "1")))
+		for name in subdirectories:
+			if name not in ignored and not any(fnmatch.fnmatch(name, pattern) for pattern in ignore_folders):
+				shards.append(FastFindShard(os.path.join(folder, name)))
+	return shards
+
+
+#------------------------------------------------------------------------------
+def make_file_shards(folder: str, files: list, max_argv_chars: int = MAX_ARGV_CHARS) -> list:
+	"""Split a list of files under folder into shards whose command lines stay short.
+
+	max_argv_chars leaves room for the rest of the rg arguments, see MAX_ARGV_CHARS.
+	"""
+	shards = []
+	chunk = []
+	chunk_chars = 0
+	for filename in files:
+		if len(chunk) > 0 and chunk_chars + len(filename) + 1 > max_argv_chars:
+			shards.append(FastFindShard(folder, files=chunk))
+			chunk = []
+			chunk_chars = 0
+		chunk.append(filename)
+		chunk_chars += len(filename) + 1
+	if len(chunk) > 0:
+		shards.append(FastFindShard(folder, files=chunk))
+	return shards
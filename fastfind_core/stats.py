@@ -0,0 +1,190 @@
+import os
+import json
+import math
+import time
+import threading
+from collections import deque
+
+#------------------------------------------------------------------------------
+# the phases of a search, in the order they happen, as (field, label)
+SEARCH_PHASES = (
+	("setup_ms", "setup"),
+	("queue_ms", "queue"),
+	("shard_ms", "shards"),
+	("spawn_ms", "spawn"),
+	("first_byte_ms", "first byte"),
+	("search_ms", "search"),
+	("parse_ms", "parse"),
+	("panel_ms", "panel"),
+	("total_ms", "total"),
+)
+
+#------------------------------------------------------------------------------
+class FastFindSearchStats:
+	"""Where the time of one search went, filled in by its worker and then the UI thread.
+
+	setup is the UI thread's work before the worker starts (settings snapshot, cache key),
+	queue the wait for the search scheduler to start it, shards the engine splitting the
+	search up (including an index lookup). For each process (or in-process scan): spawn is
+	starting it, first byte the wait for its first output, search the time until it exited
+	and parse the time spent turning its output into results. With several shards spawn and
+	parse add up, first byte is the earliest and search the longest. panel is showing the
+	final results, total is the worker's run time. The rg_* fields are ripgrep's own summary,
+	summed over its processes. A search that got its results from an identical one that was
+	already running (see FastFindScheduler) has that search's phases after queue.
+	"""
+	def __init__(self, search_term: str, engine: str, folders: list):
+		self._lock = threading.Lock()
+		self.search_term = search_term
+		self.engine = engine
+		self.folders = list(folders)
+		self.started = time.time()
+		self.setup_ms = 0.0
+		self.queue_ms = 0.0
+		self.shard_ms = 0.0
+		self.spawn_ms = 0.0
+		self.first_byte_ms = None
+		self.search_ms = 0.0
+		self.parse_ms = 0.0
+		self.panel_ms = 0.0
+		self.total_ms = 0.0
+		self.shards = 0
+		self.results = 0
+		self.truncated = False
+		self.cancelled = False
+		self.returncode = None
+		self.rg_elapsed_ms = None
+		self.rg_bytes_searched = None
+		self.rg_files_searched = None
+
+	def add_spawn(self, seconds: float) -> None:
+		with self._lock:
+			self.spawn_ms += seconds * 1000.0
+
+	def add_process(self, first_byte: float, search: float, parse: float, summary: dict = None) -> None:
+		with self._lock:
+			if first_byte is not None:
+				first_byte_ms = first_byte * 1000.0
+				if self.first_byte_ms is None or first_byte_ms < self.first_byte_ms:
+					self.first_byte_ms = first_byte_ms
+			self.search_ms = max(self.search_ms, search * 1000.0)
+			self.parse_ms += parse * 1000.0
+			if summary is not None:
+				self.rg_elapsed_ms = max(self.rg_elapsed_ms or 0.0, summary["elapsed"] * 1000.0)
+				self.rg_bytes_searched = (self.rg_bytes_searched or 0) + summary["bytes_searched"]
+				self.rg_files_searched = (self.rg_files_searched or 0) + summary["files_searched"]
+
+	def copy_run(self, other: "FastFindSearchStats") -> None:
+		"""Take the run's phases and counts from other, a search that ran for this one."""
+		with other._lock:
+			for field, _ in SEARCH_PHASES:
+				if field not in ("setup_ms", "queue_ms", "panel_ms"):
+					setattr(self, field, getattr(other, field))
+			for field in ("shards", "results", "truncated", "returncode",
+					"rg_elapsed_ms", "rg_bytes_searched", "rg_files_searched"):
+				setattr(self, field, getattr(other, field))
+
+	def to_dict(self) -> dict:
+		values = {
+			"started": self.started,
+			"search_term": self.search_term,
+			"engine": self.engine,
+			"folders": self.folders,
+			"shards": self.shards,
+			"results": self.results,
+			"truncated": self.truncated,
+			"cancelled": self.cancelled,
+			"returncode": self.returncode,
+			"rg_elapsed_ms": self.rg_elapsed_ms,
+			"rg_bytes_searched": self.rg_bytes_searched,
+			"rg_files_searched": self.rg_files_searched,
+		}
+		for field, _ in SEARCH_PHASES:
+			values[field] = getattr(self, field)
+		return values
+
+
+#------------------------------------------------------------------------------
+class FastFindStatsLog:
+	"""The stats of the most recent searches, optionally also appended to a JSON lines file."""
+	def __init__(self, max_entries: int = 200, export_filename: str = None):
+		self._entries = deque(maxlen=max(1, max_entries))
+		self._export_filename = export_filename
+		self._lock = threading.Lock()
+
+	def add(self, stats: FastFindSearchStats) -> None:
+		with self._lock:
+			self._entries.append(stats)
+			if self._export_filename is not None:
+				try:
+					with open(self._export_filename, "a", encoding="utf8") as export_file:
+						export_file.write(json.dumps(stats.to_dict()) + "\n")
+				except OSError as e:
+					print("[FastFind] Can't export search stats to '{0}': {1}".format(self._export_filename, e))
+
+	def entries(self) -> list:
+		"""The logged searches, oldest first."""
+		with self._lock:
+			return list(self._entries)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+
+
+#------------------------------------------------------------------------------
+def percentile(values: list, fraction: float) -> float:
+	"""The nearest-rank percentile of values, e.g. fraction 0.9 for the 90th."""
+	ordered = sorted(values)
+	rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+	return ordered[rank]
+
+
+def format_report(entries: list, recent: int = 50) -> str:
+	"""Render logged searches as text: percentiles of every phase, then the latest searches."""
+	if len(entries) == 0:
+		return "FastFind search stats\n\nNo searches recorded yet.\n"
+	completed = [stats for stats in entries if not stats.cancelled]
+	lines = ["FastFind search stats: {0} searches ({1} cancelled)".format(len(entries), len(entries) - len(completed)), ""]
+
+	lines.append("{0:<12}{1:>10}{2:>10}{3:>10}{4:>10}".format("phase (ms)", "p50", "p90", "p99", "max"))
+	for field, label in SEARCH_PHASES:
+		values = [getattr(stats, field) for stats in completed if getattr(stats, field) is not None]
+		if len(values) == 0:
+			continue
+		lines.append("{0:<12}{1:>10.1f}{2:>10.1f}{3:>10.1f}{4:>10.1f}".format(label,
+			percentile(values, 0.5), percentile(values, 0.9), percentile(values, 0.99), max(values)))
+	lines.append("")
+
+	header = "{0:<10}{1:<10}{2:>9}{3:>9}{4:>9}{5:>9}{6:>9}{7:>9}{8:>10}{9:>9}  {10}".format(
+		"time", "engine", "results", "total", "1st byte", "search", "parse", "panel", "rg MB", "rg files", "term")
+	lines.append("Latest searches")
+	lines.append(header)
+	for stats in reversed(entries[-recent:]):
+		results = "{0}{1}".format(stats.results, "+" if stats.truncated else "")
+		if stats.cancelled:
+			results = "cancel"
+		lines.append("{0:<10}{1:<10}{2:>9}{3:>9.1f}{4:>9}{5:>9.1f}{6:>9.1f}{7:>9.1f}{8:>10}{9:>9}  {10}".format(
+			time.strftime("%H:%M:%S", time.localtime(stats.started)),
+			stats.engine,
+			results,
+			stats.total_ms,
+			"-" if stats.first_byte_ms is None else "{0:.1f}".format(stats.first_byte_ms),
+			stats.search_ms,
+			stats.parse_ms,
+			stats.panel_ms,
+			"-" if stats.rg_bytes_searched is None else "{0:.1f}".format(stats.rg_bytes_searched / (1024.0 * 1024.0)),
+			"-" if stats.rg_files_searched is None else stats.rg_files_searched,
+			stats.search_term))
+	return "\n".join(lines) + "\n"
+
+
+def stats_export_filename(filename: str, default_dir: str) -> str:
+	"""Where to export stats to: filename itself when absolute, otherwise under default_dir."""
+	if filename is None or filename == "":
+		return None
+	filename = os.path.expanduser(os.path.expandvars(filename))
+	if not os.path.isabs(filename):
+		filename = os.path.join(default_dir, filename)
+	os.makedirs(os.path.dirname(filename), exist_ok=True)
+	return filename
@@ -0,0 +1,45 @@
+import unittest
+
+from fastfind_core.batch import split_results_by_term
+from fastfind_core.results import FastFindResultSet
+
+
+def rows(results: FastFindResultSet) -> list:
+	return [(result.filename, result.line_number, result.start_char_index, result.match_length) for result in results]
+
+
+class SplitResultsByTermTest(unittest.TestCase):
+	def setUp(self):
+		self.results = FastFindResultSet()
+		self.results.append("a.c", 1, 4, 7, "int foo_bar;")
+		self.results.append("a.c", 2, 0, 3, "baz();")
+		self.results.append("b.c", 3, 2, 3, "  FOO")
+
+	def test_each_hit_goes_to_its_term(self):
+		split = split_results_by_term(self.results, ("foo", "foo_bar", "baz"), True)
+		self.assertEqual(rows(split["foo_bar"]), [("a.c", 1, 4, 7)])
+		self.assertEqual(rows(split["baz"]), [("a.c", 2, 0, 3)])
+
+	def test_overlapping_terms_share_a_hit_with_their_own_lengths(self):
+		split = split_results_by_term(self.results, ("foo", "foo_bar", "baz"), False)
+		self.assertEqual(rows(split["foo"]), [("a.c", 1, 4, 3), ("b.c", 3, 2, 3)])
+		self.assertEqual(rows(split["foo_bar"]), [("a.c", 1, 4, 7)])
+		self.assertEqual(rows(split["baz"]), [("a.c", 2, 0, 3)])
+
+	def test_case_sensitive_leaves_unmatched_hits_to_the_first_term(self):
+		split = split_results_by_term(self.results, ("foo", "baz"), True)
+		self.assertEqual(rows(split["foo"]), [("a.c", 1, 4, 3), ("b.c", 3, 2, 3)])
+		self.assertEqual(rows(split["baz"]), [("a.c", 2, 0, 3)])
+
+	def test_unmatched_hits_go_to_the_term_re_cannot_compile(self):
+		split = split_results_by_term(self.results, ("baz", "(?<name>FOO)"), True)
+		self.assertEqual(rows(split["baz"]), [("a.c", 2, 0, 3)])
+		self.assertEqual(rows(split["(?<name>FOO)"]), [("a.c", 1, 4, 7), ("b.c", 3, 2, 3)])
+
+	def test_every_term_gets_a_set(self):
+		split = split_results_by_term(self.results, ("baz", "missing"), True)
+		self.assertEqual(len(split["missing"]), 0)
+
+
+if __name__ == "__main__":
+	unittest.main()
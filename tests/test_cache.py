@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fastfind_core.cache import FastFindResultCache
+from fastfind_core.results import FastFindResultSet
+
+
+class ResultCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = os.path.realpath(tempfile.mkdtemp())
+		self.addCleanup(shutil.rmtree, self.folder)
+		os.makedirs(os.path.join(self.folder, "src", "deep"))
+		os.makedirs(os.path.join(self.folder, "docs"))
+		self.hit = self._write(os.path.join("src", "deep", "hit.c"), "foo")
+		self.other = self._write(os.path.join("docs", "other.txt"), "bar")
+		self.cache = FastFindResultCache(max_entries=2)
+		self.key = self._key("foo")
+		results = FastFindResultSet()
+		results.append(self.hit, 1, 0, 3, "foo")
+		self.cached = self.cache.put(self.key, results)
+
+	def _write(self, name: str, text: str) -> str:
+		filename = os.path.join(self.folder, name)
+		with open(filename, "w") as test_file:
+			test_file.write(text)
+		return filename
+
+	def _key(self, search_term: str) -> tuple:
+		return FastFindResultCache.make_key(search_term, [self.folder], True, [], [], 0, 0)
+
+	def _touch(self, path: str) -> None:
+		mtime_ns = os.stat(path).st_mtime_ns + 10 ** 9
+		os.utime(path, ns=(mtime_ns, mtime_ns))
+
+	def test_snapshot_covers_hits_their_directories_and_the_folder(self):
+		self.assertEqual(set(self.cached.mtimes), {self.folder, os.path.join(self.folder, "src"),
+			os.path.join(self.folder, "src", "deep"), self.hit})
+
+	def test_fresh_until_a_recorded_mtime_changes(self):
+		self.assertIs(self.cache.get(self.key), self.cached)
+		self.assertFalse(self.cache.is_stale(self.cached))
+		self._touch(self.other)
+		self.assertFalse(self.cache.is_stale(self.cached))
+		self._touch(self.hit)
+		self.assertTrue(self.cache.is_stale(self.cached))
+
+	def test_stale_when_a_file_is_added_next_to_a_hit(self):
+		self._write(os.path.join("src", "deep", "new.c"), "foo")
+		self.assertTrue(self.cache.is_stale(self.cached))
+
+	def test_stale_when_a_hit_is_deleted(self):
+		os.remove(self.hit)
+		self.assertTrue(self.cache.is_stale(self.cached))
+
+	def test_relative_filenames_resolve_against_the_folder(self):
+		results = FastFindResultSet()
+		results.append(os.path.join("src", "deep", "hit.c"), 1, 0, 3, "foo")
+		mtimes = FastFindResultCache.snapshot((self.folder,), results)
+		self.assertIn(self.hit, mtimes)
+
+	def test_least_recently_used_entry_is_dropped(self):
+		self.cache.put(self._key("bar"), FastFindResultSet())
+		self.cache.get(self.key)
+		self.cache.put(self._key("baz"), FastFindResultSet())
+		self.assertIsNotNone(self.cache.get(self.key))
+		self.assertIsNone(self.cache.get(self._key("bar")))
+
+	def test_discard_folder_of(self):
+		self.assertEqual(self.cache.discard_folder_of(os.path.join(self.folder, "elsewhere.c")), 1)
+		self.assertIsNone(self.cache.get(self.key))
+
+	def test_sibling_folder_with_the_same_prefix_is_not_inside(self):
+		sibling = self.folder + "-sibling"
+		os.makedirs(os.path.join(sibling, "sub"))
+		self.addCleanup(shutil.rmtree, sibling)
+		self.assertEqual(self.cache.discard_folder_of(os.path.join(sibling, "sub", "x.c")), 0)
+		self.assertIsNotNone(self.cache.get(self.key))
+		results = FastFindResultSet()
+		results.append(os.path.join(sibling, "sub", "x.c"), 1, 0, 3, "foo")
+		mtimes = FastFindResultCache.snapshot((self.folder,), results)
+		self.assertNotIn(os.path.join(sibling, "sub"), mtimes)
+		self.assertNotIn(sibling, mtimes)
+
+
+if __name__ == "__main__":
+	unittest.main()
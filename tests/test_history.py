@@ -0,0 +1,170 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from fastfind_core import history
+from fastfind_core.history import HISTORY_MAGIC, FastFindHistoryStore
+from fastfind_core.results import FastFindResult, FastFindResultSet
+
+
+def make_results(count: int, filename: str = "a.c") -> FastFindResultSet:
+	results = FastFindResultSet()
+	for line_number in range(1, count + 1):
+		results.append(filename, line_number, 0, 3, "foo")
+	return results
+
+
+class HistoryStoreTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.folder)
+		self.filename = os.path.join(self.folder, "history")
+
+	def test_replay(self):
+		store = FastFindHistoryStore(self.filename)
+		store["foo"] = make_results(2)
+		store["bar"] = make_results(3)
+		store["foo"] = make_results(4)
+		store["gone"] = make_results(1)
+		del store["gone"]
+		replayed = FastFindHistoryStore(self.filename)
+		self.assertEqual(replayed.keys(), ["bar", "foo"])
+		self.assertEqual(replayed["foo"], make_results(4))
+		self.assertEqual(replayed.result_count("bar"), 3)
+
+	def test_other_store_sees_appends(self):
+		store = FastFindHistoryStore(self.filename)
+		other = FastFindHistoryStore(self.filename)
+		store["foo"] = make_results(2)
+		self.assertIn("foo", other)
+		self.assertEqual(other["foo"], make_results(2))
+
+	def test_lookup_reorders_without_writing(self):
+		store = FastFindHistoryStore(self.filename)
+		store["foo"] = make_results(1)
+		store["bar"] = make_results(1)
+		size = os.path.getsize(self.filename)
+		store["foo"]
+		self.assertEqual(os.path.getsize(self.filename), size)
+		self.assertEqual(store.keys(), ["bar", "foo"])
+		self.assertEqual(FastFindHistoryStore(self.filename).keys(), ["foo", "bar"])
+		# the lookup is written along with the next record
+		store["baz"] = make_results(1)
+		self.assertEqual(FastFindHistoryStore(self.filename).keys(), ["bar", "foo", "baz"])
+
+	def test_evicts_least_recently_used(self):
+		store = FastFindHistoryStore(self.filename, max_entries=2)
+		store["a"] = make_results(1)
+		store["b"] = make_results(1)
+		store["a"]
+		store["c"] = make_results(1)
+		self.assertEqual(store.keys(), ["a", "c"])
+		self.assertEqual(FastFindHistoryStore(self.filename, max_entries=2).keys(), ["a", "c"])
+
+	def test_evicts_over_max_bytes_but_keeps_the_newest(self):
+		payload_size = len(make_results(100).to_bytes())
+		store = FastFindHistoryStore(self.filename, max_bytes=payload_size * 2)
+		for search_term in ("a", "b", "c"):
+			store[search_term] = make_results(100)
+		self.assertEqual(store.keys(), ["b", "c"])
+		store["huge"] = make_results(1000)
+		self.assertEqual(store.keys(), ["huge"])
+
+	def test_compact_keeps_live_entries_in_order(self):
+		store = FastFindHistoryStore(self.filename)
+		for _ in range(5):
+			store["foo"] = make_results(50)
+		store["bar"] = make_results(2)
+		store["foo"]
+		size = os.path.getsize(self.filename)
+		store.compact()
+		self.assertLess(os.path.getsize(self.filename), size)
+		compacted = FastFindHistoryStore(self.filename)
+		self.assertEqual(compacted.keys(), ["bar", "foo"])
+		self.assertEqual(compacted["foo"], make_results(50))
+
+	def test_compacts_once_dead_records_outweigh_live_ones(self):
+		with mock.patch.object(history, "COMPACT_MIN_DEAD_BYTES", 1024):
+			store = FastFindHistoryStore(self.filename)
+			for _ in range(20):
+				store["foo"] = make_results(50)
+		self.assertLess(os.path.getsize(self.filename), 2 * len(make_results(50).to_bytes()) + 1024)
+		self.assertEqual(FastFindHistoryStore(self.filename)["foo"], make_results(50))
+
+	def test_torn_tail_record_is_ignored_and_overwritten(self):
+		store = FastFindHistoryStore(self.filename)
+		store["foo"] = make_results(2)
+		store["torn"] = make_results(3)
+		with open(self.filename, "r+b") as history_file:
+			history_file.truncate(os.path.getsize(self.filename) - 5)
+		recovered = FastFindHistoryStore(self.filename)
+		self.assertEqual(recovered.keys(), ["foo"])
+		recovered["bar"] = make_results(1)
+		replayed = FastFindHistoryStore(self.filename)
+		self.assertEqual(replayed.keys(), ["foo", "bar"])
+		self.assertEqual(replayed["bar"], make_results(1))
+
+	def test_long_search_term(self):
+		store = FastFindHistoryStore(self.filename)
+		search_term = "x" * 70000
+		store[search_term] = make_results(1)
+		self.assertEqual(FastFindHistoryStore(self.filename).keys(), [search_term])
+
+	def test_clear(self):
+		store = FastFindHistoryStore(self.filename)
+		store["foo"] = make_results(1)
+		store.clear()
+		self.assertEqual(len(FastFindHistoryStore(self.filename)), 0)
+		with open(self.filename, "rb") as history_file:
+			self.assertEqual(history_file.read(), HISTORY_MAGIC)
+
+	def test_in_memory_store(self):
+		store = FastFindHistoryStore(None, max_entries=1)
+		store["foo"] = make_results(1)
+		store["bar"] = make_results(2)
+		self.assertEqual(store.keys(), ["bar"])
+		self.assertEqual(store["bar"], make_results(2))
+
+
+class HistoryPickleMigrationTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.folder)
+		self.filename = os.path.join(self.folder, "history")
+
+	def _write_pickle(self, search_history) -> None:
+		with open(self.filename, "wb") as history_file:
+			pickle.dump(search_history, history_file)
+
+	def test_migrates_result_lists_and_sets(self):
+		self._write_pickle({
+			"foo": [FastFindResult("a.c", 1, 0, 3), FastFindResult("b.c", 2, 4, 3)],
+			"bar": make_results(2),
+			3: make_results(1),
+			"broken": 42,
+		})
+		store = FastFindHistoryStore(self.filename)
+		self.assertEqual(store.keys(), ["foo", "bar"])
+		self.assertEqual([(result.filename, result.line_number) for result in store["foo"]], [("a.c", 1), ("b.c", 2)])
+		self.assertEqual(store["bar"], make_results(2))
+		with open(self.filename, "rb") as history_file:
+			self.assertEqual(history_file.read(len(HISTORY_MAGIC)), HISTORY_MAGIC)
+
+	def test_discards_what_isnt_a_history(self):
+		self._write_pickle(["not", "a", "dict"])
+		self.assertEqual(len(FastFindHistoryStore(self.filename)), 0)
+
+	def test_discards_garbage(self):
+		with open(self.filename, "wb") as history_file:
+			history_file.write(b"\x00garbage")
+		store = FastFindHistoryStore(self.filename)
+		self.assertEqual(len(store), 0)
+		store["foo"] = make_results(1)
+		self.assertEqual(FastFindHistoryStore(self.filename).keys(), ["foo"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fastfind_core.index import FastFindTrigramIndex, query_trigrams
+
+
+class QueryTrigramsTest(unittest.TestCase):
+	def test_plain_literal(self):
+		self.assertEqual(query_trigrams("needle", True), {b"nee", b"eed", b"edl", b"dle"})
+
+	def test_case_insensitive_lowercases(self):
+		self.assertEqual(query_trigrams("ABCD", False), {b"abc", b"bcd"})
+
+	def test_short_term_requires_nothing(self):
+		self.assertIsNone(query_trigrams("ab", True))
+
+	def test_counted_repetition_digits_are_not_literals(self):
+		self.assertIsNone(query_trigrams("[0-9]{2,4}", True))
+		self.assertIsNone(query_trigrams("x{100}", True))
+		self.assertEqual(query_trigrams("foo{2}bar", True), {b"bar"})
+		self.assertEqual(query_trigrams("abcd{0,3}", True), {b"abc"})
+
+	def test_unclosed_counted_repetition(self):
+		self.assertEqual(query_trigrams("abcde{12", True), {b"abc", b"bcd"})
+
+	def test_optional_suffix_drops_previous_char(self):
+		self.assertEqual(query_trigrams("abcd?", True), {b"abc"})
+		self.assertEqual(query_trigrams("abcd*", True), {b"abc"})
+		self.assertEqual(query_trigrams("abcd+", True), {b"abc", b"bcd"})
+
+	def test_escapes_split_literals(self):
+		self.assertEqual(query_trigrams(r"foo\.bar", True), {b"foo", b"bar"})
+		self.assertEqual(query_trigrams(r"ab\wcd", True), None)
+		self.assertEqual(query_trigrams(r"abc\d{3}", True), {b"abc"})
+
+	def test_classes_and_groups_are_skipped(self):
+		self.assertEqual(query_trigrams("foo[xyz]bar", True), {b"foo", b"bar"})
+		self.assertEqual(query_trigrams(r"foo[\]abc]bar", True), {b"foo", b"bar"})
+		self.assertEqual(query_trigrams("foo(abc)?bar", True), {b"foo", b"bar"})
+
+	def test_alternation_requires_nothing(self):
+		self.assertIsNone(query_trigrams("foo|bar", True))
+		self.assertIsNone(query_trigrams("(foo|bar)baz", True))
+
+	def test_whitespace_trigrams_are_skipped(self):
+		self.assertEqual(query_trigrams("ab cd", True), None)
+		self.assertEqual(query_trigrams("abc def", True), {b"abc", b"def"})
+
+	def test_non_ascii_skipped_without_case_sensitivity(self):
+		self.assertEqual(query_trigrams("cafés", True), {b"caf", b"af\xc3", b"f\xc3\xa9", b"\xc3\xa9s"})
+		self.assertEqual(query_trigrams("cafés", False), {b"caf"})
+
+
+@unittest.skipIf(shutil.which("rg") is None, "needs rg to list the files")
+class TrigramIndexRescanTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.folder)
+		self._write("kept.txt", "alpha beta")
+		self._write("changed.txt", "alpha gamma")
+		self._write("removed.txt", "alpha delta")
+		index_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, index_dir)
+		self.index = FastFindTrigramIndex(self.folder, os.path.join(index_dir, "test.trigrams"), ["rg", "--files"])
+		self.index.build()
+
+	def _write(self, name: str, text: str, mtime_ns: int = None) -> str:
+		filename = os.path.join(self.folder, name)
+		with open(filename, "w") as test_file:
+			test_file.write(text)
+		if mtime_ns is not None:
+			os.utime(filename, ns=(mtime_ns, mtime_ns))
+		return filename
+
+	def _candidates(self, search_term: str) -> list:
+		return [os.path.basename(filename) for filename in self.index.candidates(search_term, True)]
+
+	def test_rescan_picks_up_changes(self):
+		self._write("changed.txt", "alpha epsilon", mtime_ns=10 ** 18)
+		os.remove(os.path.join(self.folder, "removed.txt"))
+		self._write("added.txt", "gamma")
+		self.assertEqual(self.index.rescan(), 3)
+		self.assertEqual(self._candidates("alpha"), ["changed.txt", "kept.txt"])
+		self.assertEqual(self._candidates("gamma"), ["added.txt"])
+		self.assertEqual(self._candidates("epsilon"), ["changed.txt"])
+		self.assertEqual(self.index.rescan(), 0)
+
+	def test_rescan_after_update_file(self):
+		filename = self._write("changed.txt", "alpha epsilon", mtime_ns=10 ** 18)
+		self.index.update_file(filename)
+		self.assertEqual(self._candidates("epsilon"), ["changed.txt"])
+		self.assertEqual(self.index.rescan(), 0)
+
+	def test_saved_index_loads(self):
+		loaded = FastFindTrigramIndex(self.folder, self.index._index_filename, ["rg", "--files"])
+		self.assertTrue(loaded.load())
+		self.assertEqual(len(loaded), 3)
+		self.assertEqual(loaded.rescan(), 0)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,44 @@
+import re
+import unittest
+
+from fastfind_core.render import RESULT_FILE_REGEX, RESULT_LINE_REGEX, FastFindResultsRenderer, format_line_number
+from fastfind_core.results import FastFindResultSet
+
+
+def render(results: FastFindResultSet) -> tuple:
+	renderer = FastFindResultsRenderer()
+	renderer.add_results(results)
+	renderer.finish()
+	chunks = renderer.take_chunks()
+	return "".join(chunk.text for chunk in chunks), [match for chunk in chunks for match in chunk.matches]
+
+
+class ResultsRendererTest(unittest.TestCase):
+	def test_format_line_number(self):
+		self.assertEqual(format_line_number(7), "     7")
+		self.assertEqual(format_line_number(12345), " 12345")
+		self.assertEqual(format_line_number(123456), " 123456")
+		self.assertEqual(format_line_number(12345678), " 12345678")
+
+	def test_matches_are_marked_whatever_the_line_number_width(self):
+		results = FastFindResultSet()
+		for line_number in (3, 99999, 100000, 1234567, 12345678):
+			results.append("a.c", line_number, 4, 3, "int foo = foo;")
+			results.append("a.c", line_number, 10, 3, "int foo = foo;")
+		text, matches = render(results)
+		self.assertEqual(len(matches), 10)
+		self.assertEqual({text[begin:end] for begin, end in matches}, {"foo"})
+
+	def test_lines_stay_recognisable(self):
+		results = FastFindResultSet()
+		results.append("a.c", 5, 0, 3, "foo:")
+		results.append("a.c", 123456789, 0, 3, "foo:")
+		text, _ = render(results)
+		lines = text.splitlines()[1:]
+		self.assertRegex(lines[0], RESULT_FILE_REGEX)
+		self.assertEqual([re.match(RESULT_LINE_REGEX, line).group(1) for line in lines[1:]], ["5", "123456789"])
+		self.assertFalse(any(re.match(RESULT_FILE_REGEX, line) for line in lines[1:]))
+
+
+if __name__ == "__main__":
+	unittest.main()
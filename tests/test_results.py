@@ -0,0 +1,89 @@
+import base64
+import unittest
+
+from fastfind_core.results import FastFindResultSet, parse_match_record
+
+
+def match_record(path: dict, lines: dict, submatches: list, line_number: int = 7) -> dict:
+	return {"path": path, "lines": lines, "line_number": line_number, "absolute_offset": 0,
+		"submatches": [{"match": {"text": ""}, "start": start, "end": end} for start, end in submatches]}
+
+
+class ResultSetBytesTest(unittest.TestCase):
+	def test_round_trip(self):
+		results = FastFindResultSet()
+		results.append("src/a.c", 1, 4, 3, "int foo;")
+		results.append("src/b.c", 20, 0, 3, "foo();")
+		results.append("src/a.c", 300000, 2, 5, "  foo_bar")
+		restored = FastFindResultSet.from_bytes(results.to_bytes())
+		self.assertEqual(restored, results)
+		self.assertEqual(restored.filenames(), ["src/a.c", "src/b.c"])
+		self.assertEqual(restored[2].line_text, "  foo_bar")
+
+	def test_round_trip_without_line_texts(self):
+		results = FastFindResultSet()
+		results.append("a.c", 1, 0, 1)
+		results.append("b.c", 2, 0, 1)
+		data = results.to_bytes()
+		restored = FastFindResultSet.from_bytes(data)
+		self.assertEqual(restored, results)
+		self.assertEqual([result.line_text for result in restored], ["", ""])
+
+	def test_round_trip_empty(self):
+		restored = FastFindResultSet.from_bytes(FastFindResultSet().to_bytes())
+		self.assertEqual(len(restored), 0)
+		self.assertEqual(restored.filenames(), [])
+
+	def test_round_trip_non_ascii(self):
+		results = FastFindResultSet()
+		results.append("dossier/été.c", 3, 1, 2, "l'été \udcff")
+		restored = FastFindResultSet.from_bytes(results.to_bytes())
+		self.assertEqual(restored, results)
+		self.assertEqual(restored.filename(0), "dossier/été.c")
+
+
+class ParseMatchRecordTest(unittest.TestCase):
+	def test_ascii_text(self):
+		results = FastFindResultSet()
+		added = parse_match_record(match_record({"text": "a.c"}, {"text": "int foo = foo;\n"}, [(4, 7), (10, 13)]), results)
+		self.assertEqual(added, 2)
+		self.assertEqual([(result.start_char_index, result.match_length) for result in results], [(4, 3), (10, 3)])
+		self.assertEqual(results[0].line_text, "int foo = foo;")
+		self.assertEqual(results[0].line_number, 7)
+
+	def test_non_ascii_text_uses_character_offsets(self):
+		results = FastFindResultSet()
+		# "é" is two bytes, so "foo" starts at byte 8 but character 7
+		parse_match_record(match_record({"text": "a.c"}, {"text": "café = foo\n"}, [(8, 11)]), results)
+		self.assertEqual((results[0].start_char_index, results[0].match_length), (7, 3))
+		results = FastFindResultSet()
+		parse_match_record(match_record({"text": "a.c"}, {"text": "x = été\n"}, [(4, 9)]), results)
+		self.assertEqual((results[0].start_char_index, results[0].match_length), (4, 3))
+
+	def test_base64_bytes_fields(self):
+		path = b"dir/\xff.c"
+		line = b"\xe9t\xe9 = foo\n"
+		record = match_record({"bytes": base64.b64encode(path).decode("ascii")},
+			{"bytes": base64.b64encode(line).decode("ascii")}, [(6, 9)])
+		results = FastFindResultSet()
+		parse_match_record(record, results)
+		self.assertEqual(results[0].filename, "dir/\udcff.c")
+		# the line isn't UTF-8, each invalid byte becomes one replacement character
+		self.assertEqual((results[0].start_char_index, results[0].match_length), (6, 3))
+		self.assertEqual(results[0].line_text, "�t� = foo")
+
+	def test_base64_utf8_line(self):
+		line = "ça = foo\n".encode("utf8")
+		record = match_record({"text": "a.c"}, {"bytes": base64.b64encode(line).decode("ascii")}, [(6, 9)])
+		results = FastFindResultSet()
+		parse_match_record(record, results)
+		self.assertEqual((results[0].start_char_index, results[0].match_length), (5, 3))
+
+	def test_no_submatches(self):
+		results = FastFindResultSet()
+		self.assertEqual(parse_match_record(match_record({"text": "a.c"}, {"text": "foo\n"}, []), results), 1)
+		self.assertEqual((results[0].start_char_index, results[0].match_length), (0, 0))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,125 @@
+import threading
+import unittest
+from types import SimpleNamespace
+
+from fastfind_core.cancel import FastFindCancelToken
+from fastfind_core.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_LIVE, FastFindScheduler
+
+
+class FakeSearch:
+	"""Has what FastFindScheduler needs of a search, and records what it did."""
+	def __init__(self, symbol: str, log: list, gate: threading.Event = None):
+		self._symbol = symbol
+		self._log = log
+		self._gate = gate
+		self._cancel_token = FastFindCancelToken()
+		self._stats = SimpleNamespace(queue_ms=0.0)
+		self.search_token = None
+		self.adopted = None
+		self.done = threading.Event()
+
+	def share_search_token(self, search_token: FastFindCancelToken) -> None:
+		self.search_token = search_token
+
+	def run(self) -> None:
+		self._log.append(self._symbol)
+		if self._gate is not None:
+			self._gate.wait(5)
+		self.finish()
+
+	def adopt(self, other: "FakeSearch") -> None:
+		self.adopted = other
+
+	def finish(self) -> None:
+		self.done.set()
+
+
+class SchedulerTest(unittest.TestCase):
+	def setUp(self):
+		self.log = []
+		self.gate = threading.Event()
+		self.addCleanup(self.gate.set)
+		self.scheduler = FastFindScheduler(max_running=1)
+
+	def _block(self) -> FakeSearch:
+		# keeps the only slot busy until the gate opens, so everything after it queues
+		blocker = FakeSearch("blocker", self.log, self.gate)
+		self.scheduler.submit(blocker)
+		return blocker
+
+	def _wait(self, *searches) -> None:
+		for search in searches:
+			self.assertTrue(search.done.wait(5), search._symbol + " never finished")
+
+	def test_priority_then_submission_order(self):
+		blocker = self._block()
+		searches = [
+			(FakeSearch("background", self.log), PRIORITY_BACKGROUND),
+			(FakeSearch("live", self.log), PRIORITY_LIVE),
+			(FakeSearch("interactive 1", self.log), PRIORITY_INTERACTIVE),
+			(FakeSearch("interactive 2", self.log), PRIORITY_INTERACTIVE),
+		]
+		for search, priority in searches:
+			self.scheduler.submit(search, priority)
+		self.assertEqual(self.scheduler.status()[:2], (1, 4))
+		self.gate.set()
+		self._wait(blocker, *(search for search, _ in searches))
+		self.assertEqual(self.log, ["blocker", "interactive 1", "interactive 2", "live", "background"])
+
+	def test_background_leaves_a_slot_for_interactive(self):
+		scheduler = FastFindScheduler(max_running=2)
+		background = [FakeSearch("background %d" % number, self.log, self.gate) for number in range(2)]
+		for search in background:
+			scheduler.submit(search, PRIORITY_BACKGROUND)
+		self.assertEqual(scheduler.status()[:2], (1, 1))
+		interactive = FakeSearch("interactive", self.log)
+		scheduler.submit(interactive, PRIORITY_INTERACTIVE)
+		self._wait(interactive)
+		self.gate.set()
+		self._wait(*background)
+
+	def test_same_key_runs_once(self):
+		blocker = self._block()
+		first = FakeSearch("foo", self.log)
+		second = FakeSearch("foo", self.log)
+		self.scheduler.submit(first, key=("foo",))
+		self.scheduler.submit(second, key=("foo",))
+		self.assertIs(first.search_token, self.scheduler._by_key[("foo",)].search_token)
+		self.assertIsNone(second.search_token)
+		self.gate.set()
+		self._wait(blocker, first, second)
+		self.assertEqual(self.log, ["blocker", "foo"])
+		self.assertIs(second.adopted, first)
+
+	def test_joining_raises_the_shared_priority(self):
+		blocker = self._block()
+		self.scheduler.submit(FakeSearch("live", self.log), PRIORITY_LIVE)
+		shared = FakeSearch("shared", self.log)
+		self.scheduler.submit(shared, PRIORITY_BACKGROUND, key=("shared",))
+		joined = FakeSearch("shared", self.log)
+		self.scheduler.submit(joined, PRIORITY_INTERACTIVE, key=("shared",))
+		self.gate.set()
+		self._wait(blocker, shared, joined)
+		self.assertEqual(self.log[:3], ["blocker", "shared", "live"])
+
+	def test_shared_run_is_cancelled_only_when_every_caller_is(self):
+		blocker = self._block()
+		first = FakeSearch("foo", self.log)
+		second = FakeSearch("foo", self.log)
+		self.scheduler.submit(first, key=("foo",))
+		self.scheduler.submit(second, key=("foo",))
+		first._cancel_token.cancel()
+		self.assertFalse(first.search_token.cancelled)
+		second._cancel_token.cancel()
+		self.assertTrue(first.search_token.cancelled)
+		# a cancelled run isn't joined, an identical search runs on its own
+		third = FakeSearch("foo", self.log)
+		self.scheduler.submit(third, key=("foo",))
+		self.assertIsNot(third.search_token, first.search_token)
+		self.gate.set()
+		self._wait(blocker, first, second, third)
+		self.assertIsNone(third.adopted)
+
+
+if __name__ == "__main__":
+	unittest.main()